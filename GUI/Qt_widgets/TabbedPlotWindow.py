@@ -1,7 +1,25 @@
 # -*- coding: utf-8 -*-
 """
+Plot widgets for tabbed windows
+
+The plotters are the pages of a plot window.  Each has its plots in a dict
+'axes' and the same methods for live data, whatever draws them::
+  plotter.add_subplots(rows, columns, titles)  or  add_axes(bounds, titles)
+  plotter.curve(i, name, y, x=None, log=False) - make or update a curve
+  plotter.histogram(i, values, bins=21)        - make or update a histogram
+  plotter.legend(i)
+  plotter.draw()                                - after a round of updates
+  plotter.snapshot(filename)                    - matplotlib image file
+Curves are updated in place, not re-plotted.  MPLplotter draws with
+matplotlib; PGplotter, if pyqtgraph is installed, draws with pyqtgraph,
+which is fast enough for many live spectra and makes its snapshots with
+matplotlib.  PLOT_BACKENDS has the plotter classes which can be used.
+
+WaterfallPlotter shows the history of spectra as waterfalls; see class
+Waterfall.
 """
 from PyQt4 import QtGui, QtCore
+import numpy
 import sys
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt4agg import NavigationToolbar2QTAgg as NavigationToolbar
@@ -11,11 +29,118 @@ from random import random
 
 import logging
 
+try:
+  from importlib.util import find_spec
+except ImportError:
+  # Python 2
+  from pkgutil import find_loader as find_spec
+
+# pyqtgraph is imported by the first PGplotter
+pyqtgraph = None
+
 logging.basicConfig(level=logging.WARNING)
 module_logger = logging.getLogger(__name__)
 module_logger.setLevel(logging.DEBUG)
 
-class MPLplotter(QtGui.QWidget):
+COLORS = ['b', 'g', 'r', 'c', 'm', 'y', 'k']
+
+def _add_mpl_axes(fig, spec):
+  """
+  Add matplotlib axes to a figure
+
+  @param spec : ('subplot', rows, columns, number) or ('axes', bounds)
+  @type  spec : tuple
+  """
+  if spec[0] == 'subplot':
+    return fig.add_subplot(*spec[1:])
+  llx, lly, urx, ury = spec[1]
+  return fig.add_axes([llx, lly, urx-llx, ury-lly])
+
+def _grid_cells(bounds):
+  """
+  Grid (row, column, rows, columns) of axes given by their bounds
+
+  The grid lines are at the distinct edges of the axes, the first row at the
+  top.
+
+  @param bounds : [[llx,lly,urx,ury], [...]] in figure fractions
+  @type  bounds : list of lists of float
+  """
+  xs = sorted(set([b[0] for b in bounds] + [b[2] for b in bounds]))
+  ys = sorted(set([b[1] for b in bounds] + [b[3] for b in bounds]),
+              reverse=True)
+  cells = []
+  for llx, lly, urx, ury in bounds:
+    row, column = ys.index(ury), xs.index(llx)
+    cells.append((row, column, ys.index(lly) - row, xs.index(urx) - column))
+  return cells
+
+class Plotter(object):
+  """
+  Layout and histogram methods common to the plotters
+
+  A plotter provides _make_axes(index, spec, title) and curve(); see the
+  module description.
+  """
+  def _init_plotter(self):
+    self.axes = {}
+    self.titles = []
+    self._layout = {}
+    self._curves = {}
+
+  def add_subplots(self, rows=1, columns=1, titles=[]):
+    """
+    Make a regular array of plots, numbered by rows
+
+    @param rows : number of rows of plots
+    @type  rows : int
+
+    @param columns : number of columns of plots
+    @type  columns : int
+
+    @param titles : plot titles
+    @type  titles : list of str
+
+    @return: the plotter
+    """
+    self.titles = titles
+    for i in range(rows*columns):
+      self._layout[i] = ('subplot', rows, columns, i+1)
+      self._make_axes(i, self._layout[i], titles[i] if i < len(titles) else "")
+    return self
+
+  def add_axes(self, bounds=[[0.1,0.1,0.9,0.9]], titles=[]):
+    """
+    Make plots at arbitrary places
+
+    @param bounds : [[llx,lly,urx,ury], [...]] in figure fractions
+    @type  bounds : list of lists of float
+
+    @param titles : plot titles
+    @type  titles : list of str
+
+    @return: the plotter
+    """
+    self.titles = titles
+    for i in range(len(bounds)):
+      self._layout[i] = ('axes', bounds[i])
+      self._make_axes(i, self._layout[i], titles[i] if i < len(titles) else "")
+    return self
+
+  def histogram(self, index, values, bins=21, name="histogram"):
+    """
+    Make or update a histogram, drawn as steps
+
+    @param index : plot number
+    @type  index : int
+
+    @param values : data to be binned
+    @type  values : numpy.ndarray
+    """
+    counts, edges = numpy.histogram(values, bins=bins)
+    return self.curve(index, name, counts, x=edges, steps=True)
+
+class MPLplotter(QtGui.QWidget, Plotter):
   """
   This creates a plotting area with a MPL toolbar.
 
@@ -23,8 +148,10 @@ class MPLplotter(QtGui.QWidget):
   toolbar belongs to the canvas.
 
   Public attributes::
+    axes   - matplotlib Axes by number
     fig -    a Figure() instance
     canvas - a FigureCanvas() instance
+    titles - plot titles
   """
   def __init__(self):
     """
@@ -33,6 +160,7 @@ class MPLplotter(QtGui.QWidget):
     It lays out the canvas and the toolbar
     """
     super(MPLplotter,self).__init__()
+    self._init_plotter()
     self.fig = Figure()
     self.fig.hold(False)
     self.canvas = MPLcanvas(self.fig, self)
@@ -42,6 +170,79 @@ class MPLplotter(QtGui.QWidget):
     self.setLayout(vlayout)
     self.canvas.show()
 
+  def _make_axes(self, index, spec, title):
+    self.axes[index] = _add_mpl_axes(self.fig, spec)
+    self.axes[index].grid(True)
+    if title:
+      self.axes[index].set_title(title)
+
+  def curve(self, index, name, y, x=None, log=False, steps=False):
+    """
+    Make or update a curve
+
+    The line's data are replaced, so the plot is not cleared and re-made.
+
+    @param index : plot number
+    @type  index : int
+
+    @param name : curve name, for the legend
+    @type  name : str
+
+    @param y : ordinates
+    @type  y : numpy.ndarray
+
+    @param x : abscissae; default is the index of y.  For steps, the edges,
+               one more than y.
+    @type  x : numpy.ndarray
+
+    @param log : logarithmic ordinate scale
+    @type  log : bool
+
+    @param steps : draw as a histogram
+    @type  steps : bool
+
+    @return: matplotlib Line2D
+    """
+    from matplotlib.lines import Line2D
+    ax = self.axes[index]
+    if x is None:
+      x = numpy.arange(len(y))
+    if steps:
+      y = numpy.append(y, y[-1])
+    line = self._curves.get((index, name))
+    # the axes may have been cleared outside the plotter
+    if line is None or line not in ax.lines:
+      color = COLORS[len([key for key in self._curves if key[0] == index])
+                     % len(COLORS)]
+      # add_line does not clear the axes, whatever the figure's hold state
+      line = Line2D(x, y, color=color, label=name,
+                    drawstyle='steps-post' if steps else 'default')
+      ax.add_line(line)
+      self._curves[(index, name)] = line
+    else:
+      line.set_data(x, y)
+    scale = 'log' if log else 'linear'
+    if ax.get_yscale() != scale:
+      ax.set_yscale(scale)
+    ax.relim()
+    ax.autoscale_view()
+    return line
+
+  def legend(self, index):
+    self.axes[index].legend()
+
+  def draw(self):
+    """
+    Redraw the canvas when Qt is next idle
+    """
+    self.canvas.draw_idle()
+
+  def snapshot(self, filename, **kwargs):
+    """
+    Save the figure; keyword arguments are passed to savefig()
+    """
+    self.fig.savefig(filename, **kwargs)
+
 class MPLcanvas(FigureCanvas):
   """
   A canvas with a toolbar
@@ -58,12 +259,303 @@ class MPLcanvas(FigureCanvas):
     """
     FigureCanvas.__init__(self, fig)
     self.toolbar = NavigationToolbar(self, window)
-    
+
+class PGplotter(QtGui.QWidget, Plotter):
+  """
+  A plotting area drawn with pyqtgraph
+
+  The curves are PlotDataItems whose data are replaced, so updating a
+  spectrum at the display rate costs little.  The data last given to each
+  curve are kept so that snapshot() can draw them with matplotlib.
+
+  Public attributes::
+    axes   - pyqtgraph PlotItems by number
+    layout - the GraphicsLayoutWidget holding the plots
+    logger - logger for this instance
+    titles - plot titles
+  """
+  def __init__(self):
+    global pyqtgraph
+    import pyqtgraph
+    super(PGplotter,self).__init__()
+    self.logger = logging.getLogger(__name__+".PGplotter")
+    self._init_plotter()
+    self._data = {}
+    self._log = {}
+    self._legends = {}
+    self.layout = pyqtgraph.GraphicsLayoutWidget()
+    vlayout = QtGui.QVBoxLayout()
+    vlayout.addWidget(self.layout)
+    self.setLayout(vlayout)
+
+  def _make_axes(self, index, spec, title):
+    if spec[0] == 'subplot':
+      rows, columns, number = spec[1:]
+      cell = ((number-1) // columns, (number-1) % columns, 1, 1)
+    else:
+      cell = _grid_cells([self._layout[i][1] for i in sorted(self._layout)
+                          if self._layout[i][0] == 'axes'])[index]
+    row, column, rowspan, colspan = cell
+    self.axes[index] = self.layout.addPlot(row=row, col=column,
+                                           rowspan=rowspan, colspan=colspan,
+                                           title=title or None)
+    self.axes[index].showGrid(x=True, y=True)
+
+  def add_axes(self, bounds=[[0.1,0.1,0.9,0.9]], titles=[]):
+    # the grid needs all the bounds before the first plot is placed
+    for i in range(len(bounds)):
+      self._layout[i] = ('axes', bounds[i])
+    return Plotter.add_axes(self, bounds, titles)
+
+  def curve(self, index, name, y, x=None, log=False, steps=False):
+    """
+    Make or update a curve
+
+    Arguments are as for MPLplotter.curve()
+
+    @return: pyqtgraph PlotDataItem
+    """
+    if x is None:
+      x = numpy.arange(len(y))
+    item = self._curves.get((index, name))
+    if item is None:
+      number = len([key for key in self._curves if key[0] == index])
+      # a legend already made takes the new curve
+      item = self.axes[index].plot(pen=pyqtgraph.intColor(number), name=name)
+      self._curves[(index, name)] = item
+    item.setData(x, y, stepMode=steps)
+    if self._log.get(index) != log:
+      self.axes[index].setLogMode(y=log)
+      self._log[index] = log
+    self._data[(index, name)] = (x, y, steps, log)
+    return item
+
+  def legend(self, index):
+    if index not in self._legends:
+      legend = self.axes[index].addLegend()
+      for (i, name), item in self._curves.items():
+        if i == index:
+          legend.addItem(item, name)
+      self._legends[index] = legend
+
+  def draw(self):
+    """
+    Nothing to do; pyqtgraph repaints when the data change
+    """
+    pass
+
+  def snapshot(self, filename, **kwargs):
+    """
+    Draw the latest data with matplotlib and save the figure
+
+    Keyword arguments are passed to savefig()
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    axes = {}
+    for index in self._layout:
+      axes[index] = _add_mpl_axes(fig, self._layout[index])
+      axes[index].grid(True)
+      if index < len(self.titles) and self.titles[index]:
+        axes[index].set_title(self.titles[index])
+    for (index, name), (x, y, steps, log) in self._data.items():
+      if steps:
+        axes[index].plot(x, numpy.append(y, y[-1]), drawstyle='steps-post',
+                         label=name)
+      else:
+        axes[index].plot(x, y, label=name)
+      if log:
+        axes[index].set_yscale('log')
+    for index in self._legends:
+      axes[index].legend()
+    fig.savefig(filename, **kwargs)
+    self.logger.debug("snapshot: saved %s", filename)
+
+PLOT_BACKENDS = {'matplotlib': MPLplotter}
+if find_spec('pyqtgraph') is not None:
+  PLOT_BACKENDS['pyqtgraph'] = PGplotter
+
+class Waterfall(QtGui.QWidget):
+  """
+  Spectra against time as an image, the latest spectrum at the bottom
+
+  The spectra are scaled to bytes and kept in a preallocated ring buffer
+  [time, channel] of unsigned 8-bit integers.  A QImage in Indexed8 format
+  uses the buffer's memory directly, with a color lookup table, so a new
+  spectrum costs the scaling of one row.  The image is drawn in two parts,
+  from the oldest row to the end of the buffer and from the start of the
+  buffer to the newest row, so it scrolls without being re-rendered.
+
+  Public attributes::
+    channels - channels per spectrum, known after the first one
+    data     - ring buffer, array [row, channel] of uint8
+    image    - QImage sharing the memory of 'data'
+    levels   - (low, high) values mapped to the ends of the color table
+    log      - True if the values are shown in dB
+    logger   - logger for this instance
+    rows     - number of spectra shown
+    row      - row for the next spectrum
+    title    - text above the waterfall
+  """
+  def __init__(self, rows=256, colormap='jet', levels=None, title="",
+               parent=None):
+    """
+    @param rows : number of spectra shown
+    @type  rows : int
+
+    @param colormap : matplotlib colormap name
+    @type  colormap : str
+
+    @param levels : (low, high) of the color scale; None to follow the data
+    @type  levels : tuple of float
+
+    @param title : text above the waterfall
+    @type  title : str
+    """
+    super(Waterfall, self).__init__(parent)
+    self.logger = logging.getLogger(__name__+".Waterfall")
+    self.rows = rows
+    self.row = 0
+    self.filled = 0
+    self.channels = None
+    self.data = None
+    self.image = None
+    self.title = title
+    self.log = False
+    self.fixed_levels = levels is not None
+    self.levels = levels
+    from matplotlib.cm import get_cmap
+    table = get_cmap(colormap)(numpy.linspace(0, 1, 256))
+    self.color_table = [QtGui.qRgb(*[int(255*c) for c in rgba[:3]])
+                        for rgba in table]
+    self._scaled = None
+    self.setMinimumSize(128, 64)
+
+  def _allocate(self, channels):
+    """
+    Make the ring buffer and the image on it
+    """
+    self.channels = channels
+    self.data = numpy.zeros((self.rows, channels), dtype=numpy.uint8)
+    self._scaled = numpy.empty(channels)
+    self.image = QtGui.QImage(self.data.data, channels, self.rows, channels,
+                              QtGui.QImage.Format_Indexed8)
+    self.image.setColorTable(self.color_table)
+    self.row = 0
+    self.filled = 0
+
+  def add_spectrum(self, spectrum, log=False):
+    """
+    Add a spectrum as the newest row
+
+    @param spectrum : values of the channels
+    @type  spectrum : numpy.ndarray
+
+    @param log : show the values in dB
+    @type  log : bool
+    """
+    spectrum = numpy.asarray(spectrum, dtype=float)
+    if self.data is None or len(spectrum) != self.channels or \
+       log != self.log:
+      self._allocate(len(spectrum))
+      self.log = log
+      if not self.fixed_levels:
+        self.levels = None
+    scaled = self._scaled
+    if log:
+      numpy.maximum(spectrum, 1e-30, out=scaled)
+      numpy.log10(scaled, out=scaled)
+      scaled *= 10
+    else:
+      scaled[:] = spectrum
+    if not self.fixed_levels:
+      low, high = numpy.percentile(scaled, (1, 99))
+      if self.levels is None:
+        self.levels = (low, high)
+      else:
+        # follow the data slowly so the colors do not flicker
+        self.levels = (self.levels[0] + 0.05*(low - self.levels[0]),
+                       self.levels[1] + 0.05*(high - self.levels[1]))
+    low, high = self.levels
+    scaled -= low
+    scaled *= 255.0/max(high - low, 1e-30)
+    numpy.clip(scaled, 0, 255, out=scaled)
+    self.data[self.row] = scaled
+    self.row = (self.row + 1) % self.rows
+    self.filled = min(self.filled + 1, self.rows)
+    self.update()
+
+  def paintEvent(self, event):
+    painter = QtGui.QPainter(self)
+    painter.fillRect(self.rect(), QtCore.Qt.black)
+    if self.image is not None and self.filled:
+      width = self.width()
+      height = float(self.height())
+      # the older part, from 'row' to the end, then the newer part
+      older = self.rows - self.row if self.filled == self.rows else 0
+      newer = self.row
+      pixels = height/self.rows
+      top = height - (older + newer)*pixels
+      if older:
+        painter.drawImage(QtCore.QRectF(0, top, width, older*pixels),
+                          self.image,
+                          QtCore.QRectF(0, self.row, self.channels, older))
+      if newer:
+        painter.drawImage(QtCore.QRectF(0, top + older*pixels,
+                                        width, newer*pixels),
+                          self.image,
+                          QtCore.QRectF(0, 0, self.channels, newer))
+    if self.title:
+      painter.setPen(QtCore.Qt.white)
+      painter.drawText(self.rect(), QtCore.Qt.AlignTop|QtCore.Qt.AlignHCenter,
+                       self.title)
+    painter.end()
+
+class WaterfallPlotter(QtGui.QWidget):
+  """
+  Waterfalls side by side, addressed like the axes of an MPLplotter
+
+  Public attributes::
+    axes   - Waterfall instances, by number
+    titles - titles of the waterfalls
+  """
+  def __init__(self, count=1, rows=256, colormap='jet', titles=[],
+               columns=None):
+    """
+    @param count : number of waterfalls
+    @type  count : int
+
+    @param rows : spectra shown by each waterfall
+    @type  rows : int
+
+    @param colormap : matplotlib colormap name
+    @type  colormap : str
+
+    @param titles : titles of the waterfalls
+    @type  titles : list of str
+
+    @param columns : waterfalls per row; default all in one row
+    @type  columns : int
+    """
+    super(WaterfallPlotter, self).__init__()
+    self.logger = logging.getLogger(__name__+".WaterfallPlotter")
+    self.titles = titles
+    self.axes = {}
+    layout = QtGui.QGridLayout()
+    columns = columns or count
+    for i in range(count):
+      title = titles[i] if i < len(titles) else ""
+      self.axes[i] = Waterfall(rows=rows, colormap=colormap, title=title,
+                               parent=self)
+      layout.addWidget(self.axes[i], i // columns, i % columns)
+    self.setLayout(layout)
+
 class TabbedPlotWindow(QtGui.QTabWidget):
   """
   A separate tabbed window for plots (and possibly other things)
   """
-  def __init__(self, num_tabs=0, names=[], fill=False):
+  def __init__(self, num_tabs=0, names=[], fill=False, backend='matplotlib'):
     """
     Instantiate a separate tabbed plot window
 
@@ -74,6 +566,9 @@ class TabbedPlotWindow(QtGui.QTabWidget):
 
     @param names : optional list of tab names
     @type  names : list of str
+
+    @param backend : key of PLOT_BACKENDS for the plot pages
+    @type  backend : str
     """
     self.logger = logging.getLogger(__name__+".TabbedPlotWindow")
     if num_tabs == 0 and names == []:
@@ -89,19 +584,20 @@ class TabbedPlotWindow(QtGui.QTabWidget):
     self.axes = {}
     for tab in range(num_tabs):
       self.logger.debug("Making plot page %d",tab)
-      self.plottab[tab] = MPLplotter()
+      self.plottab[tab] = PLOT_BACKENDS[backend]()
       self.addTab(self.plottab[tab],names[tab])
       self.make_plot(tab,rows=2,columns=2,fill=fill)
     self.setWindowTitle('Widgets Inside Tabs')
     self.show()
 
-  def make_plot(self, tab, rows=1, columns=1, fill=fill):
+  def make_plot(self, tab, rows=1, columns=1, fill=True):
     """
     Create the subplots for a tab page
 
     For testing purposes this draws a graph of random numbers by default.
     For ordinary use, set Fill to False and then invoke::
-      self.axes[tab][subplot].plot(...)
+      self.plottab[tab].curve(subplot, name, y)
+    or use the backend's own methods on self.axes[tab][subplot].
 
     @param tab : the tabbed sheet on which the grapgs will be configured
     @type  tab : int
@@ -115,22 +611,55 @@ class TabbedPlotWindow(QtGui.QTabWidget):
     @param fill : generate a dummy plot if True (default)
     @type  fill : bool
     """
-    num_subplots = rows*columns
-    self.axes[tab] = {}
+    self.plottab[tab].add_subplots(rows, columns)
+    self.axes[tab] = self.plottab[tab].axes
     if fill:
-      x = range(100)
-      y = [random() for i in range(100)]
-    for i in range(num_subplots):
-      self.logger.debug("Making subplot %d for tab %d",i,tab)
-      self.axes[tab][i] = self.plottab[tab].fig.add_subplot(rows,columns,i+1)
-      if fill:
-        self.lines[tab] = self.axes[tab][i].plot(x,y)
-      self.logger.debug("axes: %s",str(self.axes))
-    self.plottab[tab].canvas.show()
+      for i in self.axes[tab]:
+        self.plottab[tab].curve(i, "random", numpy.random.random(100))
+      self.plottab[tab].draw()
+    self.logger.debug("axes: %s",str(self.axes))
+
+  def add_waterfall_tab(self, name, count=1, rows=256, titles=[]):
+    """
+    Add a tab of waterfalls
+
+    The waterfalls are fed with::
+      self.axes[tab][i].add_spectrum(spectrum)
+
+    @param name : tab name
+    @type  name : str
+
+    @param count : number of waterfalls
+    @type  count : int
+
+    @param rows : spectra shown by each waterfall
+    @type  rows : int
+
+    @return: the tab number
+    """
+    tab = len(self.plottab)
+    self.plottab[tab] = WaterfallPlotter(count=count, rows=rows,
+                                         titles=titles)
+    self.axes[tab] = self.plottab[tab].axes
+    self.addTab(self.plottab[tab], name)
+    return tab
 
 if __name__ == "__main__":
   app = QtGui.QApplication(sys.argv)
-  myapp = TabbedPlotWindow(names=["One","Two","Three"],fill=True)
+  if len(sys.argv) > 1:
+    backend = sys.argv[1]
+  else:
+    backend = 'matplotlib'
+  myapp = TabbedPlotWindow(names=["One","Two","Three"], fill=True,
+                           backend=backend)
+  # a waterfall of 4096 channel noise spectra at 25 per second
+  waterfall_tab = myapp.add_waterfall_tab("Waterfall", count=1)
+  def add_noise():
+    myapp.axes[waterfall_tab][0].add_spectrum(
+                                          numpy.random.chisquare(8, 4096))
+  timer = QtCore.QTimer()
+  timer.timeout.connect(add_noise)
+  timer.start(40)
   myapp.show()
   sys.exit(app.exec_())
   
\ No newline at end of file
@@ -2,169 +2,31 @@ from PyQt5 import QtGui,QtCore, QtWidgets
 import logging
 
 from support.dicts import flattenDict
+from MCClient.board_registry import BoardRegistry, natural_key
 from MCClient.GUI.Qt_widgets import slotgen
-from MCClient.GUI.Qt_widgets.spinslider import SpinSlider
-from MCClient.GUI.Qt_widgets.general_dial import GeneralDial
-
-class ControlPanelGriddedFrame(QtWidgets.QFrame):
+# SpinSlider and GeneralDial are imported by the rows which use them so that
+# panels without dials or spinsliders do not load them
+
+# attribute of ControlPanelGriddedFrame with the widgets of each row type
+WIDGET_DICTS = {'label':      'labels',
+                'check':      'checkbuttons',
+                'push':       'pushbuttons',
+                'dial':       'dials',
+                'switch':     'switches',
+                'spinslider': 'synth',
+                'spinbox':    'synth',
+                'custom':     'custom'}
+
+class ColumnLayout(object):
   """
-  Automatically generated frame with a grid of M&C widgets
-
-  The following widget types are recognized::
-   labels       - text or values
-   checkbuttons - True or false selection
-   pushbuttons  - cause an action
-   dials        - set a value within a range of values
-   switches     - 1xN or Nx1 selection; button invokes a radiobutton form
+  Column layout shared by the gridded monitor and control panels
 
-  Each row in the frame is specified by an item in a list of rows passed
-  as an argument for instantiating the class::
-    Type (row[0])         - a string currently having one of the values:
-                            'label', 'check', 'push', 'dial', 'switch'.
-    Name (row[1])         - a unique name for this type of row.
-    Devices (row[2])      - a dictionary of dictionaries whose contents depend
-                            on the row's type.  The nested dictionaries are
-                            indexed with ROACH number (int), an optional ADC
-                            number (0 or 1), and an optional RF input number
-                            (0 or 1). If only ROACH indices are given, the
-                            widget will span all the columns for that widget.
-                            Similarly if only ROACH and ADC numbers are given.
-    Additional (rows[3:]) - specific to the row type. Check the doc string of
-                            the method which creates the row.
+  Given the list of rows (see ControlPanelGriddedFrame) this works out one
+  column for every key of the deepest level of the row dictionaries and
+  which columns each widget spans.  Subclasses must have a 'logger' and
+  may have 'boards', the BoardRegistry which gives the column of a board;
+  without it the boards are in natural order of their names.
   """
-  def __init__(self, rows, parent = None):
-    """
-    Instantiate ControlPanelGriddedFrame()
-
-    @param rows : ordered list of data for row of widgets (see class doc str)
-    @type  rows : list
-
-    @param parent : the object which instantiated this class
-    @type  parent : object
-    """
-    QtGui.QFrame.__init__(self)
-
-    self.logger = logging.getLogger(__name__+".ControlPanelGriddedFrame")
-    self.logger.debug("logger is %s", self.logger.name)
-    self.parent = parent
-    self.gridLayout = QtGui.QGridLayout(self)
-    self.columnize(rows)
-    self.logger.debug("__init__: highest depth keys: %s",
-                      str(self.highest_depth_keys))
-    self.initUI(rows)
-
-  def initUI(self,rows):
-    """
-    Initialize a rows and columns grid of monitor and control widgets.  The
-    following keys specify the type of widget::
-     'label'      - text, which could be updated to reflect dynamic values
-     'check'      - to select or deselect an option
-     'push'       - button to cause an action (e.g. perform a calibration)
-     'dial'       - to set a value with a specified range
-     'switch'     - a pushbutton with a pop-up to select one of many (e.g.
-                    a signal source)
-     'spinslider' - combination slider and spinbox (good for setting large
-                    numbers to high precision
-     'spinbox'    - standard spinbox for selecting values in a range
-     'custom'     - special widget with a unique functionality
-    """
-    self.labels = {}
-    self.checkbuttons = {}
-    self.pushbuttons = {}
-    self.dials = {}
-    self.switches = {}
-    self.synth = {}
-    self.custom = {}
-    rownum = 0
-    for row in rows:
-      self.logger.debug("__init__: making type %s row '%s'",
-                        row['widget'], row['name'])
-      if row['widget'] == 'label':
-        keyword_args = {}
-        if row.has_key('format'):
-          keyword_args['format'] = row['format']
-        if row.has_key('slots'):
-          keyword_args['slots'] = row['slots']
-        self.labels[row['name']] = self.make_label_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       **keyword_args)
-      elif row['widget'] == 'check':
-        self.checkbuttons[row['name']] = self.make_checkbutton_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['action'])
-      elif row['widget'] == 'push':
-        self.pushbuttons[row['name']] = self.make_pushbutton_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['action'])
-      elif row['widget'] == 'dial':
-        self.dials[row['name']] = self.make_dial_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['range'],
-                                       row['format'],
-                                       row['converters'][1],
-                                       row['converters'][0],
-                                       row['action'])
-      elif row['widget'] == 'switch':
-        if row.has_key('label_template'):
-          self.switches[row['name']] = self.make_switch_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['labels'],
-                                       label_template = row['label_template'])
-        else:
-          self.switches[row['name']] = self.make_switch_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['labels'])
-      elif row['widget'] == 'spinslider':
-        if row.has_key('range'):
-          self.synth[row['name']] = self.make_spinslider_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['action'],
-                                       limits = row['range'])
-        else:
-          self.synth[row['name']] = self.make_spinslider_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['action'])
-
-      elif row['widget'] == 'spinbox':
-        if row.has_key('range'):
-          self.synth[row['name']] = self.make_spinbox_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['action'],
-                                       steps=row['range'])
-        else:
-          self.synth[row['name']] = self.make_spinbox_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['action'])
-      elif row['widget'] == 'custom':
-        self.custom[row['name']] = self.make_custom_row(
-                                       rownum,
-                                       row['name'],
-                                       row['values'],
-                                       row['widgets'])
-      else:
-        self.logger.warning("__init__: row type %s is unknown",row['widget'])
-      rownum += 1
-
   def columnize(self,rows):
     """
     Extract information about multiply-indexed widgets to be gridded.
@@ -181,10 +43,10 @@ class ControlPanelGriddedFrame(QtWidgets.QFrame):
     dicts = []
     rekeyed = []
     flatdicts = []
+    self.rows_columnized = rows
     for row in rows:
       dicts.append(row['values'])
-      keys = row['values'].keys()
-      keys.sort()
+      keys = sorted(row['values'].keys(), key=natural_key)
       newdict = {}
       for index in range(len(keys)):
         key = keys[index]
@@ -199,6 +61,7 @@ class ControlPanelGriddedFrame(QtWidgets.QFrame):
       flatdicts.append(flattenDict(d))
     self.highest_depth_keys = self.get_highest_depth_keys(flatdicts)
     self.highest_depth_keys.sort()
+    self.index_columns()
 
   def get_highest_depth_keys(self,dictionaries):
     """
@@ -207,20 +70,20 @@ class ControlPanelGriddedFrame(QtWidgets.QFrame):
     For example, if roach1 has one ADC with two inputs and roach2 has one
     ADC with one input it should return::
       [(0,0,0), (0,0,1), (1,0,0)]
-    The widget positioning method then can match the widget index with this
-    list to see what column the widget should go in.
+    The column index made from this list then tells in which columns a
+    widget should go.
 
     The keys in 'dictionaries' are tuples, obtained from flattenDict().
     Because the keys returned from this will be used to organize the columns
     of the grid, they must all use the same convention. We use a tuple of ints.
     """
     highest_depth = 0 # should become 3 for (roach, adc, rf)
-    keyset = {}       # lists of keys indexed by depth
+    keyset = {}       # ordered sets (dicts of None) of keys indexed by depth
     self.logger.debug("get_highest_depth_keys: dicts: %s", dictionaries)
     for dictionary in dictionaries:
       self.logger.debug("get_highest_depth_keys: processing %s",
                         dictionary)
-      keys = dictionary.keys()
+      keys = list(dictionary.keys())
       self.logger.debug("get_highest_depth_keys: processing depth 0 keys %s",
                         str(keys))
       if len(keys):
@@ -233,44 +96,60 @@ class ControlPanelGriddedFrame(QtWidgets.QFrame):
           highest_depth = depth
           self.logger.debug("get_highest_depth_keys: highest depth is now %d",
                             highest_depth)
-          try:
-            # See if there is a keyset for this depth
-            keyset[depth]
-          except KeyError:
-            # If not, create it
-            self.logger.debug(
-                         "get_highest_depth_keys: created keyset for depth %d",
-                         depth)
-            keyset[depth] = []
+          ordered = keyset.setdefault(depth, {})
           for key in keys:
-            try:
-              # Is this key already in the keyset?
-              keyset[depth].index(key)
-            except ValueError:
-              # If not, add it
-              keyset[depth].append(key)
-      else:
-        # empty dict
-        pass
+            ordered[key] = None
     self.logger.debug("get_highest_depth_keys: keysets: %s",str(keyset))
-    highest_depth_keyset = keyset[highest_depth]
+    highest_depth_keyset = list(keyset.get(highest_depth, {}))
     # At the very minimum there must be an entry for each ROACH
-    if len(highest_depth_keyset) < len(keyset[1]):
+    roach_keys = keyset.get(1, {})
+    if len(highest_depth_keyset) < len(roach_keys):
       # create missing key(s)
-      required_keys = keyset[1]
-      for index in range(len(required_keys)):
-        for depth in range(2,highest_depth+1):
-          required_keys[index] += (0,)
+      present = set(highest_depth_keyset)
+      padding = (0,)*(highest_depth-1)
+      required_keys = [key+padding for key in roach_keys]
       self.logger.debug("get_highest_keys: required_keys: %s",required_keys)
       for key in required_keys:
-        try:
-          highest_depth_keyset.index(key)
-        except ValueError:
-          position = key[0]
-          highest_depth_keyset.insert(position,key)
+        if key not in present:
+          present.add(key)
+          highest_depth_keyset.insert(key[0],key)
     self.logger.debug("get_highest_keys: got %s",highest_depth_keyset)
     return highest_depth_keyset
 
+  def index_columns(self):
+    """
+    Map every key prefix to the columns it occupies
+
+    Because highest_depth_keys is sorted, the keys sharing a prefix are
+    adjacent, so each prefix spans a single range of columns.  Column 0 has
+    the row labels.  Creates attribute::
+     column_index: (first column, number of columns) indexed by key prefix
+    """
+    self.column_index = {}
+    for col, key in enumerate(self.highest_depth_keys, 1):
+      if type(key) != tuple:
+        key = (key,)
+      for depth in range(1, len(key)+1):
+        prefix = key[:depth]
+        if prefix in self.column_index:
+          first, span = self.column_index[prefix]
+          self.column_index[prefix] = (first, span+1)
+        else:
+          self.column_index[prefix] = (col, 1)
+    self.logger.debug("index_columns: %s", self.column_index)
+
+  def _board_index(self, name):
+    """
+    Column index of a board
+    """
+    boards = getattr(self, 'boards', None)
+    if boards is None:
+      names = set()
+      for row in self.rows_columnized:
+        names.update(key for key in row['values'] if type(key) != int)
+      boards = BoardRegistry(list(names))
+    return boards.index[name]
+
   def _position_widget(self, key, keylen, col):
     """
     Positions one widget in a row.
@@ -278,7 +157,8 @@ class ControlPanelGriddedFrame(QtWidgets.QFrame):
     All the widgets are assumed to have the same key dimension which is
     determined from the first key and passed in as an argument.
 
-    This determines how many columns a widget will occupy.
+    This determines in which column a widget goes and how many columns it
+    will occupy.
 
     @param key : key of the widget in a dict
     @type  key : tuple
@@ -286,48 +166,392 @@ class ControlPanelGriddedFrame(QtWidgets.QFrame):
     @param keylen : length of the key
     @type  keylen : int
 
-    @param col : the column for the widget
+    @param col : the next free column, used if the key is not in the index
     @type  col : int
     """
-    colspan = 0
-    self.logger.debug("_position_widget: processing key %s of length %d",
-                      str(key), keylen)
     # Are any of the subkeys not integers?  If so, replace them.
     newkey = False
     for index in range(len(key)):
       if type(key[index]) != int:
         if index == 0:
           # Assume the last key is like ('roach1',0) or ('roach2',0)
-          newkey = (int(key[0][-1])-1,)
+          newkey = (self._board_index(key[0]),)
         else:
           newkey = key[:index]+(index,)
-        self.logger.log(5,
-                      "_position_widget: non-integer key %s found at index %d",
-                      str(key[index]),index)
-        self.logger.log(5,'_position_widget: building new key: %s',str(newkey))
       else:
         if newkey:
           # keep on building the new key
           newkey += (key[index],)
-    if newkey:
-      self.logger.log(5,"_position_widget: %s replaced with: %s", str(key),
-                        str(newkey))
-    else:
+    if not newkey:
       newkey = key
+    col, colspan = self.column_index.get(newkey, (col, 0))
+    self.logger.log(5,
+                   "_position_widget: %s in column %d spanning %d columns",
+                   str(key), col, colspan)
+    return col, colspan
+
+class StateBinding(object):
+  """
+  Label rows which follow a StateStore
+
+  A row specification with a 'state' item, the key prefix of the row's
+  values in the store (e.g. ('ADC_levels',)), is updated by the store
+  whenever one of its values changes, and only then.  Subclasses must have
+  'rows', 'logger' and set_value(rowname, key, value).
+  """
+  def bind_state(self, store):
+    """
+    Subscribe the rows which have a 'state' item to a store
+
+    Earlier subscriptions are dropped so this can be called again after
+    the rows have changed.
 
-    num_keys_to_test = len(newkey)
-    for testkey in self.highest_depth_keys:
-      testpart = testkey[:num_keys_to_test]
-      self.logger.log(5, "_position_widget: comparing %s to %s",
-                            str(newkey), str(testpart))
-      if newkey == testpart:
-        colspan += 1
+    @param store : the store of the values shown
+    @type  store : StateStore instance
+    """
+    self.unbind_state()
+    self.state_store = store
+    for row in self.rows:
+      if 'state' in row:
+        callback = self._state_callback(row['name'], len(row['state']))
+        store.subscribe(row['state'], callback)
+        self._bindings.append((row['state'], callback))
+    self.logger.debug("bind_state: %d rows bound", len(self._bindings))
+
+  def unbind_state(self):
+    """
+    Drop all subscriptions, e.g. before the panel is closed
+    """
+    for prefix, callback in getattr(self, '_bindings', []):
+      self.state_store.unsubscribe(prefix, callback)
+    self._bindings = []
+
+  def _state_callback(self, rowname, prefix_length):
+    def show(key, old, new):
+      self.set_value(rowname, key[prefix_length:], new)
+    return show
+
+class ControlPanelGriddedFrame(ColumnLayout, StateBinding, QtWidgets.QFrame):
+  """
+  Automatically generated frame with a grid of M&C widgets
+
+  The following widget types are recognized::
+   labels       - text or values
+   checkbuttons - True or false selection
+   pushbuttons  - cause an action
+   dials        - set a value within a range of values
+   switches     - 1xN or Nx1 selection; button invokes a radiobutton form
+
+  Each row in the frame is specified by an item in a list of rows passed
+  as an argument for instantiating the class.  Label rows may also have a
+  'state' item so that they can follow a StateStore (see StateBinding)::
+    Type (row[0])         - a string currently having one of the values:
+                            'label', 'check', 'push', 'dial', 'switch'.
+    Name (row[1])         - a unique name for this type of row.
+    Devices (row[2])      - a dictionary of dictionaries whose contents depend
+                            on the row's type.  The nested dictionaries are
+                            indexed with ROACH number (int), an optional ADC
+                            number (0 or 1), and an optional RF input number
+                            (0 or 1). If only ROACH indices are given, the
+                            widget will span all the columns for that widget.
+                            Similarly if only ROACH and ADC numbers are given.
+    Additional (rows[3:]) - specific to the row type. Check the doc string of
+                            the method which creates the row.
+  """
+  def __init__(self, rows, parent = None):
+    """
+    Instantiate ControlPanelGriddedFrame()
+
+    @param rows : ordered list of data for row of widgets (see class doc str)
+    @type  rows : list
+
+    @param parent : the object which instantiated this class
+    @type  parent : object
+    """
+    QtGui.QFrame.__init__(self)
+
+    self.logger = logging.getLogger(__name__+".ControlPanelGriddedFrame")
+    self.logger.debug("logger is %s", self.logger.name)
+    self.parent = parent
+    self.gridLayout = QtGui.QGridLayout(self)
+    self.columnize(rows)
+    self.logger.debug("__init__: highest depth keys: %s",
+                      str(self.highest_depth_keys))
+    self.initUI(rows)
+
+  @property
+  def boards(self):
+    """
+    The parent's BoardRegistry, which is replaced when the boards change
+    """
+    return getattr(self.parent, 'boards', None)
+
+  def initUI(self,rows):
+    """
+    Initialize a rows and columns grid of monitor and control widgets.  The
+    following keys specify the type of widget::
+     'label'      - text, which could be updated to reflect dynamic values
+     'check'      - to select or deselect an option
+     'push'       - button to cause an action (e.g. perform a calibration)
+     'dial'       - to set a value with a specified range
+     'switch'     - a pushbutton with a pop-up to select one of many (e.g.
+                    a signal source)
+     'spinslider' - combination slider and spinbox (good for setting large
+                    numbers to high precision
+     'spinbox'    - standard spinbox for selecting values in a range
+     'custom'     - special widget with a unique functionality
+    """
+    self.labels = {}
+    self.checkbuttons = {}
+    self.pushbuttons = {}
+    self.dials = {}
+    self.switches = {}
+    self.synth = {}
+    self.custom = {}
+    self.rows = rows
+    rownum = 0
+    for row in rows:
+      self._make_row(rownum, row)
+      rownum += 1
+
+  def _make_row(self, rownum, row):
+    """
+    Make the widgets for one row specification at a row of the grid
+    """
+    self.logger.debug("_make_row: making type %s row '%s'",
+                      row['widget'], row['name'])
+    if row['widget'] == 'label':
+      keyword_args = {}
+      if row.has_key('format'):
+        keyword_args['format'] = row['format']
+      if row.has_key('slots'):
+        keyword_args['slots'] = row['slots']
+      self.labels[row['name']] = self.make_label_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     **keyword_args)
+    elif row['widget'] == 'check':
+      self.checkbuttons[row['name']] = self.make_checkbutton_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['action'])
+    elif row['widget'] == 'push':
+      self.pushbuttons[row['name']] = self.make_pushbutton_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['action'])
+    elif row['widget'] == 'dial':
+      self.dials[row['name']] = self.make_dial_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['range'],
+                                     row['format'],
+                                     row['converters'][1],
+                                     row['converters'][0],
+                                     row['action'])
+    elif row['widget'] == 'switch':
+      if row.has_key('label_template'):
+        self.switches[row['name']] = self.make_switch_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['labels'],
+                                     label_template = row['label_template'])
       else:
+        self.switches[row['name']] = self.make_switch_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['labels'])
+    elif row['widget'] == 'spinslider':
+      if row.has_key('range'):
+        self.synth[row['name']] = self.make_spinslider_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['action'],
+                                     limits = row['range'])
+      else:
+        self.synth[row['name']] = self.make_spinslider_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['action'])
+
+    elif row['widget'] == 'spinbox':
+      if row.has_key('range'):
+        self.synth[row['name']] = self.make_spinbox_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['action'],
+                                     steps=row['range'])
+      else:
+        self.synth[row['name']] = self.make_spinbox_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['action'])
+    elif row['widget'] == 'custom':
+      self.custom[row['name']] = self.make_custom_row(
+                                     rownum,
+                                     row['name'],
+                                     row['values'],
+                                     row['widgets'])
+    else:
+      self.logger.warning("_make_row: row type %s is unknown",row['widget'])
+
+  def reconcile(self, rows):
+    """
+    Change the grid in place to match a new rows specification
+
+    Rows with the same name, widget type and column keys keep their widgets
+    (and signal connections) and only get their values updated.  Other rows
+    are made or removed.  If the columns are different, the grid is rebuilt.
+
+    @param rows : new ordered list of row specifications
+    @type  rows : list
+
+    @return: True if the grid was changed in place, False if rebuilt
+    """
+    old_columns = self.highest_depth_keys
+    self.columnize(rows)
+    if self.highest_depth_keys != old_columns:
+      self.logger.debug("reconcile: columns changed; rebuilding")
+      self._clear_grid()
+      self.initUI(rows)
+      return False
+    old_rows = {}
+    for rownum, row in enumerate(self.rows):
+      old_rows[row['name']] = (rownum, row)
+    # take every widget out of the grid, grouped by the row it was in
+    items = {}
+    for index in reversed(range(self.gridLayout.count())):
+      position = self.gridLayout.getItemPosition(index)
+      item = self.gridLayout.takeAt(index)
+      items.setdefault(position[0], []).append((item, position))
+    new_names = set(row['name'] for row in rows)
+    for name, (rownum, row) in old_rows.items():
+      if name not in new_names:
+        self._discard_row(row, items.pop(rownum, []))
+    for rownum, row in enumerate(rows):
+      old = old_rows.get(row['name'])
+      if old and self._same_layout(old[1], row):
+        for item, (r, col, rowspan, colspan) in items.pop(old[0], []):
+          self.gridLayout.addWidget(item.widget(), rownum, col,
+                                    rowspan, colspan, item.alignment())
+        self._update_row(row)
+      else:
+        if old:
+          self._discard_row(old[1], items.pop(old[0], []))
+        self._make_row(rownum, row)
+    self.rows = rows
+    return True
+
+  def _same_layout(self, old, new):
+    """
+    True if a row can keep its widgets
+    """
+    if old['widget'] != new['widget']:
+      return False
+    old_values = flattenDict(old['values'])
+    new_values = flattenDict(new['values'])
+    if set(old_values.keys()) != set(new_values.keys()):
+      return False
+    if new['widget'] == 'custom' and old_values != new_values:
+      # a different widget class for some column
+      return False
+    return True
+
+  def _discard_row(self, row, items):
+    """
+    Delete the widgets of a row which has been taken out of the grid
+    """
+    getattr(self, WIDGET_DICTS.get(row['widget'], 'custom')).pop(row['name'],
+                                                                  None)
+    for item, position in items:
+      if item.widget():
+        item.widget().deleteLater()
+
+  def _update_row(self, row):
+    """
+    Show the values of a row specification in the existing widgets
+
+    Signals are blocked while the widgets are set so that the row actions
+    are not invoked.
+    """
+    name = row['name']
+    widgets = getattr(self, WIDGET_DICTS.get(row['widget'], 'custom'))
+    values = flattenDict(row['values'])
+    for key, widget in widgets.get(name, {}).items():
+      if widget is None or key not in values:
         continue
-    self.logger.log(5,
-                   "_position_widget: widget in column %d spanning %d columns",
-                   col,colspan)
-    return col, colspan
+      value = values[key]
+      blocked = widget.blockSignals(True)
+      if row['widget'] == 'label':
+        if value:
+          text = row.get('format', "%s") % value
+        else:
+          text = "None"
+        if widget.text() != text:
+          widget.setText(text)
+      elif row['widget'] == 'check':
+        if value is not None:
+          widget.setChecked(value)
+      elif row['widget'] == 'push':
+        if value is not None:
+          widget.setText(value)
+      elif row['widget'] == 'dial':
+        if value is not None:
+          widget.setRealValue(value)
+      elif row['widget'] == 'switch':
+        widget.inputs = row['labels']
+        if value != 'None':
+          self._set_switch_button_text(widget, value,
+                                       row.get('label_template', "Input "))
+      elif row['widget'] in ('spinslider', 'spinbox'):
+        if value is not None:
+          widget.setValue(value)
+      widget.blockSignals(blocked)
+
+  def _clear_grid(self):
+    """
+    Delete all the widgets in the grid
+    """
+    while self.gridLayout.count():
+      item = self.gridLayout.takeAt(0)
+      if item.widget():
+        item.widget().deleteLater()
+
+  def set_value(self, rowname, key, value):
+    """
+    Show a new value in one label of a label row
+
+    @param rowname : name of the row
+    @type  rowname : str
+
+    @param key : column key of the label
+    @type  key : tuple
+
+    @param value : new value
+    """
+    label = self.labels.get(rowname, {}).get(key)
+    if label is None:
+      self.logger.warning("set_value: row %s has no label %s", rowname, key)
+      return
+    if value:
+      format = "%s"
+      for row in self.rows:
+        if row['name'] == rowname:
+          format = row.get('format', "%s")
+          break
+      label.setText(format % value)
+    else:
+      label.setText("None")
 
   def make_label_row(self, row, row_name, dictionary, **kwargs):
     """
@@ -511,6 +735,7 @@ class ControlPanelGriddedFrame(QtWidgets.QFrame):
     @param action : method to invoke on state change
     @type  action : dict of functions
     """
+    from MCClient.GUI.Qt_widgets.general_dial import GeneralDial
     rowLabel = QtGui.QLabel(row_name)
     self.gridLayout.addWidget(rowLabel, row, 0, 1, 1,
                               QtCore.Qt.AlignLeft|QtCore.Qt.AlignTop)
@@ -606,6 +831,7 @@ class ControlPanelGriddedFrame(QtWidgets.QFrame):
     Note that 'step' does not follow the Python convention but the
     QSpinBox convention.
     """
+    from MCClient.GUI.Qt_widgets.spinslider import SpinSlider
     rowLabel = QtGui.QLabel(row_name)
     self.gridLayout.addWidget(rowLabel, row, 0, 1, 1,
                               QtCore.Qt.AlignLeft|QtCore.Qt.AlignTop)
@@ -756,6 +982,7 @@ class ControlPanelGriddedFrame(QtWidgets.QFrame):
     @type  args : tuple of ints
     """
     self.logger.debug(" _switch_popup: invoked with %s",str(args))
+    from MCClient.GUI.Qt_widgets.selector_popup import Selector_Form
     frame, rowname, key, switch, condition = args
     self.logger.debug(" _switch_popup: switch is %s", switch)
     selector = Selector_Form(key, parent=self)
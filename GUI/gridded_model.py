@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+Model/view version of the gridded monitor and control panel
+
+ControlPanelGriddedFrame makes one Qt widget for every cell and makes them
+all again when the UI is rebuilt.  ControlPanelGriddedView takes the same
+'rows' specification but keeps the values in a ControlPanelTableModel and
+draws the cells with a delegate.  Only the visible cells are painted, and
+changing a value is a model dataChanged emission instead of a widget update.
+
+Cells by row type::
+  label      - formatted text
+  check      - check box; toggling it invokes the row action
+  push       - painted button; clicking it invokes the row action
+  dial       - number; double-click edits it with a spinbox and invokes the
+               row action with the dial integer, as GeneralDial would
+  switch     - painted button showing the selected input; clicking it emits
+               the view's switchClicked signal, which should be connected to
+               the view's _switch_popup()
+  spinslider - integer edited with a spinbox
+  spinbox    - integer edited with a spinbox
+  custom     - the widget is created and put in the cell with setIndexWidget
+
+The actions are called with the same arguments as those of the widget rows,
+i.e. (view, row name) + column key + (value,).
+"""
+from PyQt5 import QtCore, QtGui, QtWidgets
+import logging
+
+from support.dicts import flattenDict
+from MCClient.board_registry import natural_key
+from MCClient.GUI import ColumnLayout, StateBinding
+from MCClient.GUI.Qt_widgets import slotgen
+
+module_logger = logging.getLogger(__name__)
+
+EDITED = ('dial', 'spinslider', 'spinbox')
+BUTTONS = ('push', 'switch')
+
+class ControlPanelTableModel(ColumnLayout, QtCore.QAbstractTableModel):
+  """
+  Table model built from a ControlPanelGriddedFrame rows specification
+
+  Public attributes::
+    cells  - for each row, dict of [key, value, colspan] indexed by column
+    logger - logger for this instance
+    rows   - the rows specification
+  """
+  def __init__(self, rows, parent=None):
+    """
+    @param rows : ordered list of row specifications
+    @type  rows : list of dict
+
+    @param parent : the view which shows the model
+    @type  parent : ControlPanelGriddedView instance
+    """
+    QtCore.QAbstractTableModel.__init__(self, parent)
+    self.logger = logging.getLogger(__name__+".ControlPanelTableModel")
+    self.view = parent
+    self.load(rows)
+
+  @property
+  def boards(self):
+    """
+    The BoardRegistry of the object which made the view
+    """
+    return getattr(getattr(self.view, 'parent', None), 'boards', None)
+
+  def load(self, rows):
+    """
+    (Re)build the cells from a rows specification
+    """
+    self.beginResetModel()
+    self.rows = rows
+    self.columnize(rows)
+    self.row_number = {}
+    self.cells = []
+    self.key_column = []
+    for rownum, row in enumerate(rows):
+      self.row_number[row['name']] = rownum
+      self.cells.append(self._make_cells(row))
+      self.key_column.append(
+        dict((cell[0], col) for col, cell in self.cells[-1].items()))
+    self.endResetModel()
+
+  def _make_cells(self, row):
+    flatdict = flattenDict(row['values'])
+    keys = sorted(flatdict.keys(), key=lambda k: tuple(natural_key(i)
+                                                       for i in k))
+    cells = {}
+    col = 1
+    if keys:
+      keylen = len(keys[0])
+      for key in keys:
+        col, colspan = self._position_widget(key, keylen, col)
+        cells[col] = [key, flatdict[key], colspan]
+        col += colspan
+    return cells
+
+  def spans(self):
+    """
+    Generator of (row, column, colspan) for cells wider than one column
+    """
+    for rownum, cells in enumerate(self.cells):
+      for col, cell in cells.items():
+        if cell[2] > 1:
+          yield rownum, col, cell[2]
+
+  # ------------------------- QAbstractTableModel ---------------------------
+
+  def rowCount(self, parent=QtCore.QModelIndex()):
+    return len(self.rows)
+
+  def columnCount(self, parent=QtCore.QModelIndex()):
+    return len(self.highest_depth_keys) + 1
+
+  def cell(self, index):
+    return self.cells[index.row()].get(index.column())
+
+  def text(self, row, value):
+    """
+    Text shown for a cell value
+    """
+    if value is None or value == 'None':
+      return "None"
+    widget = row['widget']
+    if widget == 'switch':
+      labels = row.get('labels') or []
+      try:
+        if labels[value]:
+          return str(labels[value])
+      except (IndexError, KeyError, TypeError):
+        pass
+      return row.get('label_template', "Input ")+str(value)
+    if widget in ('push', 'check'):
+      return "On" if widget == 'check' else str(value)
+    if 'format' in row:
+      try:
+        return row['format'] % value
+      except TypeError:
+        pass
+    return str(value)
+
+  def data(self, index, role=QtCore.Qt.DisplayRole):
+    row = self.rows[index.row()]
+    if index.column() == 0:
+      if role == QtCore.Qt.DisplayRole:
+        return row['name']
+      return None
+    cell = self.cell(index)
+    if cell is None:
+      return None
+    key, value, colspan = cell
+    if role == QtCore.Qt.DisplayRole:
+      if row['widget'] == 'custom':
+        return None
+      return self.text(row, value)
+    if role == QtCore.Qt.EditRole:
+      return value
+    if role == QtCore.Qt.CheckStateRole and row['widget'] == 'check':
+      if value is None:
+        return None
+      return QtCore.Qt.Checked if value else QtCore.Qt.Unchecked
+    if role == QtCore.Qt.TextAlignmentRole:
+      return QtCore.Qt.AlignHCenter|QtCore.Qt.AlignVCenter
+    return None
+
+  def flags(self, index):
+    if index.column() == 0:
+      return QtCore.Qt.ItemIsEnabled
+    cell = self.cell(index)
+    if cell is None:
+      return QtCore.Qt.NoItemFlags
+    if cell[1] is None:
+      return QtCore.Qt.NoItemFlags
+    flags = QtCore.Qt.ItemIsEnabled
+    widget = self.rows[index.row()]['widget']
+    if widget == 'check':
+      flags |= QtCore.Qt.ItemIsUserCheckable
+    elif widget in EDITED:
+      flags |= QtCore.Qt.ItemIsEditable
+    return flags
+
+  def setData(self, index, value, role=QtCore.Qt.EditRole):
+    """
+    Called when the user changes a cell; invokes the row action
+    """
+    cell = self.cell(index)
+    if cell is None:
+      return False
+    row = self.rows[index.row()]
+    key = cell[0]
+    if role == QtCore.Qt.CheckStateRole and row['widget'] == 'check':
+      state = (value == QtCore.Qt.Checked)
+      cell[1] = state
+      self.dataChanged.emit(index, index)
+      row['action'](*((self.view, row['name'])+key+(state,)))
+      return True
+    if role == QtCore.Qt.EditRole and row['widget'] in EDITED:
+      cell[1] = value
+      self.dataChanged.emit(index, index)
+      if row['widget'] == 'dial':
+        # dial actions get the dial integer
+        convert_from = row['converters'][0]
+        row['action'](*((self.view, row['name'])+key+(convert_from(value),)))
+      else:
+        row['action'](*((self.view, row['name'])+key+(value, value)))
+      return True
+    return False
+
+  def activate(self, index):
+    """
+    Called when a button cell is clicked
+    """
+    cell = self.cell(index)
+    if cell is None or cell[1] is None:
+      return
+    row = self.rows[index.row()]
+    if row['widget'] == 'push':
+      row['action'](*((self.view, row['name'])+cell[0]+(False,)))
+    elif row['widget'] == 'switch':
+      self.view.switchClicked.emit(row['name'], cell[0])
+
+  # ------------------------------ updates ----------------------------------
+
+  def set_value(self, rowname, key, value):
+    """
+    Change the value of one cell
+
+    @param rowname : name of the row
+    @type  rowname : str
+
+    @param key : column key of the cell, as in the widget rows
+    @type  key : tuple
+
+    @param value : new value
+    """
+    rownum = self.row_number[rowname]
+    col = self.key_column[rownum].get(key)
+    if col is None:
+      self.logger.warning("set_value: row %s has no column %s", rowname, key)
+      return
+    self.cells[rownum][col][1] = value
+    index = self.index(rownum, col)
+    self.dataChanged.emit(index, index)
+
+  def set_values(self, rowname, values):
+    """
+    Change all the values in a row with one dataChanged emission
+
+    @param rowname : name of the row
+    @type  rowname : str
+
+    @param values : nested dict like the one in the row specification
+    @type  values : dict
+    """
+    rownum = self.row_number[rowname]
+    columns = self.key_column[rownum]
+    for key, value in flattenDict(values).items():
+      col = columns.get(key)
+      if col is not None:
+        self.cells[rownum][col][1] = value
+    self.dataChanged.emit(self.index(rownum, 1),
+                          self.index(rownum, self.columnCount()-1))
+
+class ControlPanelDelegate(QtWidgets.QStyledItemDelegate):
+  """
+  Paints buttons and provides editors for the numeric cells
+  """
+  def paint(self, painter, option, index):
+    model = index.model()
+    if index.column() and model.rows[index.row()]['widget'] in BUTTONS:
+      button = QtWidgets.QStyleOptionButton()
+      button.rect = option.rect.adjusted(2, 2, -2, -2)
+      button.text = index.data()
+      button.state = QtWidgets.QStyle.State_Raised
+      if index.flags() & QtCore.Qt.ItemIsEnabled:
+        button.state |= QtWidgets.QStyle.State_Enabled
+      QtWidgets.QApplication.style().drawControl(
+                             QtWidgets.QStyle.CE_PushButton, button, painter)
+    else:
+      QtWidgets.QStyledItemDelegate.paint(self, painter, option, index)
+
+  def createEditor(self, parent, option, index):
+    row = index.model().rows[index.row()]
+    if row['widget'] == 'dial':
+      editor = QtWidgets.QDoubleSpinBox(parent)
+      low, high = row['range']
+      convert_to = row['converters'][1]
+      editor.setRange(low, high)
+      editor.setSingleStep(convert_to(1) - convert_to(0) or 1)
+      editor.setDecimals(1)
+      return editor
+    if row['widget'] in ('spinslider', 'spinbox'):
+      editor = QtWidgets.QSpinBox(parent)
+      limits = row.get('range')
+      if limits:
+        editor.setRange(limits[0], limits[1])
+        if len(limits) > 2:
+          editor.setSingleStep(limits[2])
+      else:
+        editor.setRange(0, 2000)
+      return editor
+    return QtWidgets.QStyledItemDelegate.createEditor(self, parent,
+                                                      option, index)
+
+  def setEditorData(self, editor, index):
+    value = index.data(QtCore.Qt.EditRole)
+    if isinstance(editor, (QtWidgets.QSpinBox, QtWidgets.QDoubleSpinBox)):
+      editor.setValue(value)
+    else:
+      QtWidgets.QStyledItemDelegate.setEditorData(self, editor, index)
+
+  def setModelData(self, editor, model, index):
+    if isinstance(editor, (QtWidgets.QSpinBox, QtWidgets.QDoubleSpinBox)):
+      editor.interpretText()
+      model.setData(index, editor.value())
+    else:
+      QtWidgets.QStyledItemDelegate.setModelData(self, editor, model, index)
+
+class ControlPanelGriddedView(StateBinding, QtWidgets.QTableView):
+  """
+  Gridded monitor and control panel drawn from a table model
+
+  This takes the same arguments as ControlPanelGriddedFrame.  Instead of
+  widget dictionaries like 'labels' it has set_value() and set_values().
+
+  Public attributes::
+    custom        - widgets of the custom rows, indexed by row name and key
+    logger        - logger for this instance
+    table_model   - ControlPanelTableModel instance
+    parent        - the object which instantiated this class
+    switchClicked - signal with the row name and key of a switch cell
+  """
+  switchClicked = QtCore.pyqtSignal(str, object)
+
+  def __init__(self, rows, parent=None):
+    """
+    @param rows : ordered list of data for row of widgets
+    @type  rows : list
+
+    @param parent : the object which instantiated this class
+    @type  parent : object
+    """
+    QtWidgets.QTableView.__init__(self)
+    self.logger = logging.getLogger(__name__+".ControlPanelGriddedView")
+    self.parent = parent
+    self.table_model = ControlPanelTableModel(rows, parent=self)
+    self.setModel(self.table_model)
+    self.setItemDelegate(ControlPanelDelegate(self))
+    self.horizontalHeader().hide()
+    self.verticalHeader().hide()
+    self.setEditTriggers(QtWidgets.QAbstractItemView.DoubleClicked |
+                         QtWidgets.QAbstractItemView.EditKeyPressed)
+    self.clicked.connect(self.table_model.activate)
+    self.custom = {}
+    self._layout_cells()
+
+  def _layout_cells(self):
+    """
+    Apply the column spans and place the custom widgets
+    """
+    self.clearSpans()
+    for rownum, col, colspan in self.table_model.spans():
+      self.setSpan(rownum, col, 1, colspan)
+    for rownum, row in enumerate(self.table_model.rows):
+      if row['widget'] != 'custom':
+        continue
+      self.custom[row['name']] = {}
+      cells = self.table_model.cells[rownum]
+      for col, (key, value, colspan) in cells.items():
+        widget = row['widgets'].get(value)
+        if widget:
+          self.custom[row['name']][key] = widget(self, key[0])
+          self.setIndexWidget(self.table_model.index(rownum, col),
+                              self.custom[row['name']][key])
+    self.resizeColumnToContents(0)
+
+  def load(self, rows):
+    """
+    Show a new rows specification
+    """
+    self.table_model.load(rows)
+    self._layout_cells()
+
+  @property
+  def rows(self):
+    return self.table_model.rows
+
+  def set_value(self, rowname, key, value):
+    self.table_model.set_value(rowname, key, value)
+
+  def _switch_popup(self, rowname, key):
+    """
+    Pop up the selector for a switch cell, as the frame's buttons do
+
+    The selector calls parent.switch_changed() with the new state and shows
+    it with _set_switch_button_text().
+
+    @param rowname : name of the switch row
+    @type  rowname : str
+
+    @param key : column key of the cell
+    @type  key : tuple
+    """
+    from MCClient.GUI.Qt_widgets.selector_popup import Selector_Form
+    rowname = str(rowname)
+    row = self.rows[self.table_model.row_number[rowname]]
+    selector = Selector_Form(key, parent=self)
+    selector.switch = (rowname, key)
+    selector.setupUi(row.get('labels') or [], label_default="Port", cols=2)
+    selector.setWindowTitle("IF selection")
+    selector.show()
+    selector.signal.stateChanged.connect(
+          slotgen((selector,key,rowname), selector.update_selector))
+    self.logger.debug("_switch_popup: selector for %s %s", rowname, key)
+
+  def _set_switch_button_text(self, switch, state, button_template=None,
+                              text=None):
+    """
+    Show a selector's new state in its cell
+
+    @param switch : (row name, key) of the cell
+    @type  switch : tuple
+    """
+    if state is not None and state > -1:
+      self.table_model.set_value(switch[0], switch[1], state)
+
+  def set_values(self, rowname, values):
+    self.table_model.set_values(rowname, values)
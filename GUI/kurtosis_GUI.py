@@ -6,6 +6,8 @@ from PyQt4 import QtCore, QtGui
 import logging
 
 from Qt_widgets import slotgen, slot_wrapper
+from MCClient.rates import format_rate
+from MCClient.tracing import traced
 
 module_logger = logging.getLogger(__name__)
 
@@ -87,7 +89,7 @@ class Ui_kurtosisMC(QtGui.QFrame):
         self.logger.debug("Ui_kurtosisMC column = %s",column)
         self.parent = parent
         self.column = column
-        self.roachname = 'roach'+str(column+1)
+        self.roachname = parent.parent.boards.name(column)
         self.setupUi(parent)
         self.refresh_UI()
 
@@ -274,6 +276,10 @@ class Ui_kurtosisMC(QtGui.QFrame):
         spec_count = register_vals['spec_count']
         self.integsValue.setText(str(spec_count))
         self.integsLayout.addWidget(self.integsValue)
+        self.integsRate = QtGui.QLabel(self.integsLayoutWidget)
+        self.integsRate.setToolTip("Integrations per second")
+        self.integsRate.setAlignment(QtCore.Qt.AlignRight)
+        self.integsLayout.addWidget(self.integsRate)
         left_layout.addWidget(self.integsLayoutWidget)
         #----------------------------------------------------------------------
         self.totalCountLayoutWidget = QtGui.QWidget(kurtosisMC)
@@ -291,6 +297,10 @@ class Ui_kurtosisMC(QtGui.QFrame):
         self.pktCntValue.setMaxLength(10)
         self.pktCntValue.setReadOnly(True)
         self.totalCountLayout.addWidget(self.pktCntValue)
+        self.pktCntRate = QtGui.QLabel(self.totalCountLayoutWidget)
+        self.pktCntRate.setToolTip("Packets or FPGA clock ticks per second")
+        self.pktCntRate.setAlignment(QtCore.Qt.AlignRight)
+        self.totalCountLayout.addWidget(self.pktCntRate)
         right_layout.addWidget(self.totalCountLayoutWidget)
         #----------------------------------------------------------------------
         cntTypeLayoutWidget = QtGui.QWidget(kurtosisMC)
@@ -378,6 +388,11 @@ class Ui_kurtosisMC(QtGui.QFrame):
         tx_pkt_cnt = register_vals['gbe0_tx_cnt']
         self.gbe0pktCntValue.setText(str(tx_pkt_cnt))
         self.gbePktCntLayout.addWidget(self.gbe0pktCntValue)
+        self.gbe0pktRate = QtGui.QLabel(self.gbePktCntWidget)
+        self.gbe0pktRate.setToolTip(
+                  "Packets sent per second and estimated packets lost per second")
+        self.gbe0pktRate.setAlignment(QtCore.Qt.AlignRight)
+        self.gbePktCntLayout.addWidget(self.gbe0pktRate)
         right_layout.addWidget(self.gbePktCntWidget)
         #----------------------------------------------------------------------
         gbe0sourceWidget = QtGui.QWidget(kurtosisMC)
@@ -399,6 +414,20 @@ class Ui_kurtosisMC(QtGui.QFrame):
 
         #QtCore.QMetaObject.connectSlotsByName(kurtosisMC)
 
+    def show_rates(self, rates):
+        """
+        Shows the smoothed counter rates
+
+        @param rates : counts/s by counter name, and 'drops'
+        @type  rates : dict
+        """
+        self.integsRate.setText(format_rate(rates['spec_count']))
+        self.pktCntRate.setText(format_rate(rates['raw_pkt_cnt_out']))
+        self.gbe0pktRate.setText("%s, lost %s" %
+                                 (format_rate(rates['gbe0_tx_cnt']),
+                                  format_rate(rates['drops'])))
+
+    @traced("gui")
     def refresh_gbe0(self):
         """
         Gets the 10 GbE port 0 status and sets the radiobuttons
@@ -410,11 +439,18 @@ class Ui_kurtosisMC(QtGui.QFrame):
         request = "self.roaches['"+self.roachname+"'].get_gbe0_states()"
         gbe0_state = server.request(request)
         self.logger.debug("refresh_gbe0: gbe0 state = %s", gbe0_state)
+        self.show_gbe0(gbe0_state)
+
+    def show_gbe0(self, gbe0_state):
+        """
+        Sets the 10 GbE port 0 radiobuttons
+        """
         self.gbe0linkCheck.setChecked(bool(gbe0_state['linkup']))
         self.gbe0xmitCheck.setChecked(bool(gbe0_state['tx']))
         self.gbe0fullCheck.setChecked(bool(gbe0_state['full']))
         self.gbe0oflowCheck.setChecked(bool(gbe0_state['over']))
 
+    @traced("gui")
     def refresh_UI(self):
         """
         Update the Ui_kurtosisMC widget
@@ -441,11 +477,11 @@ class Ui_kurtosisMC(QtGui.QFrame):
         roachID = self.column
         frame = self.parent
         client = self.parent.parent
-        server = client.mgr
 
-        roachname = "roach"+str(roachID+1)
-        self.parent.parent.get_register_values(roachname)
-        register_vals = self.parent.parent.register_values[roachname]
+        roachname = self.roachname
+        # registers and gbe0 states in one request
+        status = client.logic.panel_status(roachname)
+        register_vals = status['registers']
         self.logger.debug("refresh_UI: ROACH %d register values: %s",
                           roachID, register_vals)
 
@@ -475,7 +511,7 @@ class Ui_kurtosisMC(QtGui.QFrame):
         pkt_cnt_rst_ctrl = register_vals['raw_pkt_cnt_rst_ctrl']
         self.rawCountResetGroup.buttons[pkt_cnt_rst_ctrl].setChecked(True)
         
-        self.refresh_gbe0()
+        self.show_gbe0(status['gbe0'])
 
         tx_pkt_cnt = register_vals['gbe0_tx_cnt']
         self.gbe0pktCntValue.setText(str(tx_pkt_cnt))
@@ -18,13 +18,17 @@ from MonitorControl.BackEnds.ROACH1 import logpath
 from MonitorControl.clients.Roach1.ManagerClient import ManagerClient
 from MonitorControl.clients.Roach1.GUI import ControlPanelGriddedFrame
 from MonitorControl.clients.Roach1.GUI.kurtosis_GUI import Ui_kurtosisMC
+from MonitorControl.clients.Roach1.GUI.gridded_model import \
+                                                      ControlPanelGriddedView
 from Qt_widgets import SignalMaker
 from Qt_widgets import create_action, add_actions, create_option_menu
 from Qt_widgets.TabbedWindow import TabbedWindow
-from Qt_widgets.TabbedPlotWindow import TabbedPlotWindow, MPLplotter
+from Qt_widgets.TabbedPlotWindow import TabbedPlotWindow, MPLplotter, \
+                                         WaterfallPlotter, PLOT_BACKENDS
 from support.pyro import cleanup_tunnels
 from support.dicts import flattenDict
 from support.logs import init_logging, get_loglevel, set_loglevel
+from MCClient.tracing import span, traced, instant
 
 module_logger = logging.getLogger(__name__)
 
@@ -50,11 +54,14 @@ class MySignaller(SignalMaker):
   signalChanged is emitted when 'update_RF_state' is called and
   .                        when 'switch_changed'  is called for IF row
   fwChanged     is emitted when 'switch_changed'  is called for firmware row
+  optimizeProgress is emitted after each round of 'optimize_all_RF' with
+  .                the number of inputs done and the number of inputs
   """
   gainChanged   = QtCore.pyqtSignal(object,str,tuple,float,name='gainChanged')
   signalChanged = QtCore.pyqtSignal(object,str,tuple,float,
                                     name='signalChanged')
   fwChanged     = QtCore.pyqtSignal(object,str,tuple,str,name='fwChanged')
+  optimizeProgress = QtCore.pyqtSignal(int,int,name='optimizeProgress')
 
 module_logger.debug(" MySignaller defined")
 
@@ -120,9 +127,9 @@ class ActionConfiguration(ManagerClient):
 
   def initUIs(self):
     self.logger.debug("Firmware is %s", self.firmware)
-    if (self.firmware['roach1'] and self.firmware['roach1'] != "Unknown") or \
-       (self.firmware['roach2'] and self.firmware['roach2'] != "Unknown"):
-      #  I'm assuming for expedience that the firmware state of both ROACH
+    known = [fw for fw in self.firmware.values() if fw and fw != "Unknown"]
+    if known:
+      #  I'm assuming for expedience that the firmware state of all ROACH
       # boards is the same
       self.initUIs_w_fw()
     else:
@@ -212,10 +219,12 @@ class ActionConfiguration(ManagerClient):
         {'widget': 'label',
          'name': 'Ambient Temp. (C)',
          'values': self.amb_temps,
+         'state': ('amb_temps',),
          'format': "%5.2f"},
         {'widget': 'label',
          'name': 'ADCchip Temp.',
          'values': self.chip_temps,
+         'state': ('chip_temps',),
          'format': "%5.2f"},
         {'widget': 'label',
          'name': 'RF',
@@ -227,12 +236,14 @@ class ActionConfiguration(ManagerClient):
         {'widget': 'label',
          'name': 'Gain (dB)',
          'values': self.gain,
+         'state': ('gain',),
          'format': "%5.1f",
          'slots': [[self.signal.gainChanged, self.update_gain_labels],
                    [self.signal.signalChanged, self.refresh_RF_labels]]},
         {'widget': 'label',
          'name': 'RF level (dBm)',
          'values': self.ADC_levels,
+         'state': ('ADC_levels',),
           'format': "%5.2f",
           'slots': [[self.signal.signalChanged, self.refresh_RF_labels]]},
       ]
@@ -268,12 +279,14 @@ class ActionConfiguration(ManagerClient):
         {'widget': 'label',
          'name': 'Gain (dB)',
          'values': self.gain,
+         'state': ('gain',),
          'format': "%5.1f",
          'slots': [[self.signal.gainChanged, self.update_gain_labels],
                    [self.signal.signalChanged, self.refresh_RF_labels]]},
         {'widget': 'label',
          'name': 'RF level (dBm)',
          'values': self.ADC_levels,
+         'state': ('ADC_levels',),
           'format': "%5.2f",
           'slots': [[self.signal.signalChanged, self.refresh_RF_labels]]},
         {'widget': 'push',
@@ -305,7 +318,8 @@ class ActionConfiguration(ManagerClient):
          'values': self.fan_labels},
         {'widget': 'label',
          'name': 'RPM',
-         'values': self.fan_rpm},
+         'values': self.fan_rpm,
+         'state': ('fan_rpm',)},
         {'widget': 'label',
          'name': 'MMS Opt.',
          'values': self.MMS_opt_lbl},
@@ -319,11 +333,13 @@ class ActionConfiguration(ManagerClient):
       ]
     self.rows['Board'] = self._append_rows(self.rows['Board'],
                                            'label',
-                                           self.temps)
+                                           self.temps,
+                                           state='MMS_temps')
     self.rows['Board'] = self._append_rows(self.rows['Board'],
                                            'label',
                                            self.volts,
-                                           format="%5.2f")
+                                           format="%5.2f",
+                                           state='MMS_volts')
     # -------------------------- Firmware Tab ------------------------------
     self.rows['Firmware'] = [
         {'widget': 'label',
@@ -335,12 +351,16 @@ class ActionConfiguration(ManagerClient):
          'widgets': firmware_widgets}
       ]
     
-  def _append_rows(self,row_dict, row_type, values, format="%6.1f"):
+  def _append_rows(self,row_dict, row_type, values, format="%6.1f",
+                   state=None):
     for key in values.keys():
-      row_dict.append({'widget': row_type,
-                       'name':   key,
-                       'values': values[key],
-                       'format': format})
+      row = {'widget': row_type,
+             'name':   key,
+             'values': values[key],
+             'format': format}
+      if state:
+        row['state'] = (state, key)
+      row_dict.append(row)
     return row_dict
     
   def initUIs_wo_fw(self):
@@ -388,7 +408,8 @@ class ActionConfiguration(ManagerClient):
          'values': self.fan_labels},
         {'widget': 'label',
          'name': 'RPM',
-         'values': self.fan_rpm},
+         'values': self.fan_rpm,
+         'state': ('fan_rpm',)},
         {'widget': 'label',
          'name': 'MMS Opt.',
          'values': self.MMS_opt_lbl},
@@ -399,10 +420,12 @@ class ActionConfiguration(ManagerClient):
       ]
     self.rows['Board'] = self._append_rows(self.rows['Board'],
                                            'label',
-                                           self.temps)
+                                           self.temps,
+                                           state='MMS_temps')
     self.rows['Board'] = self._append_rows(self.rows['Board'],
                                            'label',
-                                           self.volts)
+                                           self.volts,
+                                           state='MMS_volts')
     # -------------------------- Firmware Tab ------------------------------
     self.rows['Firmware'] = [
         {'widget': 'label',
@@ -433,7 +456,7 @@ class ActionConfiguration(ManagerClient):
           frame.checkbuttons[rowname][(roach,ADC,RF)].isChecked())
     self.set_RF(roach, adc=ADC, inp=RF, enabled=state)
     self.refresh_gain()              # updates self.gain
-    r_index = self.roach_keys.index(roach)
+    r_index = self.boards.index[roach]
     column = (r_index,ADC,RF)
     self.logger.debug("update_RF_state: emitting signalChanged for %s, %s, %s",
                       rowname, column, self.ADC_levels[r_index][ADC][RF])
@@ -446,21 +469,13 @@ class ActionConfiguration(ManagerClient):
 
   def update_RF_labels(self):
     """
+    Show the current RF levels
+
+    The 'RF level' rows are bound to the state store, so only the labels
+    whose level changed are redrawn.
     """
-    levels = flattenDict(self.ADC_levels)
-    for key in levels.keys():
-      #roach = key[0]
-      #adc = key[1]
-      #rf = key[2]
-      #self.ADC_levels[key[0]][key[1]][key[2]] = levels[key]
-      #self.ADC_levels[roach][adc][rf] = levels[key]
-      self.frames['Overview'].labels["RF level (dBm)"][key].setText(
-        ("%5.2f" % levels[key]) )
-      self.frames['Signals'].labels["RF level (dBm)"][key].setText(
-        ("%5.2f" % levels[key]) )
-      self.logger.debug(
-             "refresh_RF_labels: Changed row 'RF level' column %s value to %s",
-             key,levels[key])
+    changed = self.state.update(('ADC_levels',), self.ADC_levels)
+    self.logger.debug("update_RF_labels: %d levels changed", changed)
   
   def refresh_RF_labels(self,*args):
     """
@@ -496,7 +511,7 @@ class ActionConfiguration(ManagerClient):
     key = args[1]
     value = args[2]
     self.logger.debug('update_RF_label: key = %s, value = %f', key, value)
-    self.ADC_levels[key[0]][key[1]][key[2]] = value
+    self.rf.set('level', key[0], key[1], key[2], value)
     self.central_frame.labels["RF level"][key].setText(("%5.2f" % value))
     self.logger.debug(
               "update_RF_label: Changed row 'RF level' column %s value to %s",
@@ -537,10 +552,10 @@ class ActionConfiguration(ManagerClient):
     frame,row,column,value = args
     self.logger.debug('update_gain_labels: key = %s', column)
     self.logger.debug('update_gain_labels: old gains: %s', self.gain)
-    self.gain[column[0]][column[1]][column[2]] = value
+    self.rf.set('gain', column[0], column[1], column[2], value)
     self.logger.debug('update_gain_labels: new gains: %s', self.gain)
-    self.frames['Overview'].labels['Gain (dB)'][column].setText(str(value))
-    self.frames['Signals'].labels['Gain (dB)'][column].setText(str(value))
+    # the bound 'Gain (dB)' rows follow the store
+    self.state.set(('gain',)+tuple(column), value)
       
   def gainToInt(self,gain):
     """
@@ -595,9 +610,9 @@ class ActionConfiguration(ManagerClient):
                                      self.ADC_levels[R][ADC][RF])
       
     elif rowname == 'Firmware':
-      index = column_ID[0]
+      index = self.boards.name(column_ID[0])
       new_firmware_key = switch.state
-      self.logger.debug("switch_changed: Firmware index %s is changed to %s",
+      self.logger.debug("switch_changed: Firmware of %s is changed to %s",
                      index, new_firmware_key)
       self.firmware[index] = self.firmware_keys[new_firmware_key]
       self.boffiles[index] = self.load_firmware(index,self.firmware[index])
@@ -606,7 +621,7 @@ class ActionConfiguration(ManagerClient):
       self.signal.fwChanged.emit(switch.parent,'Bit File', column_ID,
                                  self.boffiles[index])
       self.logger.debug("switched_changed: signal fwChanged was emitted")
-      self.rebuildUI()
+      self.reconcileUI()
       
   def update_firmware_label(self,*args):
     """
@@ -615,13 +630,42 @@ class ActionConfiguration(ManagerClient):
     self.logger.debug('update_firmware_label: args = %s', args)
     frame, row, column, bitfile = args
     self.logger.debug('update_firmware_label: new text: %s',bitfile)
-    frame.labels[str(row)][column].setText(str(bitfile))
+    frame.set_value(str(row), column, bitfile)
 
   def optimize_RF(self,*args):
     """
+    Action for the 'Optimize Gain' buttons
+
+    The gain is set for the target ADC level by ManagerClient.optimize_RF().
+    The 'Gain (dB)' and 'RF level (dBm)' rows follow the state store.
     """
     self.logger.debug("optimize_RF: entered with %s", args)
-    self.logger.warning("optimize_RF: not yet implemented")
+    frame, row = args[:2]
+    roach, ADC, RF = args[2:5]
+    gain, level = ManagerClient.optimize_RF(self, roach, adc=ADC, inp=RF)
+    self.logger.debug("optimize_RF: ROACH %s ADC %d RF %d set to %.1f dB",
+                      roach, ADC, RF, gain)
+
+  def optimize_all(self):
+    """
+    Action for the 'Optimize all gains' menu button
+
+    The rounds run here, and events are processed between them to show the
+    progress, so the timed refresh is held and the controls are disabled
+    until the gains are set.
+    """
+    self.logger.debug("optimize_all: entered")
+    self.optimizing = True
+    self.central_frame.setEnabled(False)
+    self.menuBar().setEnabled(False)
+    try:
+      results = self.optimize_all_RF(
+                            progress=self.signal.optimizeProgress.emit)
+    finally:
+      self.optimizing = False
+      self.central_frame.setEnabled(True)
+      self.menuBar().setEnabled(True)
+    self.logger.info("optimize_all: %d inputs optimized", len(results))
 
   def set_clock(self,*args):
     """
@@ -636,24 +680,27 @@ class ActionConfiguration(ManagerClient):
     self.logger.debug("update_MMS_opt: entered with %s", args)
     self.logger.warning("update_MMS_state: not yet implemented")
 
+  @traced("gui")
   def update_spectra(self,roach):
     """
     """
     roachname = roach # self.roach_names[roach]
     self.logger.debug("update_spectra: entered for roach %s", roach)
+    r_index = self.boards.index[roach]
     for ADC in self.ADC_keys[roach]:
       for RF in self.RF_keys[roach][ADC]:
         # get the data
-        r_index = self.roach_keys.index(roach)
-        samples = self.get_ADC_samples(roach,ADC,RF)
-        accums = self.get_accums(r_index, ADC, RF)
+        with span("fetch", "gui", roach=roachname, adc=ADC, rf=RF):
+          samples = self.get_ADC_samples(roach,ADC,RF)
+          accums = self.get_accums(r_index, ADC, RF)
         if accums and type(samples) == numpy.ndarray:
           spectrum = accums[2]
           self.logger.debug("update_spectra: spectrum: %s", spectrum)
           if accums.has_key(4):
             kurtosis = accums[4]
             self.logger.debug("update_spectra: kurtosis: %s", kurtosis)
-          # generate the plots
+          # generate the plots; curves are updated in place
+          log = self.power_scale != "Linear"
           try:
             ADC_frame = self.tabbedPlotWindows[roachname].frames['ADC']
           except KeyError:
@@ -661,12 +708,10 @@ class ActionConfiguration(ManagerClient):
                           "update_spectra: there is no ADC plot window for %s",
                           roachname)
           else:
-            ADC_frame.axes[RF].cla()
-            ADC_frame.axes[RF].hist(samples, bins=21)
-            ADC_frame.axes[RF].grid()
-            if ADC_frame.titles:
-              ADC_frame.axes[RF].set_title(ADC_frame.titles[RF])
-            ADC_frame.canvas.draw()
+            with span("histogram", "plot"):
+              ADC_frame.histogram(RF, samples, bins=21)
+            with span("draw", "plot"):
+              ADC_frame.draw()
           try:
             overview_frame = \
                            self.tabbedPlotWindows[roachname].frames['Overview']
@@ -676,14 +721,8 @@ class ActionConfiguration(ManagerClient):
             overview_frame_exists = False
           else:
             overview_frame_exists = True
-            overview_frame.axes[RF+2].cla()
-            overview_frame.axes[RF+2].hist(samples, bins=21)
-            overview_frame.axes[RF+2].grid()
-            if RF == 0:
-              overview_frame.axes[0].cla()
-              overview_frame.axes[0].grid()
-              overview_frame.axes[1].cla()
-              overview_frame.axes[1].grid()
+            with span("histogram", "plot"):
+              overview_frame.histogram(RF+2, samples, bins=21)
           # power and kurtosis spectra
           try:
             pwr_frame = self.tabbedPlotWindows[roachname].frames['Power']
@@ -692,22 +731,23 @@ class ActionConfiguration(ManagerClient):
                                "update_spectra: there is no power plot for %s",
                                roachname)
           else:
-            pwr_frame.axes[RF].cla()
-            if self.power_scale == "Linear":
-              pwr_frame.axes[RF].plot(spectrum[1:])
-            else:
-              pwr_frame.axes[RF].semilogy(spectrum[1:])
-            pwr_frame.axes[RF].grid()
-            if pwr_frame.titles:
-              pwr_frame.axes[RF].set_title(pwr_frame.titles[RF])
-            pwr_frame.canvas.draw()
+            with span("plot", "plot"):
+              pwr_frame.curve(RF, "power", spectrum[1:], log=log)
+            with span("draw", "plot"):
+              pwr_frame.draw()
             if overview_frame_exists:
-              if self.power_scale == "linear":
-                overview_frame.axes[0].plot(spectrum[1:],
-                                            label=pwr_frame.titles[RF])
-              else:
-                overview_frame.axes[0].semilogy(spectrum[1:],
-                                            label=pwr_frame.titles[RF])
+              overview_frame.curve(0, pwr_frame.titles[RF], spectrum[1:],
+                                   log=log)
+          try:
+            waterfall_frame = \
+                          self.tabbedPlotWindows[roachname].frames['Waterfall']
+          except KeyError:
+            self.logger.debug("update_spectra: there is no waterfall for %s",
+                              roachname)
+          else:
+            # only the new row is scaled; the image is not re-rendered
+            with span("waterfall", "plot"):
+              waterfall_frame.axes[RF].add_spectrum(spectrum[1:], log=log)
         
           if accums.has_key(4):
             try:
@@ -717,25 +757,17 @@ class ActionConfiguration(ManagerClient):
                             "update_spectra: there is no kurtosis plot for %s",
                             roachname)
             else:
-              kurt_frame.axes[RF].cla()
-              kurt_frame.axes[RF].plot(kurtosis[1:])
-              kurt_frame.axes[RF].grid()
-              if kurt_frame.titles:
-                kurt_frame.axes[RF].set_title(kurt_frame.titles[RF])
-              kurt_frame.canvas.draw()
-            try:
-              overview_frame.axes[1].plot(kurtosis[1:],
-                                        label=kurt_frame.titles[RF])
-            except UnboundLocalError:
-              pass
-            else:
-              if overview_frame.titles:
-                for axID in overview_frame.axes.keys():
-                  overview_frame.axes[axID].set_title(
-                                                   overview_frame.titles[axID])
-              overview_frame.axes[0].legend()
-              overview_frame.axes[1].legend()
-              overview_frame.canvas.draw()
+              with span("plot", "plot"):
+                kurt_frame.curve(RF, "kurtosis", kurtosis[1:])
+              with span("draw", "plot"):
+                kurt_frame.draw()
+              if overview_frame_exists:
+                overview_frame.curve(1, kurt_frame.titles[RF], kurtosis[1:])
+          if overview_frame_exists:
+            overview_frame.legend(0)
+            overview_frame.legend(1)
+            with span("draw", "plot"):
+              overview_frame.draw()
         else:
           self.logger.error("update_spectra: no response from server")
           
@@ -777,18 +809,11 @@ class MPLsubplots(MPLplotter):
     """
     super(MPLsubplots,self).__init__()
     self.logger = logging.getLogger(__name__+".MPLsubplots")
-    self.titles = titles
-    num_subplots = rows*columns
-    self.axes = {}
+    self.add_subplots(rows, columns, titles)
     if fill:
-      x = range(100)
-      y = [random() for i in range(100)]
-    for i in range(num_subplots):
-      self.logger.debug("__init__: making subplot %d",i)
-      self.axes[i] = self.fig.add_subplot(rows,columns,i+1)
-      if fill:
-        self.lines = self.axes[i].plot(x,y)
-      self.logger.debug("__init__: axes: %s",str(self.axes))
+      for i in self.axes.keys():
+        self.curve(i, "random", [random() for j in range(100)])
+    self.logger.debug("__init__: axes: %s",str(self.axes))
     self.canvas.show()
 
 class MPLmanyaxes(MPLplotter):
@@ -809,27 +834,20 @@ class MPLmanyaxes(MPLplotter):
     """
     super(MPLmanyaxes,self).__init__()
     self.logger = logging.getLogger(__name__+".MPLmanyaxes")
-    num_subplots = len(bounds)
-    self.titles = titles
-    self.axes = {}
+    self.add_axes(bounds, titles)
     if fill:
-      x = np.arange(0, 10, 0.2)
-      y = np.sin(x)
-    for i in range(num_subplots):
-      self.logger.debug("__init__: making subplot %d",i)
-      coords = bounds[i]
-      box = [coords[0], coords[1], coords[2]-coords[0], coords[3]-coords[1]]
-      self.axes[i] = self.fig.add_axes(box)
-      if fill:
-        self.lines = self.axes[i].plot(x,y)
-      self.logger.debug("__init__: axes: %s",str(self.axes))
+      x = numpy.arange(0, 10, 0.2)
+      for i in self.axes.keys():
+        self.curve(i, "sine", numpy.sin(x), x=x)
+    self.logger.debug("__init__: axes: %s",str(self.axes))
     self.canvas.show()
 
 class MainWindow(QtGui.QMainWindow, ActionConfiguration):
   """
   Main window for testing ControlPanelGriddedFrame
   """
-  def __init__(self, parent=None):
+  def __init__(self, parent=None, grid_backend='widgets',
+               plot_backend='matplotlib'):
     """
     Create an instance main GUI
 
@@ -838,7 +856,15 @@ class MainWindow(QtGui.QMainWindow, ActionConfiguration):
 
     @param parent : needed by QMainWindow but typically None
     @type  parent : QWidget() instance
+
+    @param grid_backend : 'widgets' for ControlPanelGriddedFrame or 'model'
+                          for ControlPanelGriddedView
+    @type  grid_backend : str
+
+    @param plot_backend : key of PLOT_BACKENDS for the plot windows
+    @type  plot_backend : str
     """
+    self.grid_backend = grid_backend
     mylogger = logging.getLogger(module_logger.name+".MainWindow")
     mylogger.debug(" initializing")
     QtGui.QMainWindow.__init__(self, parent)
@@ -849,28 +875,58 @@ class MainWindow(QtGui.QMainWindow, ActionConfiguration):
     self.create_central_frame()
     self.create_status_bar()
     self.power_scale = 'Linear'
+    if plot_backend not in PLOT_BACKENDS:
+      self.logger.warning("__init__: no %s plots; using matplotlib",
+                          plot_backend)
+      plot_backend = 'matplotlib'
+    self.plot_backend = plot_backend
     self.tabbedPlotWindows = {}
+    self.optimizing = False
     self.timer = QtCore.QTimer()
 
   def create_central_frame(self):
+    if self.grid_backend == 'model':
+      Panel = ControlPanelGriddedView
+    else:
+      Panel = ControlPanelGriddedFrame
     self.frames = {
-      "Overview": ControlPanelGriddedFrame(self.rows['Overview'],
-                                           parent=self),
-      "Signals":  ControlPanelGriddedFrame(self.rows['Signals'],
-                                           parent=self),
-      "Board":    ControlPanelGriddedFrame(self.rows['Board'],
-                                           parent=self),
-      "Firmware": ControlPanelGriddedFrame(self.rows['Firmware'],
-                                           parent=self)}
+      "Overview": Panel(self.rows['Overview'], parent=self),
+      "Signals":  Panel(self.rows['Signals'],  parent=self),
+      "Board":    Panel(self.rows['Board'],    parent=self),
+      "Firmware": Panel(self.rows['Firmware'], parent=self)}
+    for frame in self.frames.values():
+      frame.bind_state(self.state)
+      if self.grid_backend == 'model':
+        # the frame's switch buttons open the selector themselves
+        frame.switchClicked.connect(frame._switch_popup)
     self.central_frame = TabbedWindow(self.frames,
                                      ["Overview","Signals","Board","Firmware"])
     self.setCentralWidget(self)
 
   def rebuildUI(self):
+    for frame in self.frames.values():
+      frame.unbind_state()
     self.central_frame.close()
     self.initUIs() # to redefine self.rows
     self.create_central_frame()
 
+  def reconcileUI(self):
+    """
+    Bring the panels up to date after a firmware change
+
+    The new rows from initUIs() are applied to the existing panels so that
+    the widgets, their connections, the selected tab and any plot windows
+    are kept.
+    """
+    self.initUIs() # to redefine self.rows
+    for tab in self.frames.keys():
+      frame = self.frames[tab]
+      if hasattr(frame, 'reconcile'):
+        frame.reconcile(self.rows[tab])
+      else:
+        frame.load(self.rows[tab])
+      frame.bind_state(self.state)
+
   def create_menubar(self):
     """
     Create the menu bar for the main window
@@ -906,11 +962,25 @@ class MainWindow(QtGui.QMainWindow, ActionConfiguration):
                        "Power &Scale",
                        self.set_power_scale,
                        ["Linear","Logarithmic"])
+    create_option_menu(self,
+                       self.config_menu,
+                       "Plot &backend",
+                       self.set_plot_backend,
+                       sorted(PLOT_BACKENDS.keys()))
+    create_option_menu(self,
+                       self.config_menu,
+                       "Plot s&napshot",
+                       self.save_plot_snapshot,
+                       self.roach_keys)
     create_option_menu(self,
                        self.config_menu,
                        "&Refresh timer",
                        self.timer_action,
                        ["Start", "Stop"])
+    optimize_action = create_action(self, "&Optimize all gains",
+            slot=self.optimize_all,
+            tip="Set all the RF gains for the target ADC level")
+    add_actions(self.config_menu, (None, optimize_action))
     # The help menu
     self.help_menu = self.menuBar().addMenu("&Help")
     about_action = create_action(self,"&About",
@@ -934,6 +1004,7 @@ class MainWindow(QtGui.QMainWindow, ActionConfiguration):
     for roach in self.tabbedPlotWindows.keys():
       self.logger.debug("Closing plot window for %s", roach)
       self.tabbedPlotWindows[roach].close()
+    self.close_rpc_log()
     self.close()
 
   def create_status_bar(self):
@@ -942,6 +1013,15 @@ class MainWindow(QtGui.QMainWindow, ActionConfiguration):
     """
     self.status_text = QtGui.QLabel("Welcome to the DTO Manager Client")
     self.statusBar().addWidget(self.status_text, 1)
+    self.signal.optimizeProgress.connect(self.show_optimize_progress)
+
+  def show_optimize_progress(self, done, total):
+    """
+    Slot for the signal 'optimizeProgress'
+    """
+    self.status_text.setText("Optimizing gains: %d of %d inputs done" %
+                             (done, total))
+    QtGui.QApplication.processEvents()
 
   def set_loglevel(self, option):
     """
@@ -970,30 +1050,70 @@ class MainWindow(QtGui.QMainWindow, ActionConfiguration):
       names = [str(roach.text())]
     self.logger.debug("make_plot_window: processing %s", names)
     for roachname in names:
-      roachnum = int(str(roachname[-1:]))-1
-      self.logger.debug("make_plot_window: entered for %s", roachname)
-      self.tabbedPlotWindows[roachname] = {}
-      if self.firmware[roachname][:9] == 'kurt_spec':
-        overview_axes = [[0.1, 0.1, 0.9, 0.3],
-                         [0.1, 0.4, 0.9, 0.6],
-                         [0.1, 0.7, 0.45, 0.9],
-                         [0.55 ,0.7, 0.9, 0.9]]
-        frames = {"Overview": MPLmanyaxes(overview_axes,
-                                          titles=["Power","Kurtosis",
-                                                  "RF 0","RF 1"]),
-                  "ADC": MPLsubplots(columns=2,  titles=["RF 0","RF 1"]),
-                  "Power": MPLsubplots(rows=2,   titles=["RF 0","RF 1"]),
-                  "Kurtosis": MPLsubplots(rows=2,titles=["RF 0","RF 1"])}
-        self.tabbedPlotWindows[roachname] = myTabbedPlotWindow(frames,
-                                                               roachname,
-                                                               parent = self)
-        self.tabbedPlotWindows[roachname].setWindowTitle(roachname)
-        self.update_spectra(roachname)
-        self.tabbedPlotWindows[roachname].show()
-      else:
-        self.logger.warning("make_plot_window: not yet implemented.")
-      self.logger.debug("make_plot_window: plot tabs: %s",
-                        self.tabbedPlotWindows)
+      self.open_plot_window(roachname)
+
+  def open_plot_window(self, roachname):
+    """
+    Open the plot window of a ROACH with the selected plot backend
+    """
+    self.logger.debug("open_plot_window: entered for %s with %s",
+                      roachname, self.plot_backend)
+    self.tabbedPlotWindows[roachname] = {}
+    if self.firmware[roachname][:9] == 'kurt_spec':
+      Plotter = PLOT_BACKENDS[self.plot_backend]
+      overview_axes = [[0.1, 0.1, 0.9, 0.3],
+                       [0.1, 0.4, 0.9, 0.6],
+                       [0.1, 0.7, 0.45, 0.9],
+                       [0.55 ,0.7, 0.9, 0.9]]
+      frames = {"Overview": Plotter().add_axes(overview_axes,
+                                               titles=["Power","Kurtosis",
+                                                       "RF 0","RF 1"]),
+                "ADC": Plotter().add_subplots(columns=2,
+                                              titles=["RF 0","RF 1"]),
+                "Power": Plotter().add_subplots(rows=2,
+                                                titles=["RF 0","RF 1"]),
+                "Kurtosis": Plotter().add_subplots(rows=2,
+                                                   titles=["RF 0","RF 1"]),
+                "Waterfall": WaterfallPlotter(count=2,
+                                              titles=["RF 0","RF 1"])}
+      self.tabbedPlotWindows[roachname] = myTabbedPlotWindow(frames,
+                                                             roachname,
+                                                             parent = self)
+      self.tabbedPlotWindows[roachname].setWindowTitle(roachname)
+      self.update_spectra(roachname)
+      self.tabbedPlotWindows[roachname].show()
+    else:
+      self.logger.warning("open_plot_window: not yet implemented.")
+    self.logger.debug("open_plot_window: plot tabs: %s",
+                      self.tabbedPlotWindows)
+
+  def set_plot_backend(self, *args):
+    """
+    Select the plot backend and re-open the plot windows with it
+    """
+    self.plot_backend = str(args[0].text())
+    self.logger.debug("set_plot_backend: selection = %s", self.plot_backend)
+    for roachname in self.tabbedPlotWindows.keys():
+      # closeEvent removes the window from tabbedPlotWindows
+      self.tabbedPlotWindows[roachname].close()
+      self.open_plot_window(roachname)
+
+  def save_plot_snapshot(self, *args):
+    """
+    Save the plots of a ROACH's window as PNG files, drawn by matplotlib
+    """
+    roachname = str(args[0].text())
+    if not self.tabbedPlotWindows.has_key(roachname):
+      self.logger.warning("save_plot_snapshot: no plot window for %s",
+                          roachname)
+      return
+    stamp = time.strftime("%Y%j%H%M%S", time.gmtime())
+    frames = self.tabbedPlotWindows[roachname].frames
+    for name in frames.keys():
+      if hasattr(frames[name], 'snapshot'):
+        filename = "%s-%s-%s.png" % (roachname, name, stamp)
+        frames[name].snapshot(filename)
+        self.status_text.setText("Saved "+filename)
 
   def set_power_scale(self, *args):
     self.logger.debug("set_power_scale: called with %s", args)
@@ -1016,13 +1136,29 @@ class MainWindow(QtGui.QMainWindow, ActionConfiguration):
     else:
       self.logger.debug("timer_action: unknown action %s", action)
 
+  @traced("gui")
   def timer_update(self):
-    if self.timer_loop:
+    if self.timer_loop and self.optimizing:
+      # optimize_all() is changing the gains; refresh after it
+      self.timer.singleShot(1000, self.timer_update)
+    elif self.timer_loop:
+      instant("tick", "gui", count=self.timer_loop)
       if self.timer_loop  == 1:
         self.refresh_RF_labels()
-      if self.timer_loop % 2 == 0:
-        for key in self.frames["Firmware"].custom["Firmware"].keys():
-          self.frames["Firmware"].custom["Firmware"][key].refresh_UI()
+      if self.timer_loop % 5 == 0:
+        # the bound rows show only the values which changed
+        self.refresh_monitor_data()
+        self.refresh_ADC_levels()
+      if self.timer_loop % 2 == 0 and self.frames["Firmware"].isVisible():
+        # the kurtosis panels are only refreshed while they can be seen
+        panels = self.frames["Firmware"].custom["Firmware"]
+        for key in panels.keys():
+          panels[key].refresh_UI()
+        # the rates of all the boards in one step
+        self.update_counter_rates()
+        for key in panels.keys():
+          panels[key].show_rates(
+                           self.counter_rates.rates(panels[key].roachname))
       self.timer_loop += 1
       self.timer.singleShot(1000, self.timer_update)
     else:
@@ -1038,6 +1174,16 @@ p.add_option('-l', '--log_level',
              type = 'str',
              default = 'warning',
              help = 'Logging level for main program and modules')
+p.add_option('-g', '--grid',
+             dest = 'grid',
+             type = 'str',
+             default = 'widgets',
+             help = "Panel backend: 'widgets' or 'model' (table view)")
+p.add_option('-P', '--plots',
+             dest = 'plots',
+             type = 'str',
+             default = 'matplotlib',
+             help = "Plot backend: 'matplotlib' or 'pyqtgraph'")
 opts, args = p.parse_args(sys.argv[1:])
 
 mylogger = logging.getLogger()
@@ -1054,7 +1200,7 @@ Tlogger.setLevel(logging.WARNING)
 app = QtGui.QApplication(sys.argv)
 app.setStyle("motif")
 mylogger.debug(" creating MainWindow")
-client = MainWindow()
+client = MainWindow(grid_backend=opts.grid, plot_backend=opts.plots)
 mylogger.warning("""If the program raises an exception, do
   cleanup_tunnels()
 before exiting python.""")
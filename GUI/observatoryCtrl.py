@@ -26,11 +26,13 @@ class ObservatoryClient(object):
     
     This has all the code specific to the equipment being monitored.
     """
-    def __init__(self):
+    def __init__(self, uri="PYRO:DSS-43@localhost:50015"):
         """
+        @param uri : server, or a local relay, to connect to
+        @type  uri : str
         """
         logging.getLogger(logger.name+".ObservatoryClient")
-        uri = Pyro5.api.URI("PYRO:DSS-43@localhost:50015")
+        uri = Pyro5.api.URI(uri)
         self.hardware = Pyro5.api.Proxy(uri)
 
         self.equipment = self.hardware.get_equipment()
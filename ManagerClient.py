@@ -2,14 +2,15 @@
 """
 Client class for DTO manager server.
 """
-import Pyro5
-import Pyro5.api
-import Pyro5.errors
 import logging
 import time
 import sys
 
-from MCClient.kurtosis_client import KurtosisClient
+from MCClient.board_registry import BoardRegistry, board_number
+from MCClient.state_store import StateStore
+from MCClient.tracing import traced
+# Pyro5, numpy (for rf_state) and kurtosis_client are imported where they are
+# first needed so that importing this module is fast
 
 module_logger = logging.getLogger(__name__)
 
@@ -23,11 +24,14 @@ class ManagerClient(object):
     ADC_source      - number of IF switch output for this ADC
     amb_temps       - temps[roach][adc]['ambient']
     available       - dict of lists of available boffiles
+    boards          - BoardRegistry of the ROACH names
     boffiles        - dict of running boffiles
     chip_temps      - temps[roach][adc]['IC']
+    counter_rates   - CounterRateEngine for the kurtosis firmware counters
     firmware        - dict of firmware names indexed by roach name
     firmware_dict   - index of loaded boffile in list of available
-    firmware_index  - index of loaded firmware in dict of available
+    firmware_index  - index of loaded firmware in dict of available, by
+                      board index
     firmware_keys   - names of all the available firmware
     fw_details      - result from mgr.get_firmware_summary()
     fw_states       - same as mgr.firmware_states
@@ -36,15 +40,21 @@ class ManagerClient(object):
     IF_on           - dict of RF section states
     IFsw_state      - dict of switch states
     logic           - KurtosisClient instance
+    monitor_store   - MonitorStore instance which keeps the monitor points
     mgr             - remote Manager() instance
     power_on        -
     register        - dict of dicts of register data
     register_details- information about registers
     register_values - contents of the registers
+    rf              - RFState array behind gain, IF_on, ADC_levels, ADC_source
     roach_IPs       - dict of ROACH IP addresses
     roach_keys      - sorted list of remote Roach() namess
     roach_status    - dict of ROACH status
+    rpc_log         - RPCLog instance if the server traffic is recorded, else
+                      None
     signal_sources  - result from mgr.report_signal_sources()
+    state           - StateStore with the latest value of everything fetched
+    sw_index        - position in sw_keys indexed by switch name
     sw_keys         - same as mgr.IFsw.channel.keys()
     switch_states   - list of inputs for each switch output
     synth_data      - parameters for the synthesizers
@@ -59,39 +69,87 @@ class ManagerClient(object):
     * Methods for managing firmware
     * Methods requiring firmware
   """
-  def __init__(self):
+  def __init__(self, record_to=None, monitor_store=None,
+               uri="PYRO:DSS-43@localhost:50015", connect_tries=5,
+               hedge_after=None, backend=None):
     """
     Instantiate a client
+
+    To share one server connection among several clients, give the URI of
+    a relay (see module relay) instead of the server.
+
+    The connection is a ResilientProxy (see module resilient) so calls
+    time out, reads are retried after a reconnection and, if 'hedge_after'
+    is given, slow periodic reads are also sent on a second connection.
+
+    For tests, an object with the server's methods, such as a
+    simulator.SimulatedManager, can be given as 'backend'; then no
+    connection is made.
+
+    @param record_to : optional file in which to log all the server traffic
+    @type  record_to : str
+
+    @param monitor_store : optional store for the board monitor points
+    @type  monitor_store : MonitorStore instance
+
+    @param uri : server, or relay, to connect to
+    @type  uri : str
+
+    @param connect_tries : attempts to connect, with increasing waits
+    @type  connect_tries : int
+
+    @param hedge_after : seconds after which a slow read is hedged
+    @type  hedge_after : float
+
+    @param backend : optional in-process replacement for the server
+    @type  backend : object
     """
     #server = 'DTO_mgr-dto'
     self.logger = logging.getLogger(__name__+".ManagerClient")
     self.logger.debug("__init__: logger is %s",self.logger.name)
     #self.mgr = PyroTaskClient(server)
-    uri = Pyro5.api.URI("PYRO:DSS-43@localhost:50015")
-    self.hardware = Pyro5.api.Proxy(uri)
-    try:
-      self.hardware.__get_state__()
-    except Pyro5.errors.CommunicationError as details:
-      self.logger.error("__init__: %s", details)
-      raise Pyro5.errors.CommunicationError("is the front end server running?")
-    except AttributeError:
-      # no __get_state__ because we have a connection
-      self.hardware._pyroClaimOwnership()
+    if backend is None:
+      import Pyro5.errors
+      from MCClient.resilient import ResilientProxy
+      self.hardware = ResilientProxy(uri, hedge_after=hedge_after)
+      try:
+        self.hardware.connect(tries=connect_tries)
+      except Pyro5.errors.CommunicationError as details:
+        self.logger.error("__init__: %s", details)
+        raise Pyro5.errors.CommunicationError(
+                                          "is the front end server running?")
+    else:
+      self.logger.info("__init__: using %s", backend)
+      self.hardware = backend
+    # the manager methods are served by the same remote object
+    self.mgr = self.hardware
+    if record_to:
+      from MCClient.rpc_recorder import record_client
+      self.rpc_log = record_client(self, record_to)
     else:
-      # use the simulator
-      self.hardware = hardware # that is, False
+      self.rpc_log = None
+    self.monitor_store = monitor_store
+    # changes smaller than the displayed resolution are not reported
+    self.state = StateStore(tolerances={'ADC_levels': 0.005,
+                                        'amb_temps':  0.05,
+                                        'chip_temps': 0.05,
+                                        'MMS_temps':  0.05,
+                                        'MMS_volts':  0.005})
     # get data from supervisor
     self.register_details = {} # for self.get_register_details(roach)
     self.register_values = {}
+    self.counter_rates = None
+    self.rf = None
     self.update_data()
     
 
+  @traced("client")
   def update_data(self):
     """
     """
-    # 1) data for the switch
-    #self.get_IFsw_states()      # updates IFsw_state
-    #self.update_switch_data()   # switch labels and sources
+    # 1) data for the switch; get_ADC_sources() needs it
+    self.get_IFsw_states()      # updates IFsw_state
+    self.update_switch_data()   # switch labels and sources
 
     # 2) data for each roach
     self.update_roach_data()    # updates 
@@ -107,29 +165,85 @@ class ManagerClient(object):
     self.get_ADC_sources()
 
     # 5) data for the board monitor
-    self.fan_rpm = self.mgr.check_fans()
-    self.logger.debug("update_data: fan report: %s", self.fan_rpm)
     self.MMS_opt = self.mgr.get_MMS_options()
     self.logger.debug("update_data: MMS options: %s", self.MMS_opt)
-    self.volts, self.temps = self.mgr.get_MMS_analog()
-    for key in list(self.volts.keys()):
-      self.logger.debug("update_data: %s: %s", key, self.volts[key])
-    for key in list(self.temps.keys()):
-      self.logger.debug("update_data: %s: %s", key, self.temps[key])
+    self.refresh_board_monitor()
+    if self.monitor_store is not None:
+      self.monitor_store.append(time.time(), self.get_monitor_points())
 
     # 6) register data from the firmware, without knowledge of firmware
+    from MCClient.kurtosis_client import KurtosisClient
+    from MCClient.rates import CounterRateEngine
 
     for roachname in self.roach_keys:
-      roach_index = self.roach_keys.index(roachname)
+      roach_index = self.boards.index[roachname]
       self.get_register_values(roachname)
       if roachname in self.firmware:
         if ((self.firmware[roachname] == 'kurt_spec') or
             (self.firmware[roachname] == 'kurt_spec_r1') or
             (self.firmware[roachname] == 'kurt_spec_gain')):
           self.logic = KurtosisClient(self, roach_index)
+    self.counter_rates = CounterRateEngine(self.roach_keys)
+    self.counter_rates.update(self.register_values)
     
+  def close_rpc_log(self):
+    """
+    Close the log of the server traffic, if there is one
+    """
+    if self.rpc_log is not None:
+      self.rpc_log.close()
+
+  @traced("rpc")
+  def refresh_board_monitor(self):
+    """
+    Get the fan speeds and the MMS voltages and temperatures
+    """
+    self.fan_rpm = self.mgr.check_fans()
+    self.logger.debug("refresh_board_monitor: fan report: %s", self.fan_rpm)
+    self.volts, self.temps = self.mgr.get_MMS_analog()
+    for key in list(self.volts.keys()):
+      self.logger.debug("refresh_board_monitor: %s: %s", key, self.volts[key])
+    for key in list(self.temps.keys()):
+      self.logger.debug("refresh_board_monitor: %s: %s", key, self.temps[key])
+    self.state.update(('fan_rpm',), self.fan_rpm)
+    self.state.update(('MMS_volts',), self.volts)
+    self.state.update(('MMS_temps',), self.temps)
+
+  @traced("client")
+  def refresh_monitor_data(self):
+    """
+    Re-read everything shown in the GUI's monitor rows
+
+    Only the values which changed are passed on to the widgets bound to
+    the state store.
+    """
+    self.get_temperatures()
+    self.refresh_board_monitor()
+    self.refresh_synth_data()
+    self.refresh_gain(index=-1)
+    if self.monitor_store is not None:
+      self.monitor_store.append(time.time(), self.get_monitor_points())
+
+  def get_monitor_points(self):
+    """
+    Collect the board monitor data from the last update as named points
+
+    @return: dict of float indexed by point name, e.g. 'fan.roach1.0'
+    """
+    from MCClient.monitor_store import flatten_points
+    points = {}
+    points.update(flatten_points('fan', self.fan_rpm))
+    points.update(flatten_points('MMS_volts', self.volts))
+    points.update(flatten_points('MMS_temps', self.temps))
+    points.update(flatten_points('ADC_ambient', self.amb_temps))
+    points.update(flatten_points('ADC_chip', self.chip_temps))
+    points.update(flatten_points('synth', self.synth_data))
+    points.update(flatten_points('ADC_level', self.ADC_levels))
+    return points
+
   # ------------------ methods for the IF switches -----------------------
 
+  @traced("rpc")
   def get_IFsw_states(self):
     """
     Get the inputs for all switches
@@ -150,13 +264,15 @@ class ManagerClient(object):
     self.sw_keys.sort()
     self.logger.debug("get_IFsw_states: Server returned IF switch keys: %s",
                       self.sw_keys)
+    self.sw_index = {}
     self.IFsw_state = {}
-    for sw in self.sw_keys:
-      index = self.sw_keys.index(sw)
+    for index, sw in enumerate(self.sw_keys):
+      self.sw_index[sw] = index
       self.IFsw_state[index] = self.switch_states[index]
     self.logger.debug("get_IFsw_states: state dict: %s",self.IFsw_state)
     return self.switch_states
   
+  @traced("rpc")
   def update_switch_data(self):
     """
     Update the data for the IF switch
@@ -183,18 +299,17 @@ class ManagerClient(object):
     self.logger.debug("set_IF_switch: %s set to %s", index, state)
     self.IFsw_state[index] = self.mgr.set_IFsw_state(index,state)
 
+  @traced("rpc")
   def get_ADC_sources(self):
     """
     Returns the switch state for the corresponding IF switch output
     """
-    self.ADC_source = {}
     self.logger.debug("get_ADC_sources: IF switch states: %s",
                       self.IFsw_state)
+    sources = []
     for roachname in self.roach_keys:
-      r_index = self.roach_keys.index(roachname)
-      self.ADC_source[r_index] = {}
+      r_index = self.boards.index[roachname]
       for ADC in list(self.gain[roachname].keys()):
-        self.ADC_source[r_index][ADC] = {}
         for RF in list(self.gain[roachname][ADC].keys()):
           self.logger.debug(
             "get_ADC_sources: getting signal source for roach %s ADC %s RF %s",
@@ -204,12 +319,15 @@ class ManagerClient(object):
                                                   +str(RF)+"].sources")
           self.logger.debug("get_ADC_sources: Response is %s", response)
           # Take the name part, strip off outer quotes, get index
-          IFsw_outport = int(self.sw_keys.index(eval(response[0].split()[1])))
+          IFsw_outport = self.sw_index[eval(response[0].split()[1])]
           self.logger.debug("IF switch output port is %d, type %s",
                             IFsw_outport, type(IFsw_outport))
-          self.ADC_source[r_index][ADC][RF] = self.IFsw_state[IFsw_outport]
-    self.logger.debug("__init__: ADC_source: %s", self.ADC_source)
+          sources.append(((r_index, ADC, RF), self.IFsw_state[IFsw_outport]))
+    self.rf.read('source', sources)
+    self.ADC_source = self.rf.nested('source', by='index')
+    self.logger.debug("get_ADC_sources: ADC_source: %s", self.ADC_source)
 
+  @traced("rpc")
   def get_register_values(self, roachname):
     """
     """
@@ -217,6 +335,8 @@ class ManagerClient(object):
     if roachname in self.firmware:
       # There is firmware for this roach
       self.register_values[roachname] = self.mgr.get_register_values(roachname)
+      self.state.update(('registers', roachname),
+                        self.register_values[roachname])
       self.logger.debug("get_register_values: ROACH %s register values> %s",
                         roachname,
                         self.register_values[roachname])
@@ -224,8 +344,17 @@ class ManagerClient(object):
       self.register_values[roachname] = {}
     return self.register_values[roachname]
       
+  def update_counter_rates(self, now=None):
+    """
+    Update the counter rates from the latest register values
+
+    @return: smoothed rates, array [board, counter]
+    """
+    return self.counter_rates.update(self.register_values, now)
+
   # --------------------- methods for the synthesizers -------------------
 
+  @traced("rpc")
   def refresh_synth_data(self):
     """
     """
@@ -234,15 +363,18 @@ class ManagerClient(object):
     self.synth_freq = {}
     self.synth_pwr = {}
     for roachname in self.roach_keys:
-      synth = self.roach_keys.index(roachname)+1
+      synth = self.boards.index[roachname]+1
       self.synth_data[synth] = self.mgr.request(
                               'self.roaches["'+roachname+'"].clock_synth.status')
       self.synth_freq[roachname] = self.synth_data[synth]["frequency"]
       self.synth_pwr[roachname] = self.synth_data[synth]["rf_level"]
+    self.state.update(('synth_freq',), self.synth_freq)
+    self.state.update(('synth_pwr',), self.synth_pwr)
     self.logger.debug("refresh_synth_data: synthesizers: %s",self.synth_data)
 
   # --------------------- methods for the ROACH boards -------------------
   
+  @traced("rpc")
   def update_roach_data(self):
     """
     Update the data for the ROACH boards
@@ -252,6 +384,7 @@ class ManagerClient(object):
      boffiles      - name of currently loaded boffiles
      firmware_dict - index of loaded boffile in list of available
      roach_IPs     - dict of ROACH IP addresses
+     boards        - BoardRegistry for the names
      roach_keys    - names of the remote Roach() instances
      roach_status  - dict of ROACH status
     """
@@ -269,8 +402,8 @@ class ManagerClient(object):
     self.logger.debug("update_roach_data: power state = %s",self.power_on)
     
     self.firmware_dict = {}
-    self.roach_keys = list(self.roach_status.keys())
-    self.roach_keys.sort()
+    self.boards = BoardRegistry(list(self.roach_status.keys()))
+    self.roach_keys = self.boards.names
     for roachname in self.roach_keys:
       try:
         self.firmware_dict[roachname] = \
@@ -280,20 +413,25 @@ class ManagerClient(object):
     self.logger.debug("update_roach_data: firmware_dict = %s",
                       self.firmware_dict)
 
+  @traced("rpc")
   def refresh_gain(self,index=-1):
     """
     Get the current RF section gains
 
-    @param index : logical spectrometer ID (-1 for all spectrometers)
-    @type  index : int
+    The RF inputs reported for all the boards define the rows of 'rf'.
+    If they are not the same as before, 'rf' is made again.  A single board
+    only updates its rows, so the first call always gets all the boards.
+
+    @param index : board name (-1 for all spectrometers)
+    @type  index : str or int
     """
-    if index == -1:
+    from MCClient.rf_state import RFState, leaves
+    whole = index == -1 or self.rf is None
+    if whole:
       keys = self.roach_keys
     else:
       keys = [index]
     response = {}
-    self.IF_on = {}
-    self.gain = {}
     for roachname in keys:
       if self.firmware[roachname]:
         self.logger.debug("refresh_gain: for ROACH %s", roachname)
@@ -301,19 +439,35 @@ class ManagerClient(object):
             "self.roaches['"+roachname+"'].get_gains()")
         self.logger.debug("refresh_gain: ROACH %s gain is %s",
                           roachname,response[roachname])
-        self.gain[roachname] = {}
-        self.IF_on[roachname] = {}
-        for adc in list(response[roachname].keys()):
-          self.gain[roachname][adc] = {}
-          self.IF_on[roachname][adc] = {}
-          for RF in response[roachname][adc]:
-            self.gain[roachname][adc][RF] = response[roachname][adc][RF]['gain']
-            self.IF_on[roachname][adc][RF] = response[roachname][adc][RF]['enabled']
-      else:
-        self.gain[roachname] = {}
-        self.IF_on[roachname] = {}
+    sections = list(leaves(response))
+    inputs = [key for key, section in sections]
+    if self.rf is None or (whole and
+                           set(inputs) != set(self.rf.inputs())):
+      self.rf = RFState(self.boards, inputs)
+      new = True
+    else:
+      new = False
+    gain_rows = self.rf.read('gain', [(key, section['gain'])
+                                      for key, section in sections])
+    IF_rows = self.rf.read('IF_on', [(key, section['enabled'])
+                                     for key, section in sections])
+    if new:
+      gain_rows = IF_rows = list(range(len(self.rf)))
+    self.gain = self.rf.nested('gain')
+    self.IF_on = self.rf.nested('IF_on')
+    self._publish('gain', 'gain', gain_rows)
+    self._publish('IF_on', 'IF_on', IF_rows)
     return response
+
+  def _publish(self, prefix, field, rows, by='name'):
+    """
+    Pass the changed rows of an 'rf' column on to the state store
+    """
+    column = self.rf.values[field]
+    for row in rows:
+      self.state.set((prefix,)+self.rf.key(row, by), column[row].item())
     
+  @traced("rpc")
   def refresh_ADC_levels(self):
     """
     Get the RF levels
@@ -323,13 +477,21 @@ class ManagerClient(object):
        1: {0: {0:  4.3043415708265451, 1: -3.03297909588116}}}
     """
     try:
-      self.ADC_levels = self.mgr.get_ADC_levels()
+      levels = self.mgr.get_ADC_levels()
     except RuntimeError:
       self.logger.error("refresh_ADC_levels: no response from server")
     else:
-      self.logger.debug("refresh_ADC_levels: new levels: %s",
-                       self.ADC_levels)
+      self.logger.debug("refresh_ADC_levels: new levels: %s", levels)
+      from MCClient.rf_state import leaves
+      if self.rf is None:
+        self.ADC_levels = levels
+        self.state.update(('ADC_levels',), levels)
+      else:
+        changed = self.rf.read('level', leaves(levels))
+        self.ADC_levels = self.rf.nested('level', by='index')
+        self._publish('ADC_levels', 'level', changed, by='index')
 
+  @traced("rpc")
   def set_RF(self, roach, adc = 0, inp = 0, gain = None, enabled = True):
     """
     Configure an RF section
@@ -356,15 +518,207 @@ class ManagerClient(object):
     if gain:
       self.logger.debug("set_RF: gain is %s",gain)
     self.logger.debug("set_RF: enabled is %s", enabled)
-    self.IF_on[roach][adc][inp], self.gain[roach][adc][inp] = \
-                      self.mgr.set_RF_section(roach,
-                                              adc = adc,
-                                              inp = inp,
-                                              gain = gain,
-                                              enabled = bool(enabled))
+    enabled, gain = self.mgr.set_RF_section(roach,
+                                            adc = adc,
+                                            inp = inp,
+                                            gain = gain,
+                                            enabled = bool(enabled))
     self.logger.debug("set_RF: server returned enabled %s, gain %s",
-                      self.IF_on[roach][adc][inp], self.gain[roach][adc][inp])
+                      enabled, gain)
+    # this also updates self.IF_on and self.gain
+    self.rf.set('IF_on', roach, adc, inp, enabled)
+    self.rf.set('gain', roach, adc, inp, gain)
+    self.state.set(('gain', roach, adc, inp), gain)
+    self.state.set(('IF_on', roach, adc, inp), enabled)
+
+  @traced("client")
+  def optimize_RF(self, roach, adc=0, inp=0, target=None, tolerance=None,
+                  settle=0.0):
+    """
+    Set the gain of an RF section for a target ADC level
+
+    Each step is one set_RF() and one ADC level reading; see module
+    gain_optimizer for how the gains are chosen.
+
+    @param roach : ROACH name
+    @type  roach : str
+
+    @param adc : ADC number
+    @type  adc : int
+
+    @param inp : RF input number for the ADC
+    @type  inp : int
+
+    @param target : ADC level wanted in dBm; default TARGET_LEVEL
+    @type  target : float
+
+    @param tolerance : acceptable difference from the target in dB
+    @type  tolerance : float
+
+    @param settle : seconds to wait after a gain change before reading
+    @type  settle : float
+
+    @return: (gain, level)
+    """
+    from MCClient import gain_optimizer
+    if target is None:
+      target = gain_optimizer.TARGET_LEVEL
+    if tolerance is None:
+      tolerance = gain_optimizer.TOLERANCE
+    r_index = self.boards.index[roach]
+    stepper = gain_optimizer.GainStepper(self.rf.get('gain', roach, adc, inp),
+                                         target, tolerance)
+    gain = stepper.gain
+    while gain is not None:
+      self.set_RF(roach, adc=adc, inp=inp, gain=gain)
+      last = gain
+      if settle:
+        time.sleep(settle)
+      level = self.get_ADC_level(r_index, adc, inp)
+      self.logger.debug("optimize_RF: %s ADC %d RF %d: %.1f dB gives %.2f dBm",
+                        roach, adc, inp, gain, level)
+      gain = stepper.next_gain(level)
+    if stepper.best is None:
+      self.logger.warning("optimize_RF: %s ADC %d RF %d: no valid level",
+                          roach, adc, inp)
+      return last, level
+    gain, level = stepper.best
+    if gain != last:
+      self.set_RF(roach, adc=adc, inp=inp, gain=gain)
+    self.rf.set('level', roach, adc, inp, level)
+    self.state.set(('ADC_levels', r_index, adc, inp), level)
+    self.logger.info("optimize_RF: %s ADC %d RF %d: %.1f dB, %.2f dBm "
+                     "after %d steps", roach, adc, inp, gain, level,
+                     len(stepper.history))
+    return gain, level
+
+  @traced("client")
+  def optimize_all_RF(self, target=None, tolerance=None, settle=0.0,
+                      progress=None):
+    """
+    Set the gains of all the enabled RF sections for a target ADC level
+
+    The inputs are optimized together, in rounds.  In each round the new
+    gains go to the server in one request per board and all the levels come
+    back in one get_ADC_levels(), so the whole system takes about as many
+    rounds as one input takes steps.
+
+    Inputs fed by the same IF switch input see the same signal, so the size
+    of the first step is taken from the mean of the group, which is less
+    noisy.  The readings which bound the search are always each input's
+    own.
 
+    @param target : ADC level wanted in dBm; default TARGET_LEVEL
+    @type  target : float
+
+    @param tolerance : acceptable difference from the target in dB
+    @type  tolerance : float
+
+    @param settle : seconds to wait after the gains change before reading
+    @type  settle : float
+
+    @param progress : called after each round with (inputs done, inputs)
+    @type  progress : function
+
+    Inputs which never give a valid level are left at their gains and are
+    not in the result.
+
+    @return: dict of (gain, level) indexed by (roach name, adc, rf)
+    """
+    import numpy
+    from MCClient import gain_optimizer
+    from MCClient.rf_state import leaves
+    if target is None:
+      target = gain_optimizer.TARGET_LEVEL
+    if tolerance is None:
+      tolerance = gain_optimizer.TOLERANCE
+    values = self.rf.values
+    rows = [row for row in range(len(self.rf)) if values['IF_on'][row]]
+    steppers = dict((row, gain_optimizer.GainStepper(values['gain'][row],
+                                                     target, tolerance))
+                    for row in rows)
+    groups = {}
+    for row in rows:
+      groups.setdefault(int(values['source'][row]), []).append(row)
+    pending = dict((row, steppers[row].gain) for row in rows)
+    rounds = 0
+    while pending:
+      self._set_gains(pending)
+      if settle:
+        time.sleep(settle)
+      self.rf.read('level', leaves(self.mgr.get_ADC_levels()))
+      if rounds == 0:
+        offset = {}
+        for source, members in groups.items():
+          differences = values['level'][members] - values['gain'][members]
+          differences = differences[numpy.isfinite(differences)]
+          if len(differences):
+            offset[source] = differences.mean()
+      new = {}
+      for row in pending:
+        level = float(values['level'][row])
+        expected = None
+        if rounds == 0 and numpy.isfinite(level):
+          expected = float(values['gain'][row] +
+                           offset[int(values['source'][row])])
+        gain = steppers[row].next_gain(level, expected)
+        if gain is not None:
+          new[row] = gain
+      pending = new
+      rounds += 1
+      self.logger.debug("optimize_all_RF: round %d, %d inputs left",
+                        rounds, len(pending))
+      if progress:
+        progress(len(rows) - len(pending), len(rows))
+    # the best gain is not always the last one tried, and the levels read
+    # last are for the gains tried last
+    final = dict((row, steppers[row].gain) for row in rows
+                 if steppers[row].gain != values['gain'][row])
+    if final:
+      self._set_gains(final)
+      if settle:
+        time.sleep(settle)
+      self.rf.read('level', leaves(self.mgr.get_ADC_levels()))
+    self.ADC_levels = self.rf.nested('level', by='index')
+    self._publish('ADC_levels', 'level', rows, by='index')
+    results = {}
+    for row in rows:
+      if steppers[row].best is None:
+        self.logger.warning("optimize_all_RF: %s: no valid level",
+                            self.rf.key(row))
+        continue
+      results[self.rf.key(row)] = (steppers[row].gain,
+                                   self.rf.get('level', *self.rf.key(row)))
+    self.logger.info("optimize_all_RF: %d inputs in %d rounds",
+                     len(rows), rounds)
+    return results
+
+  @traced("rpc")
+  def _set_gains(self, gains):
+    """
+    Set the gains of several RF sections, with one request per board
+
+    @param gains : gain indexed by RFState row
+    @type  gains : dict of float
+    """
+    boards = {}
+    for row in sorted(gains):
+      boards.setdefault(self.rf.names[row], []).append(row)
+    for roachname, rows in boards.items():
+      calls = []
+      for row in rows:
+        roach, adc, inp = self.rf.key(row)
+        calls.append("self.set_RF_section('%s', adc=%d, inp=%d, gain=%s, "
+                     "enabled=True)," % (roach, adc, inp, float(gains[row])))
+      response = self.mgr.request("(" + "".join(calls) + ")")
+      for row, (enabled, gain) in zip(rows, response):
+        key = self.rf.key(row)
+        self.rf.set('IF_on', *(key + (enabled,)))
+        self.rf.set('gain', *(key + (gain,)))
+        self.state.set(('gain',) + key, gain)
+        self.state.set(('IF_on',) + key, enabled)
+
+  @traced("rpc")
   def get_accums(self,roach,adc,rf):
     """
     """
@@ -380,6 +734,7 @@ class ManagerClient(object):
       self.logger.debug("get_accums: response: %s", response)
       return response
 
+  @traced("rpc")
   def get_ADC_samples(self,roach,adc,rf):
     """
     Request ADC samples from the server
@@ -403,6 +758,7 @@ class ManagerClient(object):
       self.logger.debug("get_ADC_samples: response: %s", response)
       return response
     
+  @traced("rpc")
   def get_temperatures(self):
     """
     """
@@ -415,6 +771,8 @@ class ManagerClient(object):
       for adc in list(self.temps[roach].keys()):
         self.amb_temps[roach][adc] = self.temps[roach][adc]['ambient']
         self.chip_temps[roach][adc] = self.temps[roach][adc]['IC']
+    self.state.update(('amb_temps',), self.amb_temps)
+    self.state.update(('chip_temps',), self.chip_temps)
     return self.temps
 
   def list_devices(self, roach_keys=[]):
@@ -430,8 +788,8 @@ class ManagerClient(object):
       try:
         roach_keys = self.roach_keys
       except NameError:
-        self.roach_keys = self.mgr.request("self.spec.keys()")
-        self.roach_keys.sort()
+        self.boards = BoardRegistry(self.mgr.request("self.spec.keys()"))
+        self.roach_keys = self.boards.names
         roach_keys = self.roach_keys
     regs = self.mgr.list_dev(roach_keys)
     return regs
@@ -447,8 +805,8 @@ class ManagerClient(object):
 
     @return: sorted list of register names
     """
-    roachnum = int(roach[-1:])
-    roachID = (roachnum/2)*2
+    roachnum = board_number(roach)
+    roachID = (roachnum//2)*2
     return self.list_devices([roachID])
 
   def get_board_IDs(self):
@@ -457,6 +815,7 @@ class ManagerClient(object):
     """
     return self.mgr.get_board_IDs()
 
+  @traced("rpc")
   def get_register_details(self,roach):
     """
     Get the details for the registers in ROACH's firmware.
@@ -489,6 +848,7 @@ class ManagerClient(object):
 
   # ---------------- methods for managing firmware ----------------------
   
+  @traced("rpc")
   def get_firmware_details(self):
     """
     Get the details for the firmware loaded in the ROACH boards
@@ -501,9 +861,10 @@ class ManagerClient(object):
     self.logger.debug("get_firmware_details: firmware states: %s",
                      self.fw_states)
     for roach in self.roach_keys:
-      roachnum = int(roach[-1])-1
+      roachnum = self.boards.numbers[roach]-1
       self.logger.debug("get_firmware_details: processing roach %s",roach)
-      self.firmware_index[roachnum] = self.fw_states[roachnum]
+      # the server counts from board number 1; the GUI columns are indices
+      self.firmware_index[self.boards.index[roach]] = self.fw_states[roachnum]
       self.firmware[roach] = self.mgr.request("self.firmware['"+roach+"']")
       self.logger.debug("get_firmware_details: %s has firmware '%s'",
                             roach, self.firmware[roach])
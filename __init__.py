@@ -1,3 +1,35 @@
 """
 Clients for remote ROAChes
-"""
\ No newline at end of file
+
+The classes are imported from their modules when first used, so that
+importing the package, e.g. for MCClient.board_registry, does not load
+Pyro5 or numpy::
+  from MCClient import MonitorStore     # imports MCClient.monitor_store now
+
+ManagerClient is not in this list because it has the same name as its
+module; use 'from MCClient.ManagerClient import ManagerClient'.
+"""
+import importlib
+
+# public name -> module which defines it
+_LAZY = {'BoardRegistry':   'board_registry',
+         'KurtosisClient':  'kurtosis_client',
+         'ManagerRelay':    'relay',
+         'MonitorStore':    'monitor_store',
+         'RFState':         'rf_state',
+         'RPCReplayer':     'rpc_recorder',
+         'SpectraRecorder': 'spectra_recorder',
+         'StateStore':      'state_store',
+         'record_client':   'rpc_recorder'}
+
+def __getattr__(name):
+  try:
+    module = _LAZY[name]
+  except KeyError:
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+  value = getattr(importlib.import_module(__name__+"."+module), name)
+  globals()[name] = value
+  return value
+
+def __dir__():
+  return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+board_registry - constant-time lookups between ROACH names, indices and IDs
+
+The server names the boards 'roach1', 'roach2', ...  The clients need the
+position of a board in the sorted list of names (the index used for the
+server's spec[] and for the GUI columns) and the board number in the name.
+Sorting the names as strings and parsing the last character only works for
+up to nine boards; this sorts and parses the whole trailing number.
+"""
+import logging
+import re
+
+module_logger = logging.getLogger(__name__)
+
+_trailing_number = re.compile(r"(\d+)$")
+
+def board_number(name):
+  """
+  The number at the end of a board name, e.g. 12 for 'roach12'
+
+  @param name : board name
+  @type  name : str
+
+  @return: int
+  """
+  match = _trailing_number.search(name)
+  if match is None:
+    raise ValueError("board name %s has no number" % name)
+  return int(match.group(1))
+
+def natural_key(name):
+  """
+  Sort key which puts 'roach10' after 'roach9'
+
+  Keys which are not strings, like ADC numbers, sort by value before names.
+  """
+  if not isinstance(name, str):
+    return ('', name)
+  match = _trailing_number.search(name)
+  if match is None:
+    return (name, -1)
+  return (name[:match.start()], int(match.group(1)))
+
+class BoardRegistry(object):
+  """
+  Name <-> index <-> number maps for a set of boards
+
+  Public attributes::
+    by_number - board name indexed by board number
+    index     - position in 'names' indexed by board name
+    names     - board names in natural order
+    numbers   - board number indexed by board name
+  """
+  def __init__(self, names=[]):
+    """
+    @param names : board names in any order
+    @type  names : list of str
+    """
+    self.names = sorted(names, key=natural_key)
+    self.index = {}
+    self.numbers = {}
+    self.by_number = {}
+    for index, name in enumerate(self.names):
+      self.index[name] = index
+      try:
+        number = board_number(name)
+      except ValueError:
+        number = index + 1
+      self.numbers[name] = number
+      self.by_number[number] = name
+    module_logger.debug("BoardRegistry: %s", self.index)
+
+  def __len__(self):
+    return len(self.names)
+
+  def __iter__(self):
+    return iter(self.names)
+
+  def __contains__(self, name):
+    return name in self.index
+
+  def name(self, index):
+    """
+    Board name at a position in the sorted list
+    """
+    return self.names[index]
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+gain_optimizer - choose RF section gains which give a target ADC level
+
+The RF section gain is set in 0.5 dB steps from -11.5 to +20 dB, and the ADC
+level in dBm follows the gain almost dB for dB.  GainStepper therefore
+proposes the gain which the measured error calls for, with the slope
+re-estimated from the last two readings.  Every reading also narrows a
+bracket of gains: below the target the gain is too low, above it too high.
+A proposal outside the bracket, or one which repeats a gain, is replaced
+by the middle of the bracket, so the search also ends for inputs which do
+not follow the model (e.g. a saturated amplifier).  A level which is not a
+number (e.g. no signal) ends the search at the best gain so far.
+
+Usually the first model step lands within a step of the target and the
+optimization takes two or three set/read cycles.
+
+A GainStepper only does the arithmetic; see ManagerClient.optimize_RF() for
+the server calls.
+"""
+import logging
+import math
+
+module_logger = logging.getLogger(__name__)
+
+GAIN_MIN = -11.5
+GAIN_MAX = 20.0
+GAIN_STEP = 0.5
+TARGET_LEVEL = -10.0  # dBm
+TOLERANCE = 0.5       # dB
+MAX_STEPS = 10
+# plausible range of the level change per dB of gain
+SLOPE_LIMITS = (0.5, 2.0)
+
+NUM_GAINS = int(round((GAIN_MAX - GAIN_MIN)/GAIN_STEP)) + 1
+
+def gain_index(gain):
+  """
+  Nearest step of a gain, limited to the gain range
+  """
+  return min(NUM_GAINS-1, max(0, int(round((gain - GAIN_MIN)/GAIN_STEP))))
+
+def index_gain(index):
+  return GAIN_MIN + index*GAIN_STEP
+
+class GainStepper(object):
+  """
+  Gain search for one RF input
+
+  Use::
+    stepper = GainStepper(current_gain)
+    gain = stepper.gain
+    while gain is not None:
+      set the gain; read the level
+      gain = stepper.next_gain(level)
+    stepper.gain is the best gain found; stepper.best is None if no level
+    was valid
+
+  Public attributes::
+    best      - (gain, level) closest to the target so far
+    done      - True when no better gain can be found
+    gain      - gain to set, or which was set last
+    history   - list of (gain, level) readings
+    target    - ADC level wanted, dBm
+    tolerance - acceptable difference from the target, dB
+  """
+  def __init__(self, gain, target=TARGET_LEVEL, tolerance=TOLERANCE,
+               max_steps=MAX_STEPS):
+    """
+    @param gain : present gain in dB
+    @type  gain : float
+
+    @param target : ADC level wanted in dBm
+    @type  target : float
+
+    @param tolerance : acceptable difference from the target in dB
+    @type  tolerance : float
+
+    @param max_steps : most readings to take
+    @type  max_steps : int
+    """
+    self.target = target
+    self.tolerance = tolerance
+    self.max_steps = max_steps
+    self.gain = index_gain(gain_index(gain))
+    self.history = []
+    self.best = None
+    self.done = False
+    self._low = -1          # highest gain index known to be too low
+    self._high = NUM_GAINS  # lowest gain index known to be too high
+
+  def next_gain(self, level, expected=None):
+    """
+    Take the level for the present gain and propose the next gain
+
+    @param level : ADC level in dBm
+    @type  level : float
+
+    @param expected : less noisy estimate of the level, used only for the
+                      size of the next step; the reading is 'level'
+    @type  expected : float
+
+    @return: gain to set next, or None when finished; then 'gain' is the
+             best gain, which may differ from the last one set
+    """
+    if math.isnan(level) or math.isinf(level):
+      module_logger.warning("next_gain: level %s at %.1f dB; stopping",
+                            level, self.gain)
+      return self._finish()
+    index = gain_index(self.gain)
+    error = self.target - level
+    self.history.append((self.gain, level))
+    if self.best is None or abs(error) < abs(self.target - self.best[1]):
+      self.best = (self.gain, level)
+    if abs(error) <= self.tolerance:
+      return self._finish()
+    if error > 0:
+      self._low = max(self._low, index)
+    else:
+      self._high = min(self._high, index)
+    if self._high - self._low < 2 or len(self.history) >= self.max_steps:
+      return self._finish()
+    if expected is not None and not (math.isnan(expected) or
+                                     math.isinf(expected)):
+      error = self.target - expected
+    proposal = index + int(round(error/self._slope()/GAIN_STEP))
+    if not self._low < proposal < self._high or proposal == index:
+      if self._low < 0 or self._high >= NUM_GAINS:
+        # no bracket yet; go as far as allowed in the right direction
+        proposal = min(self._high-1, max(self._low+1, proposal))
+      else:
+        proposal = (self._low + self._high)//2
+    if proposal == index:
+      return self._finish()
+    self.gain = index_gain(proposal)
+    return self.gain
+
+  def _slope(self):
+    """
+    dB of level per dB of gain, from the last two readings
+    """
+    if len(self.history) > 1:
+      (g0, l0), (g1, l1) = self.history[-2:]
+      if g1 != g0:
+        return min(SLOPE_LIMITS[1], max(SLOPE_LIMITS[0], (l1-l0)/(g1-g0)))
+    return 1.0
+
+  def _finish(self):
+    self.done = True
+    if self.best is not None:
+      self.gain = self.best[0]
+    return None
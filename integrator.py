@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+integrator - client-side integration of spectra beyond acc_len_m1
+
+The firmware integrates acc_len_m1 + 1 spectra at most.  SpectralIntegrator
+co-adds the power spectra which get_accums() returns, for all the inputs at
+once, in float64 accumulators [input, channel]::
+  sum    += w * spectrum
+  weight += w
+where w is the weight of the spectrum (e.g. its integration time) for the
+channels which are not flagged, and 0 for the flagged ones.  The integrated
+spectrum is sum/weight, with NaN in channels which were always flagged.
+
+The integration is dumped when 'dump_seconds' have passed since it started
+or 'dump_count' cycles have been added, whichever comes first.  A dump is a
+dict::
+  keys     - (roach index, adc, rf) of the rows
+  start    - time of the first cycle
+  stop     - time of the last cycle
+  spectrum - weighted mean spectra, array [input, channel]
+  weight   - summed weights, array [input, channel]
+  count    - spectra added, array [input]
+  seconds  - integration time, array [input]
+"""
+import logging
+import numpy
+import time
+
+module_logger = logging.getLogger(__name__)
+
+def spectrum_seconds(acc_len, channels, clock):
+  """
+  Integration time of one firmware spectrum
+
+  @param acc_len : accumulations, acc_len_m1 + 1
+  @type  acc_len : int
+
+  @param channels : channels in the spectrum
+  @type  channels : int
+
+  @param clock : sampler clock in MHz
+  @type  clock : float
+  """
+  return acc_len*2*channels/(clock*1e6)
+
+class SpectralIntegrator(object):
+  """
+  Co-adds spectra of all the inputs into float64 accumulators
+
+  Public attributes::
+    channels     - channels per spectrum
+    count        - spectra added since the last dump, array [input]
+    dump_count   - cycles per dump, or None
+    dump_seconds - seconds per dump, or None
+    dumped       - function(dump) called with each dump, or None
+    keys         - (roach index, adc, rf) of each input, the rows
+    logger       - logger for this instance
+    seconds      - integration time since the last dump, array [input]
+    start        - time of the first cycle since the last dump
+    sum          - weighted sums, array [input, channel]
+    weight       - summed weights, array [input, channel]
+  """
+  def __init__(self, keys, channels, dump_seconds=None, dump_count=None,
+               dumped=None):
+    """
+    @param keys : (roach index, adc, rf) of the inputs
+    @type  keys : list of tuple
+
+    @param channels : channels per spectrum
+    @type  channels : int
+
+    @param dump_seconds : seconds of wall time per dump
+    @type  dump_seconds : float
+
+    @param dump_count : cycles per dump
+    @type  dump_count : int
+
+    @param dumped : called with each dump
+    @type  dumped : function(dict)
+    """
+    self.logger = logging.getLogger(__name__+".SpectralIntegrator")
+    self.keys = list(keys)
+    self.channels = channels
+    self.dump_seconds = dump_seconds
+    self.dump_count = dump_count
+    self.dumped = dumped
+    self._row = dict((key, row) for row, key in enumerate(self.keys))
+    shape = (len(self.keys), channels)
+    self.sum = numpy.zeros(shape)
+    self.weight = numpy.zeros(shape)
+    self.count = numpy.zeros(len(self.keys), dtype=int)
+    self.seconds = numpy.zeros(len(self.keys))
+    self.start = None
+    self._stop = None
+    self._cycles = 0
+    self._spectra = numpy.zeros(shape)
+    self._valid = numpy.zeros(len(self.keys), dtype=bool)
+
+  def add(self, spectra, weights=1.0, mask=None, valid=None, seconds=0.0,
+          now=None):
+    """
+    Add one cycle of spectra, one per input
+
+    @param spectra : power spectra, array [input, channel]
+    @type  spectra : numpy.ndarray
+
+    @param weights : weight of each spectrum, array [input] or scalar
+    @type  weights : float or numpy.ndarray
+
+    @param mask : True for flagged channels, array [input, channel]
+    @type  mask : numpy.ndarray of bool
+
+    @param valid : False for inputs without a spectrum this cycle
+    @type  valid : numpy.ndarray of bool
+
+    @param seconds : integration time of each spectrum, array or scalar
+    @type  seconds : float or numpy.ndarray
+
+    @param now : time of the cycle; default is the current time
+    @type  now : float
+
+    @return: the dump if one was made, else None
+    """
+    if now is None:
+      now = time.time()
+    if self.start is None:
+      self.start = now
+    self._stop = now
+    w = numpy.broadcast_to(numpy.asarray(weights, dtype=float),
+                           (len(self.keys),))[:, numpy.newaxis]
+    if valid is not None:
+      w = numpy.where(valid[:, numpy.newaxis], w, 0.0)
+    w = numpy.broadcast_to(w, spectra.shape)
+    if mask is not None:
+      w = numpy.where(mask, 0.0, w)
+    # flagged channels may hold NaN, which must not get into the sums
+    self.sum += numpy.where(w > 0, w*spectra, 0.0)
+    self.weight += w
+    added = numpy.ones(len(self.keys), dtype=bool) if valid is None else valid
+    self.count += added
+    self.seconds += numpy.where(added, seconds, 0.0)
+    self._cycles += 1
+    if (self.dump_count and self._cycles >= self.dump_count) or \
+       (self.dump_seconds and now - self.start >= self.dump_seconds):
+      return self.dump()
+    return None
+
+  def acquire(self, client, masker=None, weight_by_time=True):
+    """
+    Get a spectrum from each input and add them as one cycle
+
+    @param client : source of the spectra
+    @type  client : ManagerClient instance
+
+    @param masker : optional function(keys, spectra, kurtosis) returning the
+                    flag mask [input, channel], e.g. an RFI flagger
+    @type  masker : function
+
+    @param weight_by_time : weight each spectrum by its integration time
+    @type  weight_by_time : bool
+
+    @return: the dump if one was made, else None
+    """
+    spectra = self._spectra
+    valid = self._valid
+    valid[:] = False
+    kurtosis = numpy.full(spectra.shape, numpy.nan) if masker else None
+    seconds = numpy.zeros(len(self.keys))
+    now = time.time()
+    for row, (roach, adc, rf) in enumerate(self.keys):
+      accums = client.get_accums(roach, adc, rf)
+      if not accums:
+        continue
+      spectra[row] = accums[2]
+      valid[row] = True
+      if masker is not None and 4 in accums:
+        kurtosis[row] = accums[4]
+      roachname = client.roach_keys[roach]
+      acc_len = client.register_values.get(roachname, {}).get('acc_len_m1')
+      clock = client.synth_freq.get(roachname)
+      if acc_len is not None and clock:
+        seconds[row] = spectrum_seconds(acc_len+1, self.channels, clock)
+    mask = masker(self.keys, spectra, kurtosis) if masker else None
+    weights = seconds if weight_by_time and seconds[valid].all() else 1.0
+    return self.add(spectra, weights, mask, valid, seconds, now)
+
+  def dump(self):
+    """
+    Return the integration so far and start a new one
+    """
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+      spectrum = numpy.where(self.weight > 0, self.sum/self.weight, numpy.nan)
+    result = {'keys':     self.keys,
+              'start':    self.start,
+              'stop':     self._stop,
+              'spectrum': spectrum,
+              'weight':   self.weight.copy(),
+              'count':    self.count.copy(),
+              'seconds':  self.seconds.copy()}
+    self.logger.debug("dump: %d cycles, %.1f s", self._cycles,
+                      self.seconds.max() if len(self.keys) else 0.0)
+    self.sum.fill(0.0)
+    self.weight.fill(0.0)
+    self.count.fill(0)
+    self.seconds.fill(0.0)
+    self.start = None
+    self._cycles = 0
+    if self.dumped:
+      self.dumped(result)
+    return result
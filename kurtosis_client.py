@@ -3,8 +3,131 @@
 kurtosis_client - module for client to interact with kurtosis firmware
 """
 import logging
+import threading
+
+from MCClient.tracing import traced
 
 module_logger = logging.getLogger(__name__)
+
+# registers shown by the kurtosis panel (GUI.kurtosis_GUI.Ui_kurtosisMC)
+PANEL_REGISTERS = ('adc_snap_trig', 'sync_in_sel', 'pkt_cnt_sec_rst_ctrl',
+                   'select_bits_pow', 'spec_count', 'raw_pkt_cnt_out',
+                   'raw_pkt_cnt_is_fpga_clocks', 'raw_pkt_cnt_rst_ctrl',
+                   'gbe0_tx_cnt', 'bit_select_counter_out')
+
+# one request which the server evaluates to the panel registers and the
+# 10 GbE port 0 states
+PANEL_STATUS = ("{'registers': {k: v for k, v in "
+                "self.get_register_values('%(roach)s').items() "
+                "if k in %(registers)r}, "
+                "'gbe0': self.roaches['%(roach)s'].get_gbe0_states()}")
+
+# server method which returns when watched registers change (long poll)
+WATCH_METHOD = 'wait_register_change'
+# longest a server-side watch waits before returning unchanged values
+WATCH_TIMEOUT = 5.0
+
+class RegisterWatch(object):
+  """
+  Calls back when any of a set of registers changes
+
+  If the server has WATCH_METHOD it does the polling and the thread here
+  waits for its reply.  Otherwise the thread reads just the watched registers
+  every 'period' seconds, all in one request().  The first reading is the
+  baseline; after that the callback gets the ROACH name and a dict of
+  register: (old, new) for the registers which changed.
+
+  Public attributes::
+    callback    - function(roachname, changes)
+    logger      - logger for this instance
+    period      - seconds between readings
+    registers   - names of the watched registers
+    roachname   - ROACH whose registers are watched
+    server_side - True if the server does the polling
+    values      - latest register values
+  """
+  def __init__(self, server, roachname, registers, period, callback):
+    """
+    @param server : manager server (or relay or simulator)
+
+    @param roachname : ROACH name
+    @type  roachname : str
+
+    @param registers : names of the registers
+    @type  registers : list of str
+
+    @param period : seconds between readings
+    @type  period : float
+
+    @param callback : function(roachname, changes)
+    """
+    self.logger = logging.getLogger(__name__+".RegisterWatch")
+    self.server = server
+    self.roachname = roachname
+    self.registers = tuple(registers)
+    self.period = period
+    self.callback = callback
+    methods = getattr(server, '_pyroMethods', None) or dir(server)
+    self.server_side = WATCH_METHOD in methods
+    self.values = None
+    self._request = "(" + "".join(
+                    ["self.fpga_read_uint('%s', '%s')," % (roachname, register)
+                     for register in self.registers]) + ")"
+    self._stopping = threading.Event()
+    self._thread = None
+
+  def start(self):
+    self._stopping.clear()
+    self._thread = threading.Thread(target=self._watch,
+                                    name="watch "+self.roachname, daemon=True)
+    self._thread.start()
+    self.logger.debug("start: %s %s every %.1f s (%s)", self.roachname,
+                      self.registers, self.period,
+                      "server" if self.server_side else "client")
+
+  def stop(self):
+    self._stopping.set()
+    if self._thread is not None and \
+       self._thread is not threading.current_thread():
+      self._thread.join(self.period + WATCH_TIMEOUT)
+    if getattr(type(self.server), 'release', None) is not None:
+      self.server.release()
+
+  def read(self):
+    """
+    Get the current values of the watched registers
+    """
+    if self.server_side and self.values is not None:
+      return getattr(self.server, WATCH_METHOD)(self.roachname,
+                                                 list(self.registers),
+                                                 self.values, self.period,
+                                                 WATCH_TIMEOUT)
+    return dict(zip(self.registers, self.server.request(self._request)))
+
+  def check(self, values):
+    """
+    Compare new values with the last ones and call back if any changed
+    """
+    if self.values is None:
+      self.values = values
+      return {}
+    changes = {}
+    for register in self.registers:
+      if values[register] != self.values[register]:
+        changes[register] = (self.values[register], values[register])
+    self.values = values
+    if changes:
+      self.callback(self.roachname, changes)
+    return changes
+
+  def _watch(self):
+    while not self._stopping.is_set():
+      try:
+        self.check(self.read())
+      except Exception as details:
+        self.logger.error("_watch: %s: %s", self.roachname, details)
+      if not self.server_side or self.values is None:
+        self._stopping.wait(self.period)
  
 class KurtosisClient():
   """
@@ -23,16 +146,67 @@ class KurtosisClient():
     self.logger.debug("__init__: invoked for ROACH %s", self.roach)
     self.parent = parent
 
+  @traced("kurtosis")
+  def panel_status(self, roachname, registers=PANEL_REGISTERS):
+    """
+    Get what the kurtosis panel shows with a single server request
+
+    The register values are also saved in the parent's register_values.
+
+    @param roachname : ROACH name
+    @type  roachname : str
+
+    @param registers : names of the registers wanted
+    @type  registers : tuple of str
+
+    @return: dict with 'registers' (values by name) and 'gbe0' (states)
+    """
+    status = self.parent.mgr.request(PANEL_STATUS % {'roach': roachname,
+                                              'registers': tuple(registers)})
+    self.logger.debug("panel_status: %s: %s", roachname, status)
+    self.parent.register_values.setdefault(roachname, {}).update(
+                                                          status['registers'])
+    return status
+
+  def watch(self, registers, period, callback, roachname=None):
+    """
+    Watch registers and call back when they change
+
+    @param registers : names of the registers, e.g. ['sync_in_sel']
+    @type  registers : list of str
+
+    @param period : seconds between readings
+    @type  period : float
+
+    @param callback : function(roachname, {register: (old, new)})
+
+    @param roachname : ROACH name; default is this client's ROACH
+    @type  roachname : str
+
+    @return: RegisterWatch instance, already started; stop() it when done
+    """
+    if roachname is None:
+      roachname = self.parent.roach_keys[self.roach]
+    server = self.parent.mgr
+    # a long poll must not hold the connection which the GUI requests use
+    if getattr(type(server), 'separate', None) is not None:
+      server = server.separate()
+    watch = RegisterWatch(server, roachname, registers, period, callback)
+    watch.start()
+    return watch
+
   def get_synch_select(self):
     self.synch_select[self.roach] = self.parent.mgr.fpga_read_uint(roach,
                                                                 'sync_in_sel')
     return self.synch_select[self.roach]
 
+  @traced("kurtosis")
   def sync_DSP(self,*args):
     self.logger.debug("sync_DPS: called with: %s",args)
     roach = self.parent.roach_keys[args[0]]
     self.parent.mgr.request("self.roaches["+str(roach)+"].logic.sync_DSP()")
 
+  @traced("kurtosis")
   def update_sync_select(self,*args):
     self.logger.debug("update_sync_select: called with: %s", args)
     roach       = self.parent.roach_keys[args[0]]
@@ -45,6 +219,7 @@ class KurtosisClient():
     self.parent.register_values[roach]['sync_in_sel'] = readback
     return readback
 
+  @traced("kurtosis")
   def change_ADC_snap_trigger(self, *args):
     self.logger.debug("change_ADC_snap_trigger: called with: %s", args)
     roach = self.parent.roach_keys[args[0]]
@@ -58,6 +233,7 @@ class KurtosisClient():
     self.parent.register_values[roach]['adc_snap_trig'] = readback
     return readback
 
+  @traced("kurtosis")
   def update_reset_select(self,*args):
     self.logger.debug("update_reset_select: called with: %s", args)
     roach = self.parent.roach_keys[args[0]]
@@ -66,11 +242,20 @@ class KurtosisClient():
     readback = self._write_register(roach,'pkt_cnt_sec_rst_ctrl', value)
     return readback
 
+  @traced("kurtosis")
   def reset_sec_cntr(self, *args):
     self.logger.debug("reset_sec_cntr: called with: %s", args)
     roach = self.parent.roach_keys[args[0]]
     self.parent.mgr.request("self.roaches[" +
                             str(roach) + "].logic.seconds_cntr_reset()")
+    self._note_reset(roach)
+
+  def _note_reset(self, roach):
+    """
+    Keep a counter reset from being taken for a wrap by the rate engine
+    """
+    if self.parent.counter_rates is not None:
+      self.parent.counter_rates.note_reset(roach)
 
   def _write_register(self, roach, register, value):
     self.logger.debug("_write_register: writing %d to ROACH %d %s",
@@ -81,6 +266,7 @@ class KurtosisClient():
     self.logger.debug("_write_register: returned %d", readback)
     return readback
 
+  @traced("kurtosis")
   def set_power_bits(self,*args):
     self.logger.debug("set_power_bits: called with: %s",args)
     roach = self.parent.roach_keys[args[0]]
@@ -88,6 +274,7 @@ class KurtosisClient():
     readback = self._write_register(roach, 'select_bits_pow', value)
     return readback
 
+  @traced("kurtosis")
   def set_acc_len(self, *args):
     self.logger.debug("set_acc_len: called with: %s", args)
     roach = self.parent.roach_keys[args[0]]
@@ -95,6 +282,7 @@ class KurtosisClient():
     readback = self._write_register(roach, 'acc_len_m1', value)
     return readback
 
+  @traced("kurtosis")
   def change_counter_units(self,*args):
     self.logger.debug("change_counter_units: called with: %s", args)
     roach = self.parent.roach_keys[args[0]]
@@ -103,6 +291,7 @@ class KurtosisClient():
     readback = self._write_register(roach, 'raw_pkt_cnt_is_fpga_clocks', value)
     return readback
 
+  @traced("kurtosis")
   def counter_reset_select(self,*args):
     self.logger.debug("counter_reset_select: called with: %s", args)
     roach = self.parent.roach_keys[args[0]]
@@ -111,6 +300,7 @@ class KurtosisClient():
     readback = self._write_register(roach, 'raw_pkt_cnt_rst_ctrl', value)
     return readback
 
+  @traced("kurtosis")
   def select_gbe0_data_source(self,*args):
     self.logger.debug("select_gbe0_data_source: called with: %s", args)
     roach = self.parent.roach_keys[args[0]]
@@ -119,10 +309,12 @@ class KurtosisClient():
     readback = self._write_register(roach, 'bit_select_counter_out', value)
     return readback
 
+  @traced("kurtosis")
   def reset_DSP(self, *args):
     self.logger.debug("reset_DSP: called with: %s", args)
     roach = self.parent.roach_keys[args[0]]
     self.parent.mgr.request("self.roaches[" +
                             str(roach) + "].logic.dsp_user_reset()")
+    self._note_reset(roach)
     
     
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+level_monitor - ADC level history, statistics and alarms for all RF inputs
+
+LevelMonitor calls get_ADC_levels() on a schedule and puts the levels of
+all the inputs into one ring buffer, an array [input, sample].  Each sample
+is evaluated for all the inputs at once::
+  * running mean, standard deviation, minimum and maximum over the buffer
+  * clipping: the level is at or above 'clip_level', near ADC full scale
+  * loss of signal: the level of an enabled input is at or below 'los_level'
+An alarm is raised when its condition has held for 'persist' samples in a
+row and cleared when it has not held for as many.  The callback is called
+only when an alarm is raised or cleared.
+
+The monitor can run its own thread::
+  monitor = LevelMonitor(client, period=1.0, alarm=report)
+  monitor.start()
+  ...
+  monitor.stop()
+or sample() can be called from another loop, e.g. the GUI timer.
+"""
+import logging
+import numpy
+import sys
+import threading
+import time
+
+module_logger = logging.getLogger(__name__)
+
+CLIP_LEVEL = -3.0   # dBm; the 8-bit ADC clips at about 0 dBm
+LOS_LEVEL = -40.0   # dBm
+ALARMS = ('clipping', 'no_signal')
+
+class LevelMonitor(object):
+  """
+  Ring buffer of ADC levels with statistics and alarms
+
+  Public attributes::
+    alarm      - function(key, alarm name, active, level) or None
+    clip_level - level in dBm at which an input is clipping
+    client     - ManagerClient instance
+    count      - number of samples taken
+    keys       - (roach index, adc, rf) of each input, the rows of 'levels'
+    length     - number of samples kept
+    levels     - ring buffer of levels, array [input, sample]
+    logger     - logger for this instance
+    los_level  - level in dBm at or below which the signal is lost
+    period     - seconds between samples
+    persist    - samples for which a condition must hold to change an alarm
+    times      - time of each sample in the ring buffer
+  """
+  def __init__(self, client, period=1.0, length=600, clip_level=CLIP_LEVEL,
+               los_level=LOS_LEVEL, persist=3, alarm=None):
+    """
+    @param client : source of the levels, with 'rf' made
+    @type  client : ManagerClient instance
+
+    @param period : seconds between samples
+    @type  period : float
+
+    @param length : number of samples kept for the statistics
+    @type  length : int
+
+    @param clip_level : level in dBm at which an input is clipping
+    @type  clip_level : float
+
+    @param los_level : level in dBm at or below which the signal is lost
+    @type  los_level : float
+
+    @param persist : samples for which a condition must hold
+    @type  persist : int
+
+    @param alarm : called when an alarm is raised or cleared
+    @type  alarm : function(key, alarm name, active, level)
+    """
+    self.logger = logging.getLogger(__name__+".LevelMonitor")
+    self.client = client
+    self.period = period
+    self.length = length
+    self.clip_level = clip_level
+    self.los_level = los_level
+    self.persist = persist
+    self.alarm = alarm
+    self.keys = [client.rf.key(row, by='index')
+                 for row in range(len(client.rf))]
+    self._row = dict((key, row) for row, key in enumerate(self.keys))
+    self.levels = numpy.full((len(self.keys), length), numpy.nan)
+    self.times = numpy.full(length, numpy.nan)
+    self.count = 0
+    self._latest = numpy.full(len(self.keys), numpy.nan)
+    # consecutive samples for which each alarm condition held or not
+    self._runs = dict((name, numpy.zeros(len(self.keys), dtype=int))
+                      for name in ALARMS)
+    self._active = dict((name, numpy.zeros(len(self.keys), dtype=bool))
+                        for name in ALARMS)
+    self._lock = threading.Lock()
+    self._stopping = threading.Event()
+    self._thread = None
+
+  def start(self):
+    """
+    Sample in a thread every 'period' seconds
+    """
+    self._stopping.clear()
+    self._thread = threading.Thread(target=self._schedule,
+                                    name="level monitor", daemon=True)
+    self._thread.start()
+    self.logger.info("start: %d inputs every %.1f s", len(self.keys),
+                     self.period)
+
+  def stop(self):
+    self._stopping.set()
+    if self._thread is not None:
+      self._thread.join()
+
+  def _schedule(self):
+    """
+    Sample on a fixed schedule, skipping samples if a request was too slow
+    """
+    next_time = time.time()
+    while not self._stopping.is_set():
+      try:
+        self.sample()
+      except Exception as details:
+        self.logger.error("_schedule: %s", details)
+      next_time += self.period
+      now = time.time()
+      if next_time < now:
+        skipped = int((now - next_time)//self.period) + 1
+        next_time += skipped*self.period
+        self.logger.debug("_schedule: %d samples skipped", skipped)
+      self._stopping.wait(next_time - now)
+
+  def sample(self, levels=None, now=None):
+    """
+    Take one sample of all the inputs and check the alarms
+
+    @param levels : nested dict of levels [roach index][adc][rf]; default
+                    is to get them from the server
+    @type  levels : dict
+
+    @param now : time of the sample; default is the current time
+    @type  now : float
+
+    @return: list of (key, alarm name, active, level) for alarm changes
+    """
+    if levels is None:
+      levels = self.client.mgr.get_ADC_levels()
+    if now is None:
+      now = time.time()
+    latest = self._latest
+    latest.fill(numpy.nan)
+    for roach, adcs in levels.items():
+      for adc, rfs in adcs.items():
+        for rf, level in rfs.items():
+          row = self._row.get((roach, adc, rf))
+          if row is not None:
+            latest[row] = level
+    with self._lock:
+      column = self.count % self.length
+      self.levels[:, column] = latest
+      self.times[column] = now
+      self.count += 1
+    enabled = self.client.rf.values['IF_on']
+    conditions = {'clipping':  latest >= self.clip_level,
+                  'no_signal': enabled & (latest <= self.los_level)}
+    changes = []
+    for name in ALARMS:
+      changes.extend(self._update_alarm(name, conditions[name], latest))
+    return changes
+
+  def _update_alarm(self, name, condition, latest):
+    """
+    Count how long the condition has held or not and change the alarms
+    """
+    runs = self._runs[name]
+    active = self._active[name]
+    # count runs of the condition differing from the alarm state
+    differs = condition != active
+    runs[:] = numpy.where(differs, runs + 1, 0)
+    flips = numpy.flatnonzero(runs >= self.persist)
+    changes = []
+    for row in flips:
+      active[row] = not active[row]
+      runs[row] = 0
+      change = (self.keys[row], name, bool(active[row]), latest[row].item())
+      changes.append(change)
+      if active[row]:
+        self.logger.warning("alarm: %s %s at %.2f dBm", self.keys[row], name,
+                            latest[row])
+      else:
+        self.logger.info("alarm: %s %s cleared", self.keys[row], name)
+      if self.alarm:
+        self.alarm(*change)
+    return changes
+
+  def active_alarms(self):
+    """
+    Inputs with an active alarm
+
+    @return: dict of lists of keys, indexed by alarm name
+    """
+    return dict((name, [self.keys[row]
+                        for row in numpy.flatnonzero(self._active[name])])
+                for name in ALARMS)
+
+  def statistics(self):
+    """
+    Statistics of the buffered levels of all the inputs
+
+    @return: dict of arrays [input] 'mean', 'std', 'min', 'max', 'latest'
+    """
+    with self._lock:
+      filled = min(self.count, self.length)
+      levels = self.levels[:, :filled].copy() if self.count < self.length \
+               else self.levels.copy()
+      latest = self.levels[:, (self.count-1) % self.length].copy()
+    stats = {'latest': latest}
+    if filled == 0:
+      for key in ('mean', 'std', 'min', 'max'):
+        stats[key] = numpy.full(len(self.keys), numpy.nan)
+      return stats
+    valid = ~numpy.isnan(levels)
+    count = valid.sum(axis=1)
+    values = numpy.where(valid, levels, 0.0)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+      mean = values.sum(axis=1)/count
+      deviation = numpy.where(valid, levels - mean[:, numpy.newaxis], 0.0)
+      stats['mean'] = mean
+      stats['std'] = numpy.sqrt((deviation**2).sum(axis=1)/count)
+    stats['min'] = numpy.where(count > 0,
+                      numpy.where(valid, levels, numpy.inf).min(axis=1),
+                      numpy.nan)
+    stats['max'] = numpy.where(count > 0,
+                      numpy.where(valid, levels, -numpy.inf).max(axis=1),
+                      numpy.nan)
+    return stats
+
+  def report(self):
+    """
+    Statistics as text, one line per input
+    """
+    stats = self.statistics()
+    lines = ["%-12s %8s %8s %8s %8s %8s" %
+             ("input", "latest", "mean", "std", "min", "max")]
+    for row, key in enumerate(self.keys):
+      lines.append("%-12s %8.2f %8.2f %8.3f %8.2f %8.2f" %
+                   (("%d/%d/%d" % key,) +
+                    tuple(stats[name][row] for name in
+                          ('latest', 'mean', 'std', 'min', 'max'))))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+  """
+  Monitor the ADC levels from the command line
+  """
+  from optparse import OptionParser
+  from MCClient.ManagerClient import ManagerClient
+
+  p = OptionParser()
+  p.set_usage('level_monitor.py [options]')
+  p.set_description(__doc__)
+  p.add_option('-p', '--period',
+               dest = 'period',
+               type = 'float',
+               default = 1.0,
+               help = 'Seconds between samples')
+  p.add_option('-n', '--length',
+               dest = 'length',
+               type = 'int',
+               default = 600,
+               help = 'Samples kept for the statistics')
+  p.add_option('-c', '--clip',
+               dest = 'clip',
+               type = 'float',
+               default = CLIP_LEVEL,
+               help = 'Clipping alarm level in dBm')
+  p.add_option('-s', '--los',
+               dest = 'los',
+               type = 'float',
+               default = LOS_LEVEL,
+               help = 'Loss of signal alarm level in dBm')
+  p.add_option('-r', '--report',
+               dest = 'report',
+               type = 'float',
+               default = 60.0,
+               help = 'Seconds between statistics reports')
+  p.add_option('-l', '--log_level',
+               dest = 'loglevel',
+               type = 'str',
+               default = 'warning',
+               help = 'Logging level for main program and modules')
+  opts, args = p.parse_args(sys.argv[1:])
+
+  logging.basicConfig(level=getattr(logging, opts.loglevel.upper()))
+  mylogger = logging.getLogger()
+
+  monitor = LevelMonitor(ManagerClient(), period = opts.period,
+                         length = opts.length,
+                         clip_level = opts.clip,
+                         los_level = opts.los)
+  monitor.start()
+  try:
+    while True:
+      time.sleep(opts.report)
+      print(monitor.report())
+  except KeyboardInterrupt:
+    mylogger.warning("Interrupted")
+  monitor.stop()
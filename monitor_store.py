@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+monitor_store - compressed time-series store for board monitor points
+
+Monitor points (fan speeds, MMS voltages and temperatures, ADC temperatures,
+synthesizer status, ADC levels) are kept as one column per point.  Samples
+are buffered in memory and written out when a chunk period ends.  Each chunk
+is stored as::
+  t0, v0, quantum - first time (ms), first value and quantization step
+  dt              - time differences in ms (int32)
+  dv              - differences of the quantized values (int32)
+compressed with zlib by numpy.savez_compressed.  Slowly changing points
+produce runs of equal differences which compress to almost nothing, so weeks
+of 1 Hz data need only a few MB.
+
+When raw samples are written their downsampled tiers (mean, min, max and
+count over each tier interval) are written too.  Chunk periods are a
+multiple of the longest tier interval so that no tier bin is split between
+chunks.
+
+Each flush() writes the samples buffered since the last one as a new part
+of the chunk, so a flush costs only the new samples.  The parts of a chunk
+are joined when it is read, and tier bins split between parts are merged
+using their counts.
+
+Directory layout::
+  <directory>/<tier>/<point>/<chunk start>_<part>.npz
+where tier is 'raw' or the tier interval in seconds.
+"""
+import logging
+import math
+import numpy
+import os
+
+module_logger = logging.getLogger(__name__)
+
+class MonitorStore(object):
+  """
+  Columnar store of monitor point time series
+
+  Public attributes::
+    chunk_seconds - length of a chunk in seconds
+    directory     - top of the directory tree
+    logger        - logger for this instance
+    quanta        - quantization step for each point (default 'quantum')
+    quantum       - default quantization step
+    tiers         - downsampling intervals in seconds
+  """
+  def __init__(self, directory, chunk_seconds=21600, tiers=(60, 3600),
+               quantum=0.01, quanta={}):
+    """
+    Open (or create) a store
+
+    @param directory : top of the directory tree
+    @type  directory : str
+
+    @param chunk_seconds : chunk period; a multiple of the longest tier
+    @type  chunk_seconds : int
+
+    @param tiers : downsampling intervals in seconds
+    @type  tiers : tuple of int
+
+    @param quantum : default quantization step of the values
+    @type  quantum : float
+
+    @param quanta : quantization step for specific points
+    @type  quanta : dict of float
+    """
+    self.logger = logging.getLogger(__name__+".MonitorStore")
+    if tiers and chunk_seconds % max(tiers):
+      raise ValueError("chunk length %d is not a multiple of tier %d" %
+                       (chunk_seconds, max(tiers)))
+    self.directory = directory
+    self.chunk_seconds = chunk_seconds
+    self.tiers = tuple(sorted(tiers))
+    self.quantum = quantum
+    self.quanta = dict(quanta)
+    self._buffers = {}  # point -> (chunk start, list of times, list of values)
+    self._parts = {}    # point -> (chunk start, next part number)
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  def append(self, timestamp, points):
+    """
+    Add one sample of each of a set of monitor points
+
+    @param timestamp : time.time() of the sample
+    @type  timestamp : float
+
+    @param points : values indexed by point name
+    @type  points : dict of float
+    """
+    chunk = int(timestamp // self.chunk_seconds) * self.chunk_seconds
+    for name, value in points.items():
+      if value is None:
+        continue
+      buf = self._buffers.get(name)
+      if buf is None or buf[0] != chunk:
+        if buf is not None:
+          self._flush_point(name, buf)
+        buf = (chunk, [], [])
+        self._buffers[name] = buf
+      buf[1].append(timestamp)
+      buf[2].append(float(value))
+
+  def flush(self):
+    """
+    Write all buffered samples, as a new part of each point's chunk
+    """
+    for name, buf in self._buffers.items():
+      if buf[1]:
+        self._flush_point(name, buf)
+        del buf[1][:]
+        del buf[2][:]
+
+  close = flush
+
+  def points(self):
+    """
+    Names of all the points in the store
+    """
+    names = set(self._buffers.keys())
+    rawdir = os.path.join(self.directory, 'raw')
+    if os.path.isdir(rawdir):
+      names.update(os.listdir(rawdir))
+    return sorted(names)
+
+  def query(self, name, start, stop, max_points=None):
+    """
+    Get the samples of a point between two times
+
+    If 'max_points' is given, the finest tier which has no more than that
+    many samples in the range is used.  For a downsampled tier the result
+    also has 'min', 'max' and 'count' arrays.  Samples not yet flushed are
+    included.
+
+    @param name : point name
+    @type  name : str
+
+    @param start : time.time() of the start of the range
+    @type  start : float
+
+    @param stop : time.time() of the end of the range
+    @type  stop : float
+
+    @param max_points : optional maximum number of samples wanted
+    @type  max_points : int
+
+    @return: dict with 'time', 'value' and possibly 'min', 'max' arrays
+    """
+    tier = 'raw'
+    if max_points:
+      for interval in (1,) + self.tiers:
+        tier = 'raw' if interval == 1 else str(interval)
+        if (stop - start)/interval <= max_points:
+          break
+    columns = {}
+    for chunk in self._chunks(tier, name, start, stop):
+      for key, array in chunk.items():
+        columns.setdefault(key, []).append(array)
+    if name in self._buffers and self._buffers[name][1]:
+      chunk, times, values = self._buffers[name]
+      times, values = numpy.array(times), numpy.array(values)
+      if tier == 'raw':
+        buffered = {'time': times, 'value': values}
+      else:
+        buffered = self._downsample(chunk, times, values, int(tier))
+      for key, array in buffered.items():
+        columns.setdefault(key, []).append(array)
+    if not columns:
+      return {'time': numpy.zeros(0), 'value': numpy.zeros(0)}
+    result = {}
+    for key, arrays in columns.items():
+      result[key] = numpy.concatenate(arrays)
+    if tier != 'raw':
+      result = self._merge_bins(result)
+    selected = (result['time'] >= start) & (result['time'] <= stop)
+    for key in result:
+      result[key] = result[key][selected]
+    return result
+
+  def _downsample(self, chunk, times, values, interval):
+    """
+    Mean, min, max and count of the samples in each tier bin
+    """
+    bins = ((times - chunk) // interval).astype(int)
+    used = numpy.unique(bins)
+    count = numpy.bincount(bins)[used]
+    mean = numpy.bincount(bins, weights=values)[used]/count
+    low = numpy.full(used.size, numpy.inf)
+    high = numpy.full(used.size, -numpy.inf)
+    slot = numpy.searchsorted(used, bins)
+    numpy.minimum.at(low, slot, values)
+    numpy.maximum.at(high, slot, values)
+    return {'time': chunk + (used + 0.5)*interval, 'value': mean,
+            'min': low, 'max': high, 'count': count}
+
+  def _merge_bins(self, result):
+    """
+    Combine tier bins with the same time, from different parts of a chunk
+    """
+    if 'count' not in result:
+      result['count'] = numpy.ones(len(result['time']), dtype=int)
+    times, slot = numpy.unique(result['time'], return_inverse=True)
+    if len(times) == len(result['time']):
+      order = numpy.argsort(result['time'], kind='stable')
+      return dict((key, array[order]) for key, array in result.items())
+    count = numpy.bincount(slot, weights=result['count'])
+    merged = {'time': times,
+              'value': numpy.bincount(slot, weights=result['value']*
+                                                    result['count'])/count,
+              'count': count.astype(int)}
+    if 'min' in result:
+      merged['min'] = numpy.full(len(times), numpy.inf)
+      numpy.minimum.at(merged['min'], slot, result['min'])
+    if 'max' in result:
+      merged['max'] = numpy.full(len(times), -numpy.inf)
+      numpy.maximum.at(merged['max'], slot, result['max'])
+    return merged
+
+  # ------------------------------ chunk files -------------------------------
+
+  def _path(self, tier, name, chunk, part):
+    return os.path.join(self.directory, tier, name,
+                        "%d_%d.npz" % (chunk, part))
+
+  def _parts_on_disk(self, tier, name):
+    """
+    (chunk start, part) of the files of a point, in time order
+    """
+    pointdir = os.path.join(self.directory, tier, name)
+    if not os.path.isdir(pointdir):
+      return []
+    return sorted(tuple(int(n) for n in f[:-4].split('_'))
+                  for f in os.listdir(pointdir) if f.endswith('.npz'))
+
+  def _chunks(self, tier, name, start, stop):
+    """
+    Generator of the decoded chunk parts which overlap a time range
+    """
+    first = int(start // self.chunk_seconds) * self.chunk_seconds
+    for chunk, part in self._parts_on_disk(tier, name):
+      if first <= chunk <= stop:
+        yield self._read_chunk(self._path(tier, name, chunk, part))
+
+  def _flush_point(self, name, buf):
+    chunk, times, values = buf
+    if not times:
+      return
+    times = numpy.array(times)
+    values = numpy.array(values)
+    if self._parts.get(name, (None,))[0] != chunk:
+      # parts already written, e.g. by an earlier session
+      parts = [p for c, p in self._parts_on_disk('raw', name) if c == chunk]
+      self._parts[name] = (chunk, max(parts) + 1 if parts else 0)
+    part = self._parts[name][1]
+    self._parts[name] = (chunk, part + 1)
+    quantum = self.quanta.get(name, self.quantum)
+    self._write_chunk(self._path('raw', name, chunk, part), times, values,
+                      quantum)
+    for interval in self.tiers:
+      bins = self._downsample(chunk, times, values, interval)
+      self._write_chunk(self._path(str(interval), name, chunk, part),
+                        bins['time'], bins['value'], quantum,
+                        low=bins['min'], high=bins['max'],
+                        count=bins['count'])
+    self.logger.debug("_flush_point: %s chunk %d part %d has %d samples",
+                      name, chunk, part, len(times))
+
+  def _write_chunk(self, path, times, values, quantum, low=None, high=None,
+                   count=None):
+    """
+    Delta-encode and compress one column chunk
+    """
+    pointdir = os.path.dirname(path)
+    if not os.path.isdir(pointdir):
+      os.makedirs(pointdir)
+    ms = numpy.round(times*1000).astype(numpy.int64)
+    arrays = {'t0': ms[0], 'quantum': quantum,
+              'dt': numpy.diff(ms).astype(numpy.int32)}
+    for key, column in (('v', values), ('lo', low), ('hi', high)):
+      if column is not None:
+        q = numpy.round(column/quantum).astype(numpy.int64)
+        arrays[key+'0'] = q[0]
+        arrays['d'+key] = numpy.diff(q).astype(numpy.int32)
+    if count is not None:
+      arrays['n'] = count.astype(numpy.int32)
+    numpy.savez_compressed(path, **arrays)
+
+  def _read_chunk(self, path):
+    """
+    Decode one column chunk
+    """
+    with numpy.load(path) as data:
+      times = int(data['t0']) + numpy.concatenate(
+                     ([0], numpy.cumsum(data['dt'], dtype=numpy.int64)))
+      result = {'time': times/1000.}
+      quantum = float(data['quantum'])
+      for key, name in (('v', 'value'), ('lo', 'min'), ('hi', 'max')):
+        if key+'0' in data.files:
+          q = int(data[key+'0']) + numpy.concatenate(
+                    ([0], numpy.cumsum(data['d'+key], dtype=numpy.int64)))
+          result[name] = q*quantum
+      if 'n' in data.files:
+        result['count'] = data['n'].astype(int)
+    return result
+
+def flatten_points(prefix, values, separator='.'):
+  """
+  Flatten nested monitor data into point names
+
+  For example, {'roach1': {0: 5400}} with prefix 'fan' becomes
+  {'fan.roach1.0': 5400}.  Values which are not numbers are left out.
+
+  @param prefix : first part of the point names
+  @type  prefix : str
+
+  @param values : possibly nested dict of values
+  @type  values : dict
+
+  @return: dict of float
+  """
+  points = {}
+  if isinstance(values, dict):
+    for key, value in values.items():
+      points.update(flatten_points(prefix+separator+str(key), value,
+                                   separator))
+  elif isinstance(values, (bool, int, float)) and not \
+       (isinstance(values, float) and math.isnan(values)):
+    points[prefix] = float(values)
+  return points
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+rates - packet and spectrum rates from the kurtosis firmware counters
+
+The kurtosis firmware has three 32-bit counters::
+  spec_count      - spectra (integrations) since the last reset
+  raw_pkt_cnt_out - packets made by the DSP, or FPGA clock ticks if
+                    raw_pkt_cnt_is_fpga_clocks is set
+  gbe0_tx_cnt     - packets sent by 10 GbE port 0
+
+CounterRateEngine keeps the last value of each counter of every board in an
+array and turns a new set of register values into rates in one vectorized
+step.  A counter which goes down has wrapped, unless it has been reset::
+  * a reset was noted with note_reset() (e.g. after the Reset buttons)
+  * the board resets that counter itself (pkt_cnt_sec_rst_ctrl or
+    raw_pkt_cnt_rst_ctrl is set)
+  * a wrap would mean more than half the counter range in one interval
+After a reset the interval is not used, since the time of the reset is not
+known; the rate is carried over from before.  A counter which the board
+resets itself every RESET_PERIOD may also have been reset in an interval in
+which it went up, so for those counters only intervals shorter than
+RESET_PERIOD are used.
+
+The rates are smoothed with an exponentially weighted moving average with
+time constant 'tau', so irregular sampling intervals are weighted properly.
+The drop estimate is the DSP packet rate less the transmitted packet rate.
+"""
+import logging
+import math
+import time
+
+import numpy
+
+module_logger = logging.getLogger(__name__)
+
+COUNTERS = ('spec_count', 'raw_pkt_cnt_out', 'gbe0_tx_cnt')
+COUNTER_RANGE = 2**32
+# registers which make the board reset counters by itself
+RESET_CONTROLS = {'pkt_cnt_sec_rst_ctrl': COUNTERS,
+                  'raw_pkt_cnt_rst_ctrl': ('raw_pkt_cnt_out',)}
+RESET_PERIOD = 1.0  # seconds between the board's own counter resets
+
+class CounterRateEngine(object):
+  """
+  Smoothed counter rates for all the boards
+
+  Public attributes::
+    counters - names of the counters, the columns of the arrays
+    drops    - estimated packets/s lost between the DSP and 10 GbE port 0,
+               array [board]; nan if raw_pkt_cnt_out counts clock ticks
+    last     - last counter values, array [board, counter]
+    logger   - logger for this instance
+    names    - ROACH names, the rows of the arrays
+    rate     - smoothed counts/s, array [board, counter]
+    resets   - number of resets seen, array [board, counter]
+    tau      - smoothing time constant in seconds
+    times    - time of the last values, array [board]
+  """
+  def __init__(self, names, counters=COUNTERS, tau=5.0):
+    """
+    @param names : ROACH names
+    @type  names : list of str
+
+    @param counters : counter registers
+    @type  counters : tuple of str
+
+    @param tau : smoothing time constant in seconds
+    @type  tau : float
+    """
+    self.logger = logging.getLogger(__name__+".CounterRateEngine")
+    self.names = list(names)
+    self.counters = tuple(counters)
+    self.tau = tau
+    self._row = dict((name, row) for row, name in enumerate(self.names))
+    shape = (len(self.names), len(self.counters))
+    self.last = numpy.full(shape, numpy.nan)
+    self.rate = numpy.full(shape, numpy.nan)
+    self.resets = numpy.zeros(shape, dtype=int)
+    self.times = numpy.full(len(self.names), numpy.nan)
+    self.drops = numpy.full(len(self.names), numpy.nan)
+    self._new = numpy.full(shape, numpy.nan)
+    self._self_reset = numpy.zeros(shape, dtype=bool)
+    self._noted = numpy.zeros(shape, dtype=bool)
+    self._clocks = numpy.zeros(len(self.names), dtype=bool)
+
+  def note_reset(self, roachname, counters=None):
+    """
+    Note that counters were reset, so the next decrease is not a wrap
+
+    @param counters : counters which were reset; default all
+    @type  counters : list of str
+    """
+    row = self._row[roachname]
+    for counter in counters or self.counters:
+      self._noted[row, self.counters.index(counter)] = True
+
+  def update(self, register_values, now=None):
+    """
+    Take new counter values for any of the boards
+
+    @param register_values : register values by name, indexed by ROACH name
+    @type  register_values : dict of dicts
+
+    @param now : time of the values; default is the current time
+    @type  now : float
+
+    @return: smoothed rates, array [board, counter]
+    """
+    if now is None:
+      now = time.time()
+    new = self._new
+    new.fill(numpy.nan)
+    for name, values in register_values.items():
+      row = self._row.get(name)
+      if row is None or not values:
+        continue
+      for column, counter in enumerate(self.counters):
+        if counter in values:
+          new[row, column] = values[counter]
+      self._self_reset[row] = False
+      for control, counters in RESET_CONTROLS.items():
+        if values.get(control, 0):
+          for counter in counters:
+            if counter in self.counters:
+              self._self_reset[row, self.counters.index(counter)] = True
+      self._clocks[row] = bool(values.get('raw_pkt_cnt_is_fpga_clocks', 0))
+
+    fresh = ~numpy.isnan(new)
+    seen = fresh & ~numpy.isnan(self.last)
+    dt = (now - self.times)[:, numpy.newaxis]
+    with numpy.errstate(invalid='ignore', divide='ignore', over='ignore'):
+      delta = new - self.last
+      down = seen & (delta < 0)
+      delta[down] += COUNTER_RANGE
+      reset = (down & (self._self_reset | (delta > COUNTER_RANGE/2))) | \
+              (seen & self._noted)
+      # an interval as long as the reset period may hide a reset
+      spans = self._self_reset & (dt >= RESET_PERIOD)
+      use = seen & ~reset & ~spans & (dt > 0)
+      instant = delta/dt
+      alpha = 1.0 - numpy.exp(-dt/self.tau)
+      smoothed = numpy.where(numpy.isnan(self.rate), instant,
+                             self.rate + alpha*(instant - self.rate))
+    self.rate[use] = smoothed[use]
+    self.resets += reset
+    self._noted[fresh] = False
+    self.last[fresh] = new[fresh]
+    self.times[fresh.any(axis=1)] = now
+    self._estimate_drops()
+    return self.rate
+
+  def _estimate_drops(self):
+    if 'raw_pkt_cnt_out' not in self.counters or \
+       'gbe0_tx_cnt' not in self.counters:
+      return
+    made = self.rate[:, self.counters.index('raw_pkt_cnt_out')]
+    sent = self.rate[:, self.counters.index('gbe0_tx_cnt')]
+    self.drops[:] = numpy.maximum(made - sent, 0.0)
+    self.drops[self._clocks] = numpy.nan
+
+  def rates(self, roachname):
+    """
+    Rates for one board
+
+    @return: dict of counts/s by counter name, and 'drops'
+    """
+    row = self._row[roachname]
+    report = dict(zip(self.counters, self.rate[row].tolist()))
+    report['drops'] = self.drops[row].item()
+    return report
+
+def format_rate(rate, unit="/s"):
+  """
+  Text for a rate, or '--' if it is not known yet
+  """
+  if rate is None or math.isnan(rate):
+    return "--"
+  if rate >= 1e6:
+    return "%.2fM%s" % (rate/1e6, unit)
+  if rate >= 1e3:
+    return "%.1fk%s" % (rate/1e3, unit)
+  return "%.1f%s" % (rate, unit)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+relay - local caching relay between many GUIs and one manager connection
+
+Every ManagerClient, observatory GUI or kurtosis panel normally opens its own
+Pyro5 proxy to the central server and polls the same data.  The relay holds
+the only upstream connection and serves any number of local clients::
+
+  managerClientUI --+
+  observatoryCtrl --+--> relay (port 50016) --> central server (port 50015)
+  spectra_recorder -+
+
+Replies to read methods are cached, as are request() and hdwr() calls which
+only read (see module server_methods).  A refresh thread re-reads every
+cached call that a client has asked for recently, once per refresh period,
+so the load on the upstream server depends on what is being displayed and
+not on how many GUIs display it.  Writes are passed through and clear the
+cache.  Calls which make the server refresh its own state, such as
+get_firmware_states(), are passed through every time.  Cache hits do not
+wait for upstream calls in progress.  Only the relayed server methods are
+exposed to the clients.
+
+Clients connect to the relay instead of the server, e.g.::
+  ManagerClient(uri="PYRO:DSS-43@localhost:50016")
+
+Start it with::
+  python relay.py [-p port] [-u upstream URI] [-r refresh period]
+"""
+import logging
+import sys
+import threading
+import time
+
+import Pyro5.api
+
+from MCClient.server_methods import (READ_METHODS, FRESH_METHODS,
+                                     WRITE_METHODS, request_kind, hdwr_kind)
+
+module_logger = logging.getLogger(__name__)
+
+UPSTREAM_URI = "PYRO:DSS-43@localhost:50015"
+RELAY_PORT = 50016
+
+class ManagerRelay(object):
+  """
+  Pyro5 server object which stands in for the central server
+
+  Public attributes::
+    hits     - number of calls answered from the cache
+    idle     - seconds after the last request when a call is no longer
+               refreshed
+    logger   - logger for this instance
+    misses   - number of calls which went upstream
+    period   - seconds between refreshes of the cache
+  """
+  def __init__(self, upstream_uri=UPSTREAM_URI, period=1.0, idle=30.0):
+    """
+    Connect to the upstream server
+
+    @param upstream_uri : URI of the central server
+    @type  upstream_uri : str
+
+    @param period : seconds between cache refreshes
+    @type  period : float
+
+    @param idle : seconds without requests after which a call is forgotten
+    @type  idle : float
+    """
+    self.logger = logging.getLogger(__name__+".ManagerRelay")
+    self.period = period
+    self.idle = idle
+    self.hits = 0
+    self.misses = 0
+    self._upstream = Pyro5.api.Proxy(upstream_uri)
+    # the cache lock is held only to look up and update the dicts; the
+    # upstream lock serializes the calls on the single connection
+    self._lock = threading.Lock()
+    self._upstream_lock = threading.Lock()
+    self._generation = 0   # incremented by writes, which clear the cache
+    self._cache = {}       # key -> reply
+    self._last_asked = {}  # key -> time of the last client request
+    self._keys = {}        # key -> (method, args, kwargs)
+    self._running = threading.Event()
+    self._running.set()
+    self._refresher = threading.Thread(target=self._refresh_loop,
+                                       name="refresh", daemon=True)
+    self._refresher.start()
+    self.logger.info("__init__: relaying %s every %.1f s",
+                     upstream_uri, period)
+
+  def stop(self):
+    self._running.clear()
+    self._refresher.join()
+
+  def _call_upstream(self, method, args, kwargs):
+    """
+    Make a call on the single upstream connection
+
+    Pyro5 proxies belong to one thread so the proxy is claimed by whichever
+    thread is using it under the upstream lock.
+    """
+    with self._upstream_lock:
+      self._upstream._pyroClaimOwnership()
+      return getattr(self._upstream, method)(*args, **kwargs)
+
+  def _store(self, key, reply, generation):
+    """
+    Cache a reply unless a write has cleared the cache since it was asked for
+    """
+    with self._lock:
+      if generation == self._generation and key in self._keys:
+        self._cache[key] = reply
+
+  def _read(self, method, args, kwargs={}):
+    key = (method, repr(args), repr(sorted(kwargs.items())))
+    with self._lock:
+      self._last_asked[key] = time.time()
+      if key in self._cache:
+        self.hits += 1
+        return self._cache[key]
+      self.misses += 1
+      self._keys[key] = (method, args, kwargs)
+      generation = self._generation
+    reply = self._call_upstream(method, args, kwargs)
+    self._store(key, reply, generation)
+    return reply
+
+  def _write(self, method, args, kwargs={}):
+    reply = self._call_upstream(method, args, kwargs)
+    with self._lock:
+      self._generation += 1
+      self._cache.clear()
+    self.logger.debug("_write: %s%s; cache cleared", method, args)
+    return reply
+
+  def _refresh_loop(self):
+    while self._running.is_set():
+      started = time.time()
+      with self._lock:
+        keys = list(self._keys.items())
+      for key, (method, args, kwargs) in keys:
+        with self._lock:
+          if started - self._last_asked.get(key, 0) > self.idle:
+            self._cache.pop(key, None)
+            self._keys.pop(key, None)
+            self._last_asked.pop(key, None)
+            continue
+          generation = self._generation
+        try:
+          reply = self._call_upstream(method, args, kwargs)
+        except Exception:
+          self.logger.error("_refresh_loop: %s%s failed", method, args,
+                            exc_info=True)
+          with self._lock:
+            self._cache.pop(key, None)
+        else:
+          self._store(key, reply, generation)
+      time.sleep(max(0, self.period - (time.time() - started)))
+
+  # -------------------------- special cases --------------------------------
+
+  @Pyro5.api.expose
+  def hdwr(self, device, method, args=[], kwargs={}):
+    """
+    Generic hardware call; cached only for known read-only methods
+    """
+    if hdwr_kind(device, method) == 'read':
+      return self._read('hdwr', (device, method, args, kwargs))
+    return self._write('hdwr', (device, method, args, kwargs))
+
+  @Pyro5.api.expose
+  def request(self, expression):
+    """
+    Evaluate an expression on the server; cached if it only reads
+    """
+    kind = request_kind(expression)
+    if kind == 'refresh':
+      return self._call_upstream('request', (expression,), {})
+    if kind == 'read':
+      return self._read('request', (expression,))
+    return self._write('request', (expression,))
+
+  @Pyro5.api.expose
+  def relay_stats(self):
+    """
+    Report how well the cache works
+    """
+    with self._lock:
+      return {'hits': self.hits, 'misses': self.misses,
+              'cached': len(self._cache)}
+
+def _make_relay_method(name, kind):
+  """
+  Create a ManagerRelay method for a remote method of the central server
+  """
+  def relayed(self, *args, **kwargs):
+    if kind == 'read':
+      return self._read(name, args, kwargs)
+    elif kind == 'fresh':
+      return self._call_upstream(name, args, kwargs)
+    else:
+      return self._write(name, args, kwargs)
+  relayed.__name__ = name
+  relayed.__doc__ = "Relayed %s call to %s()" % (kind, name)
+  return Pyro5.api.expose(relayed)
+
+for _name in READ_METHODS:
+  setattr(ManagerRelay, _name, _make_relay_method(_name, 'read'))
+for _name in FRESH_METHODS:
+  setattr(ManagerRelay, _name, _make_relay_method(_name, 'fresh'))
+for _name in WRITE_METHODS:
+  setattr(ManagerRelay, _name, _make_relay_method(_name, 'write'))
+
+if __name__ == "__main__":
+  from optparse import OptionParser
+  p = OptionParser()
+  p.set_usage('relay.py [options]')
+  p.set_description(__doc__)
+  p.add_option('-p', '--port',
+               dest = 'port',
+               type = 'int',
+               default = RELAY_PORT,
+               help = 'Port on which the relay listens')
+  p.add_option('-u', '--upstream',
+               dest = 'upstream',
+               type = 'str',
+               default = UPSTREAM_URI,
+               help = 'URI of the central server')
+  p.add_option('-r', '--refresh',
+               dest = 'period',
+               type = 'float',
+               default = 1.0,
+               help = 'Seconds between cache refreshes')
+  p.add_option('-l', '--log_level',
+               dest = 'loglevel',
+               type = 'str',
+               default = 'warning',
+               help = 'Logging level for main program and modules')
+  opts, args = p.parse_args(sys.argv[1:])
+
+  logging.basicConfig(level=getattr(logging, opts.loglevel.upper()))
+  relay = ManagerRelay(opts.upstream, period=opts.period)
+  daemon = Pyro5.api.Daemon(host="localhost", port=opts.port)
+  uri = daemon.register(relay, objectId="DSS-43")
+  module_logger.warning("relay is %s", uri)
+  try:
+    daemon.requestLoop()
+  finally:
+    relay.stop()
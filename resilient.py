@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+resilient - Pyro5 proxy with timeouts, reconnection and hedged reads
+
+A plain Pyro5 proxy waits forever for a reply and gives up on the first
+communication error.  ResilientProxy stands in for it::
+
+  proxy = ResilientProxy("PYRO:DSS-43@localhost:50015", hedge_after=0.5)
+  proxy.connect(tries=5)
+  levels = proxy.get_ADC_levels()
+
+Every call has a timeout budget, looked up by method name in 'timeouts'.
+A read which fails with a communication error (including a timeout) is
+retried after reconnecting, waiting twice as long (plus jitter) after each
+failure.  request() and hdwr() calls count as reads if module
+server_methods classifies them so.  A write is not repeated once it may
+have reached the server; it is only retried if the connection could not be
+made in the first place.
+
+For the methods in 'hedged', if the reply has not come within 'hedge_after'
+seconds the same call is also made on a second connection and the first
+reply is used.  This bounds the tail latency of the periodic reads without
+ever duplicating a write.
+
+The proxies are claimed by whichever thread uses them, under a lock, so one
+ResilientProxy can be used from several threads.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import Pyro5.api
+import Pyro5.errors
+
+from MCClient.server_methods import READ_METHODS, request_kind, hdwr_kind
+
+module_logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10.0
+# seconds allowed for specific methods
+TIMEOUTS = {'get_ADC_levels':       3.0,
+            'get_temperatures':     3.0,
+            'check_fans':           3.0,
+            'get_MMS_analog':       3.0,
+            'get_spectra':          5.0,
+            'get_ADC_samples':      5.0,
+            'get_firmware_summary': 30.0,
+            'hdwr':                 30.0,
+            'wait_register_change': 10.0,
+            'attach_roach':         120.0}
+# methods which may be sent a second time
+IDEMPOTENT = set(READ_METHODS) | set(['get_spectra', 'get_ADC_samples',
+                                      'wait_register_change'])
+# methods for which a slow reply is hedged by default
+HEDGED = ('get_ADC_levels', 'get_temperatures', 'check_fans',
+          'get_MMS_analog')
+
+def idempotent(name, args=(), kwargs={}):
+  """
+  True if a call may be sent a second time
+
+  request() and hdwr() calls are classified by their arguments.
+  """
+  if name in IDEMPOTENT:
+    return True
+  if name == 'request':
+    expression = args[0] if args else kwargs.get('expression', '')
+    return request_kind(expression) != 'write'
+  if name == 'hdwr':
+    device = args[0] if args else kwargs.get('device')
+    method = args[1] if len(args) > 1 else kwargs.get('method')
+    return hdwr_kind(device, method) == 'read'
+  return False
+
+class ResilientProxy(object):
+  """
+  Stand-in for a Pyro5 proxy which survives slow and broken connections
+
+  Public attributes::
+    backoff     - seconds to wait after the first failure
+    hedge_after - seconds before a hedged call goes to the second connection,
+                  or None for no hedging
+    hedged      - names of the methods which may be hedged
+    hedges      - number of calls which were hedged
+    logger      - logger for this instance
+    max_backoff - longest wait between attempts
+    reconnects  - number of reconnections
+    retries     - number of extra attempts for a read
+    timeouts    - seconds allowed for a call, by method name
+    uri         - the server
+  """
+  def __init__(self, uri, timeouts=TIMEOUTS, default_timeout=DEFAULT_TIMEOUT,
+               retries=3, backoff=0.5, max_backoff=30.0,
+               hedge_after=None, hedged=HEDGED):
+    """
+    @param uri : server URI
+    @type  uri : str
+
+    @param timeouts : seconds allowed for specific methods
+    @type  timeouts : dict of float
+
+    @param default_timeout : seconds allowed for other methods
+    @type  default_timeout : float
+
+    @param retries : extra attempts for a read which fails
+    @type  retries : int
+
+    @param backoff : seconds to wait after the first failure
+    @type  backoff : float
+
+    @param max_backoff : longest wait between attempts
+    @type  max_backoff : float
+
+    @param hedge_after : seconds to wait for a hedged method before asking
+                         the second connection; None to disable hedging
+    @type  hedge_after : float
+
+    @param hedged : methods which may be hedged
+    @type  hedged : list of str
+    """
+    self.__dict__['logger'] = logging.getLogger(__name__+".ResilientProxy")
+    self.__dict__['uri'] = uri
+    self.__dict__['timeouts'] = dict(timeouts)
+    self.__dict__['default_timeout'] = default_timeout
+    self.__dict__['retries'] = retries
+    self.__dict__['backoff'] = backoff
+    self.__dict__['max_backoff'] = max_backoff
+    self.__dict__['hedge_after'] = hedge_after
+    self.__dict__['hedged'] = set(hedged)
+    self.__dict__['hedges'] = 0
+    self.__dict__['reconnects'] = 0
+    self.__dict__['_proxies'] = [Pyro5.api.Proxy(uri)]
+    self.__dict__['_locks'] = [threading.Lock()]
+    self.__dict__['_pool'] = None
+
+  def __setattr__(self, name, value):
+    if name.startswith('_pyro'):
+      setattr(self._proxies[0], name, value)
+    else:
+      self.__dict__[name] = value
+
+  def __getattr__(self, name):
+    if name.startswith('_pyro'):
+      return getattr(self._proxies[0], name)
+    if name.startswith('__'):
+      raise AttributeError(name)
+    def remote(*args, **kwargs):
+      return self.call(name, args, kwargs)
+    remote.__name__ = name
+    return remote
+
+  def connect(self, tries=5):
+    """
+    Bind to the server, waiting longer after each failure
+
+    @param tries : number of attempts
+    @type  tries : int
+    """
+    for attempt in range(tries):
+      try:
+        with self._locks[0]:
+          self._proxies[0]._pyroClaimOwnership()
+          self._proxies[0]._pyroTimeout = self.default_timeout
+          self._proxies[0]._pyroBind()
+        return
+      except Pyro5.errors.CommunicationError as details:
+        if attempt == tries-1:
+          raise
+        delay = self._delay(attempt)
+        self.logger.warning("connect: %s; trying again in %.1f s",
+                            details, delay)
+        time.sleep(delay)
+
+  def separate(self):
+    """
+    A connected ResilientProxy of its own to the same server, same rules
+
+    Calls hold the connection until they return, so a long poll such as
+    wait_register_change() needs a connection which no one else waits for.
+    """
+    proxy = ResilientProxy(self.uri, timeouts=self.timeouts,
+                           default_timeout=self.default_timeout,
+                           retries=self.retries, backoff=self.backoff,
+                           max_backoff=self.max_backoff,
+                           hedge_after=self.hedge_after, hedged=self.hedged)
+    proxy.connect()
+    return proxy
+
+  def release(self):
+    """
+    Close the connections
+    """
+    for proxy, lock in zip(self._proxies, self._locks):
+      with lock:
+        proxy._pyroClaimOwnership()
+        proxy._pyroRelease()
+
+  def call(self, name, args=(), kwargs={}):
+    """
+    Call a remote method with the timeout, retry and hedging rules
+
+    @param name : remote method name
+    @type  name : str
+    """
+    if self.hedge_after is not None and name in self.hedged:
+      return self._hedged_call(name, args, kwargs)
+    return self._call(0, name, args, kwargs)
+
+  def _delay(self, attempt):
+    delay = min(self.max_backoff, self.backoff*2**attempt)
+    return delay*(0.5 + random.random()/2)
+
+  def _call(self, which, name, args, kwargs):
+    """
+    Call a method on one of the connections, retrying reads
+    """
+    proxy = self._proxies[which]
+    lock = self._locks[which]
+    timeout = self.timeouts.get(name, self.default_timeout)
+    attempts = self.retries + 1 if idempotent(name, args, kwargs) else 1
+    for attempt in range(attempts):
+      with lock:
+        proxy._pyroClaimOwnership()
+        proxy._pyroTimeout = timeout
+        try:
+          if proxy._pyroConnection is None:
+            # nothing has been sent yet so even a write can wait for this
+            self._reconnect(proxy)
+          return getattr(proxy, name)(*args, **kwargs)
+        except Pyro5.errors.CommunicationError as details:
+          error = details
+          proxy._pyroRelease()
+      if attempt < attempts-1:
+        delay = self._delay(attempt)
+        self.logger.warning("_call: %s failed (%s); retrying in %.1f s",
+                            name, error, delay)
+        time.sleep(delay)
+    self.logger.error("_call: %s failed: %s", name, error)
+    raise error
+
+  def _reconnect(self, proxy):
+    """
+    Make a new connection, waiting longer after each failure
+    """
+    for attempt in range(self.retries + 1):
+      try:
+        proxy._pyroReconnect(tries=1)
+        self.__dict__['reconnects'] += 1
+        return
+      except Pyro5.errors.CommunicationError as details:
+        if attempt == self.retries:
+          raise
+        delay = self._delay(attempt)
+        self.logger.warning("_reconnect: %s; trying again in %.1f s",
+                            details, delay)
+        time.sleep(delay)
+
+  def _hedged_call(self, name, args, kwargs):
+    """
+    Call on the main connection and, if it is slow, on the second one too
+    """
+    if self._pool is None:
+      self.__dict__['_pool'] = ThreadPoolExecutor(max_workers=4)
+      self._proxies.append(Pyro5.api.Proxy(self.uri))
+      self._locks.append(threading.Lock())
+    first = self._pool.submit(self._call, 0, name, args, kwargs)
+    done, pending = wait([first], timeout=self.hedge_after)
+    if done:
+      return first.result()
+    self.__dict__['hedges'] += 1
+    self.logger.debug("_hedged_call: %s is slow; hedging", name)
+    second = self._pool.submit(self._call, 1, name, args, kwargs)
+    pending = set([first, second])
+    while pending:
+      done, pending = wait(pending, return_when=FIRST_COMPLETED)
+      for future in done:
+        try:
+          return future.result()
+        except Pyro5.errors.CommunicationError as details:
+          error = details
+    raise error
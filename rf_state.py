@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+rf_state - per RF input state in one NumPy structured array
+
+The gains, enable states, ADC levels and IF sources of the RF inputs are
+kept in one row per (roach, adc, rf) input.  A coordinate table gives the
+row of an input whether the ROACH is named ('roach1') or indexed (0), as
+the server does for different methods.
+
+New replies from the server are read into a column and compared with the
+old values in one vectorized step; only the rows which changed are written
+back.  The nested dicts which the GUI rows and older code use are made once
+and then updated in place, so a refresh allocates no new dicts.
+"""
+import logging
+import numpy
+
+module_logger = logging.getLogger(__name__)
+
+FIELDS = [('gain',   'f8'),   # dB
+          ('IF_on',  '?'),
+          ('level',  'f8'),   # dBm
+          ('source', 'i2')]   # IF switch input
+
+COORDINATES = [('roach', 'i2'),   # index in the BoardRegistry
+               ('adc',   'i1'),
+               ('rf',    'i1')]
+
+class RFState(object):
+  """
+  Structured array of RF input states
+
+  Public attributes::
+    boards      - BoardRegistry of the ROACH names
+    coordinates - structured array of (roach index, adc, rf) for each row
+    logger      - logger for this instance
+    names       - ROACH name of each row
+    values      - structured array with a column for each field
+  """
+  def __init__(self, boards, inputs):
+    """
+    @param boards : the ROACH boards
+    @type  boards : BoardRegistry instance
+
+    @param inputs : (roach name, adc, rf) of every RF input
+    @type  inputs : list of tuple
+    """
+    self.logger = logging.getLogger(__name__+".RFState")
+    self.boards = boards
+    inputs = sorted(inputs, key=lambda x: (boards.index[x[0]], x[1], x[2]))
+    self.names = [name for name, adc, rf in inputs]
+    self.coordinates = numpy.array(
+                     [(boards.index[name], adc, rf) for name, adc, rf in inputs],
+                     dtype=COORDINATES)
+    self.values = numpy.zeros(len(inputs), dtype=FIELDS)
+    self.values['level'] = numpy.nan
+    self._row = {}
+    for row, (name, adc, rf) in enumerate(inputs):
+      self._row[(name, adc, rf)] = row
+      self._row[(boards.index[name], adc, rf)] = row
+    self._scratch = {}
+    self._nested = {}  # (field, by) -> (nested dict, innermost dict per row)
+    self.logger.debug("__init__: %d inputs", len(inputs))
+
+  def __len__(self):
+    return len(self.names)
+
+  def inputs(self):
+    """
+    (roach name, adc, rf) of every row
+    """
+    return [self.key(row) for row in range(len(self))]
+
+  def key(self, row, by='name'):
+    """
+    Coordinates of a row
+
+    @param by : 'name' for ROACH names or 'index' for ROACH indices
+    @type  by : str
+
+    @return: tuple (roach, adc, rf)
+    """
+    roach, adc, rf = self.coordinates[row]
+    if by == 'name':
+      return (self.names[row], int(adc), int(rf))
+    return (int(roach), int(adc), int(rf))
+
+  def row(self, roach, adc, rf):
+    """
+    Row of an input, with the ROACH given by name or index
+    """
+    return self._row[(roach, adc, rf)]
+
+  def get(self, field, roach, adc, rf):
+    return self.values[field][self._row[(roach, adc, rf)]].item()
+
+  def set(self, field, roach, adc, rf, value):
+    """
+    Change one value, keeping the nested dicts up to date
+    """
+    row = self._row[(roach, adc, rf)]
+    self.values[field][row] = value
+    self._update_nested(field, [row])
+
+  def read(self, field, items):
+    """
+    Read new values into a column
+
+    @param field : name of the column
+    @type  field : str
+
+    @param items : ((roach, adc, rf), value) pairs; unknown inputs are
+                   ignored
+    @type  items : iterable
+
+    @return: array of the rows which changed
+    """
+    column = self.values[field]
+    new = self._scratch.get(field)
+    if new is None:
+      new = self._scratch[field] = numpy.empty_like(column)
+    new[:] = column
+    for key, value in items:
+      row = self._row.get(key)
+      if row is None:
+        self.logger.debug("read: no input %s for %s", key, field)
+        continue
+      new[row] = value
+    if column.dtype.kind == 'f':
+      same = (new == column) | (numpy.isnan(new) & numpy.isnan(column))
+    else:
+      same = new == column
+    changed = numpy.flatnonzero(~same)
+    if changed.size:
+      column[changed] = new[changed]
+      self._update_nested(field, changed)
+    return changed
+
+  def nested(self, field, by='name'):
+    """
+    A column as a dict of dicts of dicts, [roach][adc][rf]
+
+    The same dict is returned on every call and is kept up to date.  Boards
+    without inputs have empty dicts.
+
+    @param by : 'name' for ROACH names or 'index' for ROACH indices as keys
+    @type  by : str
+    """
+    if (field, by) not in self._nested:
+      top = {}
+      for name in self.boards.names:
+        top[name if by == 'name' else self.boards.index[name]] = {}
+      cells = []
+      for row in range(len(self)):
+        roach, adc, rf = self.key(row, by)
+        cell = top[roach].setdefault(adc, {})
+        cell[rf] = self.values[field][row].item()
+        cells.append(cell)
+      self._nested[(field, by)] = (top, cells)
+    return self._nested[(field, by)][0]
+
+  def flat(self, field, by='index'):
+    """
+    A column as a dict keyed by (roach, adc, rf), like flattenDict() gives
+    """
+    column = self.values[field].tolist()
+    return dict((self.key(row, by), column[row]) for row in range(len(self)))
+
+  def _update_nested(self, field, rows):
+    for by in ('name', 'index'):
+      if (field, by) in self._nested:
+        cells = self._nested[(field, by)][1]
+        for row in rows:
+          cells[row][int(self.coordinates['rf'][row])] = \
+                                            self.values[field][row].item()
+
+def leaves(nested, depth=3):
+  """
+  Generator of (key tuple, value) for the values at a depth of nested dicts
+  """
+  for key, value in nested.items():
+    if depth == 1:
+      yield (key,), value
+    elif isinstance(value, dict):
+      for subkey, leaf in leaves(value, depth-1):
+        yield (key,)+subkey, leaf
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+rfi_flagging - spectral kurtosis flags for the kurtosis firmware spectra
+
+The kurtosis firmware gives, with each power spectrum (index 2 of the
+get_accums() reply), the spectral kurtosis estimator SK of each channel
+(index 4).  For M = acc_len_m1 + 1 accumulations of Gaussian noise SK has
+mean 1 and variance::
+  4 M**2/((M-1)(M+2)(M+3))    (about 4/M)
+so a channel whose SK is outside 1 +/- n sigma is flagged as having
+non-Gaussian (man-made) signal in it.
+
+SKFlagger makes the masks [input, channel] of all the inputs in one NumPy
+operation, from a 2-D array of SK and the M of each input.  Channels with
+non-finite power are flagged too; channels without SK (firmware without
+kurtosis) are not.  The flags can be widened by 'grow' channels on each
+side.  It also counts how often each channel of each input was flagged,
+which gives the occupancy.
+
+An SKFlagger can be the 'masker' of SpectralIntegrator.acquire().
+"""
+import logging
+import numpy
+
+module_logger = logging.getLogger(__name__)
+
+N_SIGMA = 3.0
+
+def sk_sigma(M):
+  """
+  Standard deviation of the SK estimator for M accumulations
+
+  @param M : accumulations, scalar or array
+  """
+  M = numpy.asarray(M, dtype=float)
+  return numpy.sqrt(4.0*M**2/((M - 1)*(M + 2)*(M + 3)))
+
+def sk_thresholds(acc_len_m1, n_sigma=N_SIGMA):
+  """
+  Lower and upper SK thresholds for the acc_len_m1 register values
+
+  @param acc_len_m1 : register value(s), M - 1
+  @type  acc_len_m1 : int or array
+
+  @return: (lower, upper), like acc_len_m1
+  """
+  sigma = sk_sigma(numpy.asarray(acc_len_m1) + 1)
+  return 1.0 - n_sigma*sigma, 1.0 + n_sigma*sigma
+
+def acc_len_m1_values(client, keys):
+  """
+  acc_len_m1 of the inputs' boards, from ManagerClient.register_values
+
+  @param keys : (roach index, adc, rf) of the inputs
+  @type  keys : list of tuple
+
+  @return: array [input]; boards without the register get 0
+  """
+  return numpy.array([client.register_values.get(client.roach_keys[roach],
+                                                 {}).get('acc_len_m1', 0)
+                      for roach, adc, rf in keys])
+
+class SKFlagger(object):
+  """
+  Spectral kurtosis flags and occupancy for all the inputs
+
+  Public attributes::
+    acc_len_m1 - M - 1 of each input, array [input] or scalar
+    cycles     - number of sets of spectra flagged
+    flagged    - times each channel was flagged, array [input, channel]
+    grow       - flagged channels are widened by this many on each side
+    logger     - logger for this instance
+    lower      - lower SK threshold of each input
+    n_sigma    - thresholds are 1 +/- n_sigma standard deviations
+    upper      - upper SK threshold of each input
+  """
+  def __init__(self, acc_len_m1, n_sigma=N_SIGMA, grow=0):
+    """
+    @param acc_len_m1 : register value of each input, or one for all
+    @type  acc_len_m1 : int or array
+
+    @param n_sigma : thresholds are 1 +/- n_sigma standard deviations
+    @type  n_sigma : float
+
+    @param grow : channels to add to each side of a flagged channel
+    @type  grow : int
+    """
+    self.logger = logging.getLogger(__name__+".SKFlagger")
+    self.n_sigma = n_sigma
+    self.grow = grow
+    self.flagged = None
+    self.cycles = 0
+    self.set_acc_len(acc_len_m1)
+
+  def set_acc_len(self, acc_len_m1):
+    """
+    Change the accumulation length, e.g. after set_acc_len()
+    """
+    self.acc_len_m1 = numpy.asarray(acc_len_m1)
+    self.lower, self.upper = sk_thresholds(self.acc_len_m1, self.n_sigma)
+    self.logger.debug("set_acc_len: SK thresholds %s to %s",
+                      self.lower, self.upper)
+
+  def flag(self, kurtosis, power=None):
+    """
+    Flag the channels of all the inputs
+
+    @param kurtosis : SK spectra, array [input, channel]
+    @type  kurtosis : numpy.ndarray
+
+    @param power : power spectra, array [input, channel]
+    @type  power : numpy.ndarray
+
+    @return: True for flagged channels, array [input, channel]
+    """
+    kurtosis = numpy.asarray(kurtosis)
+    lower = numpy.reshape(self.lower, (-1, 1)) if self.lower.ndim else \
+            self.lower
+    upper = numpy.reshape(self.upper, (-1, 1)) if self.upper.ndim else \
+            self.upper
+    # comparisons with NaN are False, so channels without SK are kept
+    mask = (kurtosis < lower) | (kurtosis > upper)
+    if power is not None:
+      mask |= ~numpy.isfinite(power)
+    if self.grow:
+      grown = mask.copy()
+      for shift in range(1, self.grow+1):
+        grown[:, shift:] |= mask[:, :-shift]
+        grown[:, :-shift] |= mask[:, shift:]
+      mask = grown
+    if self.flagged is None or self.flagged.shape != mask.shape:
+      self.flagged = numpy.zeros(mask.shape, dtype=int)
+      self.cycles = 0
+    self.flagged += mask
+    self.cycles += 1
+    return mask
+
+  def __call__(self, keys, spectra, kurtosis):
+    """
+    Masker for SpectralIntegrator.acquire()
+    """
+    return self.flag(kurtosis, spectra)
+
+  def occupancy(self, mask=None):
+    """
+    Fraction of channels flagged
+
+    @param mask : one set of flags; default is all the sets since the
+                  last reset
+    @type  mask : numpy.ndarray of bool
+
+    @return: dict with 'input' (fraction of each input's channels),
+             'channel' (fraction of the inputs for each channel) and
+             'total', from the mask or averaged over the cycles
+    """
+    if mask is None:
+      if self.flagged is None:
+        return None
+      fraction = self.flagged/float(max(self.cycles, 1))
+    else:
+      fraction = numpy.asarray(mask, dtype=float)
+    return {'input':   fraction.mean(axis=1),
+            'channel': fraction.mean(axis=0),
+            'total':   fraction.mean()}
+
+  def reset(self):
+    """
+    Start counting the occupancy again
+    """
+    self.flagged = None
+    self.cycles = 0
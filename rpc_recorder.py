@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+rpc_recorder - record and replay the traffic between a client and the server
+
+A RecordingProxy sits between ManagerClient and a remote Pyro5 proxy such as
+``ManagerClient.mgr`` or ``ManagerClient.hardware``.  Every call, its
+arguments, its reply (or exception) and its timing are appended to a compact
+binary log.  A RPCReplayer reads the log back and provides ReplayProxy
+objects which answer the same calls with the recorded replies, either with
+the original latencies, scaled latencies, or as fast as possible.
+
+Log format::
+  file header  - MAGIC
+  each record  - RECORD header, call pickle, reply pickle, raw buffers
+
+The pickles use protocol 5 so that NumPy arrays in the arguments or replies
+are not copied into the pickle stream but are stored after it as raw buffers,
+each preceded by its length.
+
+Typical use::
+  client = ManagerClient(record_to="session.rpc")
+  ...
+  replayer = RPCReplayer("session.rpc", scale=0)
+  hardware = replayer.proxy('hardware')
+"""
+import collections
+import logging
+import pickle
+import struct
+import threading
+import time
+
+module_logger = logging.getLogger(__name__)
+
+MAGIC = b"MCRPC\x01\n"
+# start time, duration, status, call buffers, reply buffers,
+# call pickle length, reply pickle length
+RECORD = struct.Struct("<ddBHHII")
+BUFLEN = struct.Struct("<Q")
+
+CALL_OK = 0
+CALL_RAISED = 1
+
+class RPCLog(object):
+  """
+  Append-only binary log of remote calls
+
+  Each record is flushed as it is written, so a session which crashes loses
+  at most the call in progress.
+
+  Public attributes::
+    filename - name of the log file
+    logger   - logger for this instance
+    records  - number of records written
+  """
+  def __init__(self, filename):
+    """
+    Open a new log file
+
+    @param filename : path of the log file; an existing file is replaced
+    @type  filename : str
+    """
+    self.logger = logging.getLogger(__name__+".RPCLog")
+    self.filename = filename
+    self.records = 0
+    self._lock = threading.Lock()
+    self._file = open(filename, "wb")
+    self._file.write(MAGIC)
+    self.logger.debug("__init__: logging calls to %s", filename)
+
+  def write(self, start, duration, status, call, reply):
+    """
+    Append one call to the log
+
+    @param start : time.time() when the call was made
+    @type  start : float
+
+    @param duration : seconds until the reply arrived
+    @type  duration : float
+
+    @param status : CALL_OK or CALL_RAISED
+    @type  status : int
+
+    @param call : (target, method, args, kwargs)
+    @type  call : tuple
+
+    @param reply : the returned value or the exception raised
+    """
+    call_buffers = []
+    reply_buffers = []
+    call_pickle = pickle.dumps(call, protocol=5,
+                               buffer_callback=call_buffers.append)
+    try:
+      reply_pickle = pickle.dumps(reply, protocol=5,
+                                  buffer_callback=reply_buffers.append)
+    except Exception:
+      # some server exceptions cannot be pickled on this side
+      self.logger.warning("write: cannot pickle reply to %s.%s",
+                          call[0], call[1])
+      reply_buffers = []
+      reply_pickle = pickle.dumps(RuntimeError(repr(reply)), protocol=5)
+    with self._lock:
+      self._file.write(RECORD.pack(start, duration, status,
+                                   len(call_buffers), len(reply_buffers),
+                                   len(call_pickle), len(reply_pickle)))
+      self._file.write(call_pickle)
+      self._file.write(reply_pickle)
+      for buf in call_buffers + reply_buffers:
+        raw = buf.raw()
+        self._file.write(BUFLEN.pack(raw.nbytes))
+        self._file.write(raw)
+      self._file.flush()
+      self.records += 1
+
+  def flush(self):
+    with self._lock:
+      self._file.flush()
+
+  def close(self):
+    with self._lock:
+      if not self._file.closed:
+        self._file.close()
+    self.logger.debug("close: %d records in %s", self.records, self.filename)
+
+def read_log(filename):
+  """
+  Generator of the records in a log file
+
+  Each record is a tuple (start, duration, status, call, reply) where
+  'call' is (target, method, args, kwargs).  The log ends at an incomplete
+  record, such as the last one of a session which crashed.
+
+  @param filename : path of the log file
+  @type  filename : str
+  """
+  with open(filename, "rb") as logfile:
+    if logfile.read(len(MAGIC)) != MAGIC:
+      raise ValueError("%s is not an RPC log" % filename)
+    records = 0
+    while True:
+      try:
+        header = _read_exactly(logfile, RECORD.size)
+        start, duration, status, ncall, nreply, lcall, lreply = \
+                                                        RECORD.unpack(header)
+        call_pickle = _read_exactly(logfile, lcall)
+        reply_pickle = _read_exactly(logfile, lreply)
+        buffers = []
+        for index in range(ncall + nreply):
+          size, = BUFLEN.unpack(_read_exactly(logfile, BUFLEN.size))
+          buffers.append(bytearray(_read_exactly(logfile, size)))
+      except EOFError as details:
+        if details.args[0]:
+          module_logger.warning("read_log: %s: record %d is incomplete",
+                                filename, records)
+        break
+      records += 1
+      call = pickle.loads(call_pickle, buffers=buffers[:ncall])
+      reply = pickle.loads(reply_pickle, buffers=buffers[ncall:])
+      yield start, duration, status, call, reply
+
+def _read_exactly(logfile, size):
+  """
+  Read 'size' bytes, or raise EOFError with the number of bytes found
+  """
+  data = logfile.read(size)
+  if len(data) < size:
+    raise EOFError(len(data))
+  return data
+
+class RecordingProxy(object):
+  """
+  Transparent wrapper which logs every call made through a remote proxy
+
+  Attributes starting with '_pyro' are passed to the wrapped proxy without
+  being recorded so that ownership, timeouts, etc. still work.
+  """
+  def __init__(self, target, proxy, log):
+    """
+    @param target : name under which calls are logged, e.g. 'mgr'
+    @type  target : str
+
+    @param proxy : the object being wrapped, usually a Pyro5 Proxy
+    @type  proxy : object
+
+    @param log : where the calls are recorded
+    @type  log : RPCLog instance
+    """
+    self.__dict__['_target'] = target
+    self.__dict__['_proxy'] = proxy
+    self.__dict__['_log'] = log
+
+  def __getattr__(self, name):
+    attribute = getattr(self._proxy, name)
+    if name.startswith('_pyro') or not callable(attribute):
+      return attribute
+    target = self._target
+    log = self._log
+    def _recorded(*args, **kwargs):
+      start = time.time()
+      t0 = time.perf_counter()
+      try:
+        reply = attribute(*args, **kwargs)
+      except Exception as details:
+        log.write(start, time.perf_counter()-t0, CALL_RAISED,
+                  (target, name, args, kwargs), details)
+        raise
+      log.write(start, time.perf_counter()-t0, CALL_OK,
+                (target, name, args, kwargs), reply)
+      return reply
+    return _recorded
+
+  def __setattr__(self, name, value):
+    setattr(self._proxy, name, value)
+
+def record_client(client, filename):
+  """
+  Wrap the remote proxies of a ManagerClient so that their traffic is logged
+
+  @param client : the client whose 'hardware' and 'mgr' proxies are wrapped
+  @type  client : ManagerClient instance
+
+  @param filename : path of the log file
+  @type  filename : str
+
+  @return: RPCLog instance
+  """
+  log = RPCLog(filename)
+  for target in ('hardware', 'mgr'):
+    proxy = getattr(client, target, None)
+    if proxy is not None and not isinstance(proxy, RecordingProxy):
+      setattr(client, target, RecordingProxy(target, proxy, log))
+  return log
+
+class RPCReplayer(object):
+  """
+  Serves the replies in an RPC log in place of the server
+
+  Calls are matched on target, method and arguments.  Repeated identical
+  calls get the recorded replies in their original order.  If a call with
+  these arguments was not recorded, the next reply to the same method is
+  used.
+
+  Public attributes::
+    logger   - logger for this instance
+    scale    - latency multiplier; 1 is the original timing, 0 is no delay
+    misses   - number of calls for which no reply was recorded
+  """
+  def __init__(self, filename, scale=1.0):
+    """
+    Load an RPC log
+
+    @param filename : path of the log file
+    @type  filename : str
+
+    @param scale : multiplier for the recorded call durations
+    @type  scale : float
+    """
+    self.logger = logging.getLogger(__name__+".RPCReplayer")
+    self.scale = scale
+    self.misses = 0
+    self._lock = threading.Lock()
+    self._by_args = collections.defaultdict(collections.deque)
+    self._by_method = collections.defaultdict(collections.deque)
+    count = 0
+    for record in read_log(filename):
+      start, duration, status, call, reply = record
+      target, method, args, kwargs = call
+      # the last item marks an entry consumed through either index
+      entry = [duration, status, reply, False]
+      self._by_args[(target, method, _call_key(args, kwargs))].append(entry)
+      self._by_method[(target, method)].append(entry)
+      count += 1
+    self.logger.debug("__init__: loaded %d calls from %s", count, filename)
+
+  def proxy(self, target):
+    """
+    Returns an object which replays the calls recorded for 'target'
+
+    @param target : name under which calls were logged, e.g. 'mgr'
+    @type  target : str
+    """
+    return ReplayProxy(self, target)
+
+  def reply(self, target, method, args, kwargs):
+    """
+    Return (or raise) the recorded reply for a call
+    """
+    with self._lock:
+      entry = _next_unused(
+                 self._by_args.get((target, method, _call_key(args, kwargs))))
+      if entry is None:
+        self.misses += 1
+        entry = _next_unused(self._by_method.get((target, method)))
+      if entry is None:
+        raise LookupError("no recorded reply for %s.%s%s" %
+                          (target, method, args))
+      entry[3] = True
+    duration, status, reply, used = entry
+    if self.scale:
+      time.sleep(duration*self.scale)
+    if status == CALL_RAISED:
+      raise reply
+    return reply
+
+class ReplayProxy(object):
+  """
+  Stand-in for a remote proxy which answers from a RPCReplayer
+  """
+  def __init__(self, replayer, target):
+    self._replayer = replayer
+    self._target = target
+
+  def __getattr__(self, name):
+    if name.startswith('_pyro'):
+      # ownership, timeouts, etc. have no meaning here
+      return lambda *args, **kwargs: None
+    def _replayed(*args, **kwargs):
+      return self._replayer.reply(self._target, name, args, kwargs)
+    return _replayed
+
+def _call_key(args, kwargs):
+  """
+  Hashable representation of call arguments
+  """
+  return repr((args, sorted(kwargs.items())))
+
+def _next_unused(entries):
+  """
+  Pop entries off a queue until one which has not been replayed is found
+  """
+  while entries:
+    entry = entries.popleft()
+    if not entry[3]:
+      return entry
+  return None
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+sdfits_export - stream spectra and kurtosis to SDFITS files
+
+SDFITSExporter writes the ManagerClient.get_accums() spectra as rows of a
+'SINGLE DISH' binary table, which the usual single dish packages read.
+Rows are kept in a NumPy buffer with the table's big-endian layout and
+written in blocks of 'block_rows' with a single write, so a long session
+costs one write per block rather than per row.  The row count in the table
+header is filled in when the file is closed.
+
+Each row has::
+  DATE-OBS, TIME   - ISO date and UNIX time of the request
+  ROACH, ADC, RF   - the input
+  GAIN             - RF section gain, dB
+  SYNTHFRQ         - sampler clock (synthesizer) frequency, MHz
+  ACC_LEN          - accumulations per spectrum, acc_len_m1 + 1
+  IFSOURCE         - IF switch input feeding the ADC
+  CRVAL1, CDELT1, CRPIX1 - frequency axis of the channels, Hz
+  DATA             - power spectrum
+  KURTOSIS         - spectral kurtosis (NaN if the firmware has none)
+
+The files are written with NumPy only.  read_sdfits() needs astropy.
+"""
+import logging
+import numpy
+import sys
+import time
+
+module_logger = logging.getLogger(__name__)
+
+BLOCK = 2880
+CARD = 80
+
+# FITS binary table formats of the NumPy types
+TFORMS = {'>f8': 'D', '>f4': 'E', '>i4': 'J', '>i2': 'I'}
+
+def _card(keyword, value=None, comment=None):
+  """
+  One 80 character header card
+  """
+  if value is None:
+    text = keyword.ljust(8)
+  else:
+    if isinstance(value, bool):
+      value = ("T" if value else "F").rjust(20)
+    elif isinstance(value, str):
+      value = ("'%-8s'" % value.replace("'", "''")).ljust(20)
+    elif isinstance(value, float):
+      value = ("%.15G" % value).rjust(20)
+    else:
+      value = str(value).rjust(20)
+    text = "%-8s= %s" % (keyword, value)
+    if comment:
+      text += " / " + comment
+  return text[:CARD].ljust(CARD)
+
+def _header(cards):
+  """
+  Header cards padded to whole FITS blocks
+  """
+  text = "".join(cards) + _card("END")
+  text += " "*(-len(text) % BLOCK)
+  return text.encode('ascii')
+
+class SDFITSExporter(object):
+  """
+  Writes spectra to an SDFITS file in blocks of rows
+
+  Public attributes::
+    block_rows - number of rows written at once
+    client     - ManagerClient instance
+    dtype      - row layout, known after the first spectrum
+    filename   - output file
+    logger     - logger for this instance
+    rows       - number of rows written or buffered
+    telescope  - TELESCOP keyword
+  """
+  def __init__(self, client, filename, block_rows=1024, telescope='DSS-43',
+               observer=''):
+    """
+    @param client : source of the spectra and their metadata
+    @type  client : ManagerClient instance
+
+    @param filename : output file
+    @type  filename : str
+
+    @param block_rows : rows buffered before a write
+    @type  block_rows : int
+
+    @param telescope : TELESCOP keyword
+    @type  telescope : str
+
+    @param observer : OBSERVER keyword
+    @type  observer : str
+    """
+    self.logger = logging.getLogger(__name__+".SDFITSExporter")
+    self.client = client
+    self.filename = filename
+    self.block_rows = block_rows
+    self.telescope = telescope
+    self.observer = observer
+    self.dtype = None
+    self.rows = 0
+    self._file = open(filename, 'wb')
+    self._file.write(_header([
+      _card("SIMPLE", True, "conforms to FITS standard"),
+      _card("BITPIX", 8),
+      _card("NAXIS", 0),
+      _card("EXTEND", True),
+      _card("ORIGIN", "MCClient.sdfits_export"),
+      _card("DATE", time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()))]))
+    self._buffer = None
+    self._buffered = 0
+    self._table_start = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+    return False
+
+  def _make_table(self, channels):
+    """
+    Define the row layout and write the table header
+    """
+    self.dtype = numpy.dtype([('DATE-OBS', 'S22'),
+                              ('TIME',     '>f8'),
+                              ('ROACH',    '>i2'),
+                              ('ADC',      '>i2'),
+                              ('RF',       '>i2'),
+                              ('GAIN',     '>f4'),
+                              ('SYNTHFRQ', '>f8'),
+                              ('ACC_LEN',  '>i4'),
+                              ('IFSOURCE', '>i2'),
+                              ('CRVAL1',   '>f8'),
+                              ('CDELT1',   '>f8'),
+                              ('CRPIX1',   '>f4'),
+                              ('DATA',     '>f4', (channels,)),
+                              ('KURTOSIS', '>f4', (channels,))])
+    units = {'TIME': 's', 'GAIN': 'dB', 'SYNTHFRQ': 'MHz', 'CRVAL1': 'Hz',
+             'CDELT1': 'Hz'}
+    cards = [_card("XTENSION", "BINTABLE", "binary table extension"),
+             _card("BITPIX", 8),
+             _card("NAXIS", 2),
+             _card("NAXIS1", self.dtype.itemsize, "bytes per row"),
+             _card("NAXIS2", 0, "number of rows"),
+             _card("PCOUNT", 0),
+             _card("GCOUNT", 1),
+             _card("TFIELDS", len(self.dtype.names))]
+    for number, name in enumerate(self.dtype.names, 1):
+      base, shape = self.dtype[name].base, self.dtype[name].shape
+      if base.kind == 'S':
+        tform = "%dA" % base.itemsize
+      else:
+        tform = "%d%s" % (int(numpy.prod(shape)) if shape else 1,
+                          TFORMS[base.str])
+      cards.append(_card("TTYPE%d" % number, name))
+      cards.append(_card("TFORM%d" % number, tform))
+      if name in units:
+        cards.append(_card("TUNIT%d" % number, units[name]))
+    cards += [_card("EXTNAME", "SINGLE DISH"),
+              _card("NMATRIX", 1),
+              _card("TELESCOP", self.telescope),
+              _card("OBSERVER", self.observer),
+              _card("CTYPE1", "FREQ"),
+              _card("TDIM13", "(%d,1,1,1)" % channels)]
+    self._table_start = self._file.tell()
+    self._file.write(_header(cards))
+    self._buffer = numpy.zeros(self.block_rows, dtype=self.dtype)
+    self.logger.debug("_make_table: %d channels, %d bytes per row",
+                      channels, self.dtype.itemsize)
+
+  def add(self, accums, roach, adc, rf, now=None):
+    """
+    Add a spectrum with the current settings of its input
+
+    @param accums : reply of ManagerClient.get_accums()
+    @type  accums : dict
+
+    @param roach : ROACH index
+    @type  roach : int
+
+    @param adc : ADC number
+    @type  adc : int
+
+    @param rf : RF input number
+    @type  rf : int
+
+    @param now : time of the request; default is the current time
+    @type  now : float
+    """
+    if now is None:
+      now = time.time()
+    spectrum = accums[2]
+    if self.dtype is None:
+      self._make_table(len(spectrum))
+    client = self.client
+    roachname = client.roach_keys[roach]
+    clock = client.synth_freq.get(roachname, numpy.nan)
+    registers = client.register_values.get(roachname, {})
+    row = self._buffer[self._buffered]
+    seconds, centiseconds = divmod(int(round(now*100)), 100)
+    row['DATE-OBS'] = time.strftime("%Y-%m-%dT%H:%M:%S",
+                                    time.gmtime(seconds)) + \
+                      ".%02d" % centiseconds
+    row['TIME'] = now
+    row['ROACH'] = roach
+    row['ADC'] = adc
+    row['RF'] = rf
+    row['GAIN'] = client.rf.get('gain', roach, adc, rf)
+    row['SYNTHFRQ'] = clock
+    row['ACC_LEN'] = registers.get('acc_len_m1', -1) + 1
+    row['IFSOURCE'] = client.rf.get('source', roach, adc, rf)
+    # real sampling: the channels cover half the clock frequency
+    row['CRVAL1'] = 0.0
+    row['CDELT1'] = clock*1e6/2/len(spectrum)
+    row['CRPIX1'] = 1.0
+    row['DATA'] = spectrum
+    row['KURTOSIS'] = accums[4] if 4 in accums else numpy.nan
+    self._buffered += 1
+    self.rows += 1
+    if self._buffered == self.block_rows:
+      self.flush()
+
+  def acquire(self, inputs=None):
+    """
+    Get one spectrum from each input and add it
+
+    @param inputs : (roach index, adc, rf) of the inputs; default all
+    @type  inputs : list of tuple
+
+    @return: number of spectra added
+    """
+    if inputs is None:
+      inputs = [self.client.rf.key(row, by='index')
+                for row in range(len(self.client.rf))]
+    added = 0
+    for roach, adc, rf in inputs:
+      now = time.time()
+      accums = self.client.get_accums(roach, adc, rf)
+      if accums:
+        self.add(accums, roach, adc, rf, now)
+        added += 1
+    return added
+
+  def flush(self):
+    """
+    Write the buffered rows
+    """
+    if self._buffered:
+      self._file.write(self._buffer[:self._buffered].tobytes())
+      self._file.flush()
+      self.logger.debug("flush: %d rows written", self._buffered)
+      self._buffered = 0
+
+  def close(self):
+    """
+    Write the remaining rows, pad the table and fill in the row count
+    """
+    if self._file.closed:
+      return
+    self.flush()
+    if self.dtype is not None:
+      data_bytes = self.rows*self.dtype.itemsize
+      self._file.write(b"\0"*(-data_bytes % BLOCK))
+      # NAXIS2 is the fifth card of the table header
+      self._file.seek(self._table_start + 4*CARD)
+      self._file.write(_card("NAXIS2", self.rows,
+                             "number of rows").encode('ascii'))
+    self._file.close()
+    self.logger.info("close: %d rows in %s", self.rows, self.filename)
+
+def read_sdfits(filename):
+  """
+  Read the SINGLE DISH table of a file
+
+  @return: astropy FITS_rec
+  """
+  try:
+    from astropy.io import fits
+  except ImportError:
+    raise ImportError("read_sdfits needs astropy; "
+                      "the files can also be read by any FITS reader")
+  with fits.open(filename) as hdulist:
+    return hdulist['SINGLE DISH'].data.copy()
+
+if __name__ == "__main__":
+  """
+  Export spectra from all the inputs from the command line
+  """
+  from optparse import OptionParser
+  from MCClient.ManagerClient import ManagerClient
+
+  p = OptionParser()
+  p.set_usage('sdfits_export.py [options]')
+  p.set_description(__doc__)
+  p.add_option('-o', '--output',
+               dest = 'filename',
+               type = 'str',
+               default = 'spectra.fits',
+               help = 'Output file')
+  p.add_option('-d', '--duration',
+               dest = 'duration',
+               type = 'float',
+               default = 0,
+               help = 'Seconds to record; 0 records until interrupted')
+  p.add_option('-b', '--block',
+               dest = 'block',
+               type = 'int',
+               default = 1024,
+               help = 'Rows per write')
+  p.add_option('-l', '--log_level',
+               dest = 'loglevel',
+               type = 'str',
+               default = 'warning',
+               help = 'Logging level for main program and modules')
+  opts, args = p.parse_args(sys.argv[1:])
+
+  logging.basicConfig(level=getattr(logging, opts.loglevel.upper()))
+  mylogger = logging.getLogger()
+
+  client = ManagerClient()
+  start = time.time()
+  with SDFITSExporter(client, opts.filename, block_rows=opts.block) as exporter:
+    try:
+      while not opts.duration or time.time() - start < opts.duration:
+        exporter.acquire()
+    except KeyboardInterrupt:
+      mylogger.warning("Interrupted")
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+server_methods - which central server calls read and which write
+
+The relay caches the reads and ResilientProxy repeats them after a failure;
+neither may do that to a call which changes the hardware.  The generic
+request() and hdwr() calls are classified by their arguments::
+  request_kind("self.roaches['roach1'].get_gains()")   # 'read'
+  request_kind("self.get_firmware_states()")           # 'refresh'
+  hdwr_kind('FrontEnd', 'read_temp')                   # 'read'
+"""
+import re
+
+# methods whose replies depend only on their arguments and the hardware state
+READ_METHODS = ['check_fans', 'get_MMS_options', 'get_MMS_analog',
+                'get_temperatures', 'get_ADC_levels', 'get_switch_states',
+                'report_signal_sources', 'get_board_IDs',
+                'get_register_values', 'get_firmware_summary', 'list_dev',
+                'fpga_read_int', 'fpga_read_uint', 'fpga_read',
+                'get_equipment', 'get_tsys', 'server_time']
+# reads which must not be cached because every reply is new data
+FRESH_METHODS = ['get_spectra', 'get_ADC_samples']
+# methods which change the hardware
+WRITE_METHODS = ['set_IFsw_state', 'set_RF_section', 'fpga_write',
+                 'fpga_write_int', 'attach_roach']
+# hdwr() calls which only read
+READ_HDWR = [('Backend', 'roach_report'), ('FrontEnd', 'read_temp')]
+# getters which only read, for request() expressions
+READ_GETTERS = ['get_gains', 'get_gbe0_states', 'get_ADC_input']
+# request() expressions which only read: attributes, keys() and the getters
+READ_REQUEST = re.compile(r"^[\w\.\[\]'\"]*(\.keys\(\)|\.(%s)\(\)|\.status)?$" %
+                          "|".join(READ_GETTERS))
+# the kurtosis panel status request (kurtosis_client.PANEL_STATUS)
+PANEL_REQUEST = re.compile(r"^\{'registers':\{k:vfork,vinself\.get_register_values"
+                           r"\('\w+'\)\.items\(\)ifkin\([\w',]*\)\},"
+                           r"'gbe0':self\.roaches\['\w+'\]\.get_gbe0_states\(\)\}$")
+# register watches (kurtosis_client.RegisterWatch) read a few registers
+WATCH_REQUEST = re.compile(r"^\((self\.fpga_read_u?int\('\w+','\w+'\),)*\)$")
+# request() calls which make the server update its own state; they change
+# nothing which a client reads back as hardware state
+REFRESH_REQUEST = re.compile(r"^self\.(get_firmware_states|"
+                             r"get_sampler_clocks_status)\(\)$")
+
+def request_kind(expression):
+  """
+  Classify a request() expression
+
+  @param expression : Python expression evaluated by the server
+  @type  expression : str
+
+  @return: 'read', 'refresh' (the server updates its own state) or 'write'
+  """
+  compact = expression.replace(" ", "")
+  if REFRESH_REQUEST.match(compact):
+    return 'refresh'
+  if READ_REQUEST.match(compact) or PANEL_REQUEST.match(compact) or \
+     WATCH_REQUEST.match(compact):
+    return 'read'
+  return 'write'
+
+def hdwr_kind(device, method):
+  """
+  Classify a hdwr() call
+
+  @return: 'read' or 'write'
+  """
+  if (device, method) in READ_HDWR:
+    return 'read'
+  return 'write'
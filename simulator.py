@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+simulator - in-process stand-in for the DSS-43 manager server
+
+SimulatedManager has the remote methods which ManagerClient, KurtosisClient
+and the GUIs call, and evaluates the request() expressions they send against
+a small object model like the server's::
+
+  from MCClient.simulator import SimulatedManager
+  client = ManagerClient(backend=SimulatedManager(roaches=4, seed=1))
+
+No sockets are involved, so thousands of refresh cycles take about a second.
+
+The model::
+  * each RF input (roach, adc, rf) is fed by an IF switch output; the switch
+    output selects one of the IF inputs, each with its own power in dBm
+  * the ADC level is the IF power plus the RF section gain (-11.5 to +20 dB
+    in 0.5 dB steps), with a little noise, or -60 dBm when disabled
+  * power spectra are a band shape scaled by the level with radiometer
+    noise for M = acc_len_m1 + 1 accumulations; spectral kurtosis is
+    1 +/- 2/sqrt(M)
+  * ADC snapshots are Gaussian samples with that level, clipped to 8 bits
+  * spec_count, raw_pkt_cnt_out and gbe0_tx_cnt are 32-bit counters which
+    run at fixed rates on the 'clock'
+"""
+import copy
+import logging
+import numpy
+import time
+
+module_logger = logging.getLogger(__name__)
+
+GAIN_RANGE = (-11.5, 20.0)
+FULL_SCALE = 0.0          # dBm at which the 8-bit ADC clips
+COUNTER_RATES = {'spec_count':      10.0,    # per second
+                 'raw_pkt_cnt_out': 40000.0,
+                 'gbe0_tx_cnt':     40000.0}
+REGISTERS = {'adc_snap_trig':              0,
+             'sync_in_sel':                0,
+             'pkt_cnt_sec_rst_ctrl':       0,
+             'select_bits_pow':            0,
+             'acc_len_m1':                 1023,
+             'raw_pkt_cnt_is_fpga_clocks': 0,
+             'raw_pkt_cnt_rst_ctrl':       0,
+             'bit_select_counter_out':     0,
+             'gbe0_linkup':                1,
+             'gbe0_tx':                    1,
+             'gbe0_tx_full':               0,
+             'gbe0_tx_over':               0}
+
+def _no_wait(seconds):
+  """
+  Sleep for a simulated clock, which the caller advances
+  """
+  pass
+
+class _Node(object):
+  """
+  Attribute container for the objects reached by request() expressions
+  """
+  def __init__(self, **kwargs):
+    self.__dict__.update(kwargs)
+
+class SimulatedManager(object):
+  """
+  NumPy model of the manager server and its ROACH boards
+
+  Public attributes::
+    clock           - function returning the current time in seconds
+    sleep           - function(seconds) waiting on the 'clock'
+    firmware        - firmware name indexed by ROACH name
+    firmware_server - object with parse_registers()
+    firmware_states - index of the loaded firmware for each ROACH number
+    gain            - RF section gains, array [roach, adc, rf]
+    enabled         - RF section states, array [roach, adc, rf]
+    IF_power        - power in dBm of each IF switch input
+    IFsw            - IF switch with 'channel' and 'inputs'
+    logger          - logger for this instance
+    names           - ROACH names
+    registers       - register values indexed by ROACH name
+    roaches         - ROACH objects indexed by name
+    spec            - spectrometer objects [roach index][adc][rf]
+    switch_states   - input selected by each IF switch output
+  """
+  def __init__(self, roaches=4, adcs=2, rfs=2, channels=1024, samples=16384,
+               firmware='kurt_spec', clock=time.time, seed=None, sleep=None):
+    """
+    @param roaches : number of ROACH boards
+    @type  roaches : int
+
+    @param adcs : ADCs per board
+    @type  adcs : int
+
+    @param rfs : RF inputs per ADC
+    @type  rfs : int
+
+    @param channels : spectrum channels
+    @type  channels : int
+
+    @param samples : samples in an ADC snapshot
+    @type  samples : int
+
+    @param firmware : firmware loaded in all the boards
+    @type  firmware : str
+
+    @param clock : time source for the counters
+    @type  clock : function
+
+    @param seed : random number seed, for repeatable data
+    @type  seed : int
+
+    @param sleep : waits on the clock; default time.sleep for the real
+                   clock, else no wait, so a simulated clock is advanced by
+                   the caller
+    @type  sleep : function(seconds)
+    """
+    self.logger = logging.getLogger(__name__+".SimulatedManager")
+    self.rng = numpy.random.RandomState(seed)
+    self.clock = clock
+    if sleep is None:
+      sleep = time.sleep if clock is time.time else _no_wait
+    self.sleep = sleep
+    self.start = clock()
+    self.channels = channels
+    self.samples = samples
+    self.names = ['roach%d' % (n+1) for n in range(roaches)]
+    shape = (roaches, adcs, rfs)
+    self.gain = numpy.zeros(shape)
+    self.enabled = numpy.ones(shape, dtype=bool)
+    # each RF input has its own IF switch output
+    outputs = roaches*adcs*rfs
+    # zero-padded names so that the clients' sorted keys are in output order
+    self.IFsw = _Node(channel=dict(('SW%02d' % n, n) for n in range(outputs)),
+                      inputs=dict(('IF%02d' % n, n) for n in range(outputs)))
+    self.switch_states = list(range(outputs))
+    self.IF_power = self.rng.uniform(-30., -15., outputs)
+    self.firmware = dict((name, firmware) for name in self.names)
+    self.firmware_states = [0]*roaches
+    self.registers = dict((name, dict(REGISTERS)) for name in self.names)
+    self.firmware_server = _Node(parse_registers=self._parse_registers)
+    self._resets = dict((name, dict((counter, self.start)
+                                    for counter in COUNTER_RATES))
+                        for name in self.names)
+    self.roaches = {}
+    self.spec = {}
+    for index, name in enumerate(self.names):
+      self.roaches[name] = _Node(
+          name=name,
+          clock_synth=_Node(status={'frequency': 1000.0, 'rf_level': 2}),
+          get_gains=self._gains_getter(index),
+          get_gbe0_states=self._gbe0_getter(name),
+          logic=_Node(sync_DSP=lambda: None,
+                      dsp_user_reset=lambda: None,
+                      seconds_cntr_reset=self._counter_resetter(name)))
+      self.spec[index] = {}
+      for adc in range(adcs):
+        self.spec[index][adc] = {}
+        for rf in range(rfs):
+          output = (index*adcs + adc)*rfs + rf
+          self.spec[index][adc][rf] = _Node(
+              sources=["IFsw 'SW%02d'" % output],
+              get_ADC_input=self._level_getter(index, adc, rf))
+    self.logger.debug("__init__: %d inputs on %d boards", outputs, roaches)
+
+  # ---------------------------- model ----------------------------------------
+
+  def levels(self):
+    """
+    ADC levels in dBm of all the inputs, array [roach, adc, rf]
+    """
+    power = self.IF_power[numpy.array(self.switch_states)]
+    levels = power.reshape(self.gain.shape) + self.gain
+    levels += self.rng.normal(0, 0.05, levels.shape)
+    return numpy.where(self.enabled, levels, -60.)
+
+  def _index(self, roach):
+    if roach in self.roaches:
+      return self.names.index(roach)
+    return int(roach)
+
+  def _name(self, roach):
+    if roach in self.roaches:
+      return roach
+    return self.names[int(roach)]
+
+  def _gains_getter(self, index):
+    def get_gains():
+      report = {}
+      for adc in range(self.gain.shape[1]):
+        report[adc] = {}
+        for rf in range(self.gain.shape[2]):
+          report[adc][rf] = {'gain': float(self.gain[index, adc, rf]),
+                             'enabled': bool(self.enabled[index, adc, rf])}
+      return report
+    return get_gains
+
+  def _gbe0_getter(self, name):
+    def get_gbe0_states():
+      registers = self.registers[name]
+      return {'linkup': registers['gbe0_linkup'],
+              'tx':     registers['gbe0_tx'],
+              'full':   registers['gbe0_tx_full'],
+              'over':   registers['gbe0_tx_over']}
+    return get_gbe0_states
+
+  def _level_getter(self, index, adc, rf):
+    def get_ADC_input():
+      return float(self.levels()[index, adc, rf])
+    return get_ADC_input
+
+  def _counter_resetter(self, name):
+    def seconds_cntr_reset():
+      for counter in self._resets[name]:
+        self._resets[name][counter] = self.clock()
+    return seconds_cntr_reset
+
+  def _parse_registers(self, firmware):
+    details = {}
+    for register in list(REGISTERS) + list(COUNTER_RATES):
+      details[register] = {'width': 32, 'access': 'r' if register in
+                           COUNTER_RATES else 'rw'}
+    return details
+
+  def _counter(self, name, counter):
+    elapsed = self.clock() - self._resets[name][counter]
+    return int(elapsed*COUNTER_RATES[counter]) & 0xFFFFFFFF
+
+  # ------------------------- remote methods ----------------------------------
+
+  def request(self, expression):
+    """
+    Evaluate an expression with 'self' being the manager
+
+    Bare ROACH names, as in "self.roaches[roach1]", stand for themselves.
+    The reply is a copy, as it would be after serialization.
+    """
+    namespace = dict((name, name) for name in self.names)
+    namespace['self'] = self
+    result = eval(expression, {'__builtins__': {}}, namespace)
+    if isinstance(result, type({}.keys())):
+      return list(result)
+    return copy.deepcopy(result)
+
+  def hdwr(self, device, method, args=[], kwargs={}):
+    if (device, method) == ('Backend', 'roach_report'):
+      return self.roach_report()
+    raise AttributeError("%s has no method %s" % (device, method))
+
+  def roach_report(self):
+    return {'IP':    dict((name, '192.168.100.%d' % (n+1))
+                          for n, name in enumerate(self.names)),
+            'alive': dict((name, True) for name in self.names),
+            'bof':   dict((name, self.firmware[name]+'.bof')
+                          for name in self.names),
+            'avail': dict((name, [self.firmware[name]+'.bof'])
+                          for name in self.names),
+            'power': dict((name, True) for name in self.names)}
+
+  def get_sampler_clocks_status(self):
+    return dict((name, self.roaches[name].clock_synth.status)
+                for name in self.names)
+
+  def get_firmware_states(self):
+    return self.firmware_states
+
+  def get_firmware_summary(self, firmware):
+    adcs, rfs = self.gain.shape[1:]
+    return {'ADC inputs': dict((adc, list(range(rfs))) for adc in range(adcs)),
+            'registers': sorted(REGISTERS.keys()) + sorted(COUNTER_RATES)}
+
+  def check_fans(self):
+    speeds = self.rng.normal(5400, 30, (len(self.names), 3)).astype(int)
+    return dict((name, dict(enumerate(speeds[n].tolist())))
+                for n, name in enumerate(self.names))
+
+  def get_MMS_options(self):
+    return dict((name, {0: True, 1: True, 2: False}) for name in self.names)
+
+  def get_MMS_analog(self):
+    def readings(nominal, spread):
+      actual = self.rng.normal(nominal, spread, len(self.names))
+      return dict((name, {0: nominal*0.9, 1: float(actual[n]),
+                          2: nominal*1.1})
+                  for n, name in enumerate(self.names))
+    volts = {'3.3V': readings(3.3, 0.01), '5V': readings(5.0, 0.01),
+             '12V': readings(12.0, 0.05)}
+    temps = {'CPU temp': readings(45., 0.2), 'FPGA temp': readings(55., 0.2)}
+    return volts, temps
+
+  def get_temperatures(self):
+    adcs = self.gain.shape[1]
+    ambient = self.rng.normal(35., 0.1, (len(self.names), adcs))
+    chip = ambient + 10.
+    return dict((name, dict((adc, {'ambient': float(ambient[n, adc]),
+                                   'IC': float(chip[n, adc])})
+                            for adc in range(adcs)))
+                for n, name in enumerate(self.names))
+
+  def get_switch_states(self):
+    return list(self.switch_states)
+
+  def set_IFsw_state(self, index, state):
+    self.switch_states[index] = state
+    return state
+
+  def report_signal_sources(self):
+    return dict(('SW%02d' % n, 'IF%02d' % state)
+                for n, state in enumerate(self.switch_states))
+
+  def get_ADC_levels(self):
+    levels = self.levels()
+    return dict((index, dict((adc, dict(enumerate(levels[index, adc].tolist())))
+                             for adc in range(levels.shape[1])))
+                for index in range(levels.shape[0]))
+
+  def set_RF_section(self, roach, adc=0, inp=0, gain=None, enabled=True):
+    index = self._index(roach)
+    if gain is not None:
+      gain = min(max(gain, GAIN_RANGE[0]), GAIN_RANGE[1])
+      self.gain[index, adc, inp] = round(gain*2)/2.
+    self.enabled[index, adc, inp] = bool(enabled)
+    return bool(self.enabled[index, adc, inp]), float(self.gain[index, adc, inp])
+
+  def get_spectra(self, roach, adc, rf):
+    """
+    Accumulated spectra like the server's: [1] is the accumulation count,
+    [2] the power spectrum and [4] the spectral kurtosis
+    """
+    index = self._index(roach)
+    name = self.names[index]
+    M = self.registers[name]['acc_len_m1'] + 1
+    level = self.levels()[index, adc, rf]
+    channel = numpy.arange(self.channels)
+    band = numpy.sin(numpy.pi*(channel + 0.5)/self.channels)**0.5
+    power = band*10**(level/10.)
+    power *= 1 + self.rng.standard_normal(self.channels)/numpy.sqrt(M)
+    kurtosis = 1 + 2*self.rng.standard_normal(self.channels)/numpy.sqrt(M)
+    return {1: self._counter(name, 'spec_count'),
+            2: power.astype(numpy.float32),
+            4: kurtosis.astype(numpy.float32)}
+
+  def get_ADC_samples(self, roach, adc, rf):
+    index = self._index(roach)
+    rms = 128*10**((self.levels()[index, adc, rf] - FULL_SCALE)/20.)
+    samples = self.rng.normal(0, rms, self.samples)
+    return numpy.clip(numpy.round(samples), -128, 127).astype(numpy.int8)
+
+  def get_register_values(self, roach):
+    name = self._name(roach)
+    values = dict(self.registers[name])
+    for counter in COUNTER_RATES:
+      values[counter] = self._counter(name, counter)
+    return values
+
+  def wait_register_change(self, roach, registers, values, period=1.0,
+                           timeout=5.0):
+    """
+    Return the registers once any differs from 'values', or at the timeout
+
+    The registers are read every 'period' seconds of the simulator clock.
+    """
+    polls = max(1, int(timeout // period))
+    for poll in range(polls+1):
+      current = self.get_register_values(roach)
+      current = dict((register, current[register]) for register in registers)
+      if current != values or poll == polls:
+        return current
+      self.sleep(period)
+
+  def get_board_IDs(self):
+    return dict((name, 'SIM%04d' % (n+1)) for n, name in enumerate(self.names))
+
+  def list_dev(self, roach_keys):
+    return sorted(list(REGISTERS.keys()) + list(COUNTER_RATES.keys()))
+
+  def attach_roach(self, roach, firmware):
+    self.firmware[self._name(roach)] = firmware
+    return firmware+'.bof'
+
+  def fpga_read_int(self, roach, register):
+    return self.get_register_values(roach)[register]
+
+  fpga_read_uint = fpga_read_int
+
+  def fpga_write_int(self, roach, register, integer, blindwrite=False,
+                     offset=0):
+    self.registers[self._name(roach)][register] = int(integer)
+
+  def fpga_read(self, roach, register, size, offset=0):
+    value = self.fpga_read_int(roach, register)
+    return value.to_bytes(4, 'big')[offset:offset+size]
+
+  def fpga_write(self, roach, register, data, offset=0):
+    self.fpga_write_int(roach, register, int.from_bytes(data, 'big'))
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+spectra_recorder - headless recorder for spectra and kurtosis
+
+This takes spectra (and kurtosis spectra, if the firmware provides them) from
+all the RF inputs as fast as the server delivers them, using
+ManagerClient.get_accums() and, optionally, ManagerClient.get_ADC_samples().
+
+A prefix which has already been used is refused, so a recording is never
+appended to.
+
+Acquisition and disk writing run in separate threads connected by a bounded
+queue.  If the disk falls behind, records are dropped (and counted) rather
+than slowing down the acquisition.  The writer collects records into batches
+and appends each batch with one write to raw binary chunk files::
+  <prefix>.json         - record dtype and recording metadata
+  <prefix>_000000.dat   - first chunk of fixed-size records
+  <prefix>_000001.dat   - ...
+Use read_recording() to get the chunks back as NumPy memmaps.
+
+Each record has the fields::
+  time     - time.time() when the request was made
+  roach    - ROACH index
+  adc      - ADC number
+  rf       - RF input number
+  spectrum - power spectrum
+  kurtosis - kurtosis spectrum (NaN if the firmware does not provide it)
+  samples  - ADC samples (only if requested)
+"""
+import glob
+import json
+import logging
+import numpy
+import os.path
+import queue
+import sys
+import threading
+import time
+
+module_logger = logging.getLogger(__name__)
+
+class SpectraRecorder(object):
+  """
+  Records spectra from all RF inputs to chunked, append-only files
+
+  Public attributes::
+    batch         - maximum number of records written at once
+    chunk_records - number of records in each chunk file
+    client        - ManagerClient instance
+    dropped       - number of records dropped because the queue was full
+    dtype         - record dtype, known after the first spectrum arrives
+    inputs        - list of (roach index, roach name, ADC, RF)
+    logger        - logger for this instance
+    prefix        - path and root name of the output files
+    recorded      - number of records written
+    samples       - True if ADC samples are recorded
+  """
+  def __init__(self, client, prefix, chunk_records=4096, queue_size=256,
+               batch=64, samples=False):
+    """
+    Create a recorder
+
+    @param client : source of the data
+    @type  client : ManagerClient instance
+
+    @param prefix : path and root name of the output files
+    @type  prefix : str
+
+    @param chunk_records : number of records per chunk file
+    @type  chunk_records : int
+
+    @param queue_size : maximum number of records held in memory
+    @type  queue_size : int
+
+    @param batch : maximum number of records per disk write
+    @type  batch : int
+
+    @param samples : also record ADC samples
+    @type  samples : bool
+    """
+    self.logger = logging.getLogger(__name__+".SpectraRecorder")
+    if os.path.exists(prefix+".json") or glob.glob(prefix+"_[0-9]*.dat"):
+      raise RuntimeError("a recording with prefix %s exists" % prefix)
+    self.client = client
+    self.prefix = prefix
+    self.chunk_records = chunk_records
+    self.batch = batch
+    self.samples = samples
+    self.dtype = None
+    self.dropped = 0
+    self.recorded = 0
+    self.inputs = self.get_inputs()
+    self.logger.debug("__init__: inputs: %s", self.inputs)
+    self._queue = queue.Queue(maxsize=queue_size)
+    self._running = threading.Event()
+    self._chunk = None
+    self._chunk_num = -1
+    self._in_chunk = 0
+    self._threads = []
+
+  def get_inputs(self):
+    """
+    List all the RF inputs of boards with firmware
+    """
+    inputs = []
+    for r_index, roachname in enumerate(self.client.roach_keys):
+      for adc in sorted(self.client.gain.get(roachname, {})):
+        for rf in sorted(self.client.gain[roachname][adc]):
+          inputs.append((r_index, roachname, adc, rf))
+    return inputs
+
+  def start(self):
+    """
+    Start the acquisition and writer threads
+    """
+    self._running.set()
+    self._threads = [
+      threading.Thread(target=self._acquire, name="acquire", daemon=True),
+      threading.Thread(target=self._write, name="write", daemon=True)]
+    for thread in self._threads:
+      thread.start()
+    self.logger.info("start: recording %d inputs to %s_*.dat",
+                     len(self.inputs), self.prefix)
+
+  def stop(self):
+    """
+    Stop acquiring, write what is queued and close the files
+    """
+    self._running.clear()
+    for thread in self._threads:
+      thread.join()
+    self.logger.info("stop: %d records written, %d dropped",
+                     self.recorded, self.dropped)
+
+  def _acquire(self):
+    """
+    Request spectra from each input in turn as fast as they come
+    """
+    while self._running.is_set():
+      for r_index, roachname, adc, rf in self.inputs:
+        now = time.time()
+        try:
+          accums = self.client.get_accums(r_index, adc, rf)
+          if not accums:
+            continue
+          if self.samples:
+            samples = self.client.get_ADC_samples(roachname, adc, rf)
+          else:
+            samples = None
+        except Exception:
+          self.logger.exception("_acquire: request for %s ADC %d RF %d failed",
+                                roachname, adc, rf)
+          # do not hammer a server which is down
+          time.sleep(1)
+          continue
+        try:
+          self._queue.put_nowait((now, r_index, adc, rf, accums, samples))
+        except queue.Full:
+          self.dropped += 1
+          if self.dropped % 100 == 1:
+            self.logger.warning("_acquire: queue full; %d records dropped",
+                                self.dropped)
+
+  def _make_dtype(self, accums, samples):
+    """
+    Define the record layout from the first spectrum
+    """
+    fields = [('time', 'f8'), ('roach', 'i2'), ('adc', 'i1'), ('rf', 'i1'),
+              ('spectrum', 'f4', (len(accums[2]),)),
+              ('kurtosis', 'f4', (len(accums[2]),))]
+    if self.samples:
+      fields.append(('samples', 'i2', (len(samples),)))
+    self.dtype = numpy.dtype(fields)
+    with open(self.prefix+".json", "w") as header:
+      json.dump({'dtype': self.dtype.descr,
+                 'chunk_records': self.chunk_records,
+                 'inputs': self.inputs,
+                 'created': time.time()}, header)
+    self.logger.debug("_make_dtype: %d bytes per record", self.dtype.itemsize)
+
+  def _write(self):
+    """
+    Take records off the queue and append them to the files in batches
+    """
+    while self._running.is_set() or not self._queue.empty():
+      items = []
+      try:
+        items.append(self._queue.get(timeout=0.5))
+      except queue.Empty:
+        continue
+      while len(items) < self.batch:
+        try:
+          items.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+      try:
+        self._write_batch(items)
+      except Exception:
+        self.dropped += len(items)
+        self.logger.exception("_write: %d records lost", len(items))
+    if self._chunk:
+      self._chunk.close()
+
+  def _write_batch(self, items):
+    """
+    Convert queued records to one structured array and append it
+    """
+    if self.dtype is None:
+      # the samples size is taken from the first record which has samples
+      first = [item for item in items
+               if not self.samples or item[5] is not None]
+      if not first:
+        self.dropped += len(items)
+        self.logger.warning("_write_batch: no ADC samples yet; %d dropped",
+                            len(items))
+        return
+      self._make_dtype(first[0][4], first[0][5])
+    records = numpy.zeros(len(items), dtype=self.dtype)
+    for index, (now, r_index, adc, rf, accums, samples) in enumerate(items):
+      record = records[index]
+      record['time'] = now
+      record['roach'] = r_index
+      record['adc'] = adc
+      record['rf'] = rf
+      record['spectrum'] = accums[2]
+      if 4 in accums:
+        record['kurtosis'] = accums[4]
+      else:
+        record['kurtosis'] = numpy.nan
+      if self.samples and samples is not None:
+        record['samples'] = samples
+    start = 0
+    while start < len(records):
+      if self._chunk is None or self._in_chunk == self.chunk_records:
+        self._next_chunk()
+      stop = start + min(len(records)-start,
+                         self.chunk_records-self._in_chunk)
+      self._chunk.write(records[start:stop].tobytes())
+      self._in_chunk += stop - start
+      start = stop
+    self._chunk.flush()
+    self.recorded += len(records)
+
+  def _next_chunk(self):
+    if self._chunk:
+      self._chunk.close()
+    self._chunk_num += 1
+    self._in_chunk = 0
+    self._chunk = open("%s_%06d.dat" % (self.prefix, self._chunk_num), "xb")
+    self.logger.debug("_next_chunk: opened %s", self._chunk.name)
+
+def read_recording(prefix):
+  """
+  Open the chunks of a recording as read-only memmaps
+
+  @param prefix : path and root name of the recording
+  @type  prefix : str
+
+  @return: list of structured arrays, one per chunk
+  """
+  with open(prefix+".json") as header:
+    descr = json.load(header)['dtype']
+  dtype = numpy.dtype([tuple(field) for field in descr])
+  chunks = []
+  for filename in sorted(glob.glob(prefix+"_[0-9]*.dat")):
+    chunks.append(numpy.memmap(filename, dtype=dtype, mode='r'))
+  return chunks
+
+if __name__ == "__main__":
+  """
+  Record spectra from the command line
+  """
+  from optparse import OptionParser
+  from MCClient.ManagerClient import ManagerClient
+
+  p = OptionParser()
+  p.set_usage('spectra_recorder.py [options]')
+  p.set_description(__doc__)
+  p.add_option('-o', '--output',
+               dest = 'prefix',
+               type = 'str',
+               default = 'spectra',
+               help = 'Path and root name of the output files')
+  p.add_option('-d', '--duration',
+               dest = 'duration',
+               type = 'float',
+               default = 0,
+               help = 'Seconds to record; 0 records until interrupted')
+  p.add_option('-c', '--chunk',
+               dest = 'chunk',
+               type = 'int',
+               default = 4096,
+               help = 'Records per chunk file')
+  p.add_option('-q', '--queue',
+               dest = 'queue',
+               type = 'int',
+               default = 256,
+               help = 'Maximum number of records waiting to be written')
+  p.add_option('-b', '--batch',
+               dest = 'batch',
+               type = 'int',
+               default = 64,
+               help = 'Maximum number of records per write')
+  p.add_option('-s', '--samples',
+               dest = 'samples',
+               action = 'store_true',
+               default = False,
+               help = 'Also record ADC samples')
+  p.add_option('-l', '--log_level',
+               dest = 'loglevel',
+               type = 'str',
+               default = 'warning',
+               help = 'Logging level for main program and modules')
+  opts, args = p.parse_args(sys.argv[1:])
+
+  logging.basicConfig(level=getattr(logging, opts.loglevel.upper()))
+  mylogger = logging.getLogger()
+
+  recorder = SpectraRecorder(ManagerClient(), opts.prefix,
+                             chunk_records = opts.chunk,
+                             queue_size = opts.queue,
+                             batch = opts.batch,
+                             samples = opts.samples)
+  recorder.start()
+  try:
+    if opts.duration:
+      time.sleep(opts.duration)
+    else:
+      while True:
+        time.sleep(1)
+  except KeyboardInterrupt:
+    mylogger.warning("Interrupted")
+  recorder.stop()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+startup_report - where the time goes when a client module is imported
+
+Each module is imported in a fresh interpreter with 'python -X importtime'.
+Imports which the interpreter makes anyway (e.g. for site) are left out.
+The report gives the total import time and the slowest imports::
+
+  python startup_report.py MCClient.ManagerClient MCClient.monitor_store
+  python startup_report.py -n 5 -s self MCClient.GUI
+  python startup_report.py -t 50 MCClient.relay   # exit status 1 if > 50 ms
+"""
+import logging
+import re
+import subprocess
+import sys
+
+module_logger = logging.getLogger(__name__)
+
+IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)")
+
+def import_times(statement, python=sys.executable):
+  """
+  Run a statement with -X importtime and parse the timings
+
+  @param statement : Python code, e.g. 'import MCClient'
+  @type  statement : str
+
+  @param python : interpreter to use
+  @type  python : str
+
+  @return: list of (module, self us, cumulative us, depth)
+  """
+  process = subprocess.Popen([python, "-X", "importtime", "-c", statement],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+  stdout, stderr = process.communicate()
+  if process.returncode:
+    raise ImportError("'%s' failed: %s" %
+                      (statement, stderr.strip().splitlines()[-1]))
+  entries = []
+  for line in stderr.splitlines():
+    match = IMPORTTIME.match(line)
+    if match:
+      entries.append((match.group(4), int(match.group(1)),
+                      int(match.group(2)), (len(match.group(3))-1)//2))
+  return entries
+
+def module_import_times(module, python=sys.executable):
+  """
+  Timings of the imports caused by importing one module
+
+  @return: (total ms, list of (module, self us, cumulative us, depth))
+  """
+  baseline = set(entry[0] for entry in import_times("pass", python))
+  entries = [entry for entry in import_times("import "+module, python)
+             if entry[0] not in baseline]
+  parts = module.split('.')
+  chain = set('.'.join(parts[:n]) for n in range(1, len(parts)+1))
+  total = sum(entry[2] for entry in entries
+              if entry[3] == 0 and entry[0] in chain)
+  return total/1000., entries
+
+def report(module, count=15, key='cumulative', python=sys.executable):
+  """
+  Text report for one module
+
+  @param count : number of slowest imports to list
+  @type  count : int
+
+  @param key : 'cumulative' or 'self'
+  @type  key : str
+
+  @return: (total ms, list of lines)
+  """
+  total, entries = module_import_times(module, python)
+  column = 2 if key == 'cumulative' else 1
+  slowest = sorted(entries, key=lambda entry: entry[column], reverse=True)
+  lines = ["%s: %.1f ms, %d modules" % (module, total, len(entries)),
+           "  %10s %10s  %s" % ("self ms", "cumul. ms", "module")]
+  for name, self_us, cumulative_us, depth in slowest[:count]:
+    lines.append("  %10.1f %10.1f  %s" % (self_us/1000., cumulative_us/1000.,
+                                          name))
+  return total, lines
+
+if __name__ == "__main__":
+  from optparse import OptionParser
+  p = OptionParser()
+  p.set_usage('startup_report.py [options] module [module ...]')
+  p.set_description(__doc__)
+  p.add_option('-n', '--number',
+               dest = 'count',
+               type = 'int',
+               default = 15,
+               help = 'Number of slowest imports to list')
+  p.add_option('-s', '--sort',
+               dest = 'key',
+               type = 'str',
+               default = 'cumulative',
+               help = "Sort by 'cumulative' or 'self' time")
+  p.add_option('-t', '--threshold',
+               dest = 'threshold',
+               type = 'float',
+               default = None,
+               help = 'Exit with status 1 if an import takes more ms')
+  p.add_option('-p', '--python',
+               dest = 'python',
+               type = 'str',
+               default = sys.executable,
+               help = 'Python interpreter to use')
+  opts, args = p.parse_args(sys.argv[1:])
+  if not args:
+    p.error("no module given")
+
+  logging.basicConfig(level=logging.WARNING)
+  slow = False
+  for module in args:
+    try:
+      total, lines = report(module, opts.count, opts.key, opts.python)
+    except ImportError as details:
+      module_logger.error("%s", details)
+      slow = True
+      continue
+    print("\n".join(lines))
+    if opts.threshold is not None and total > opts.threshold:
+      print("  exceeds %.1f ms" % opts.threshold)
+      slow = True
+  sys.exit(1 if slow else 0)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+state_store - observable store of the values fetched from the server
+
+ManagerClient puts every value it fetches into a StateStore under a tuple
+key, e.g. ('ADC_levels', 0, 0, 1) or ('fan_rpm', 'roach1', 0).  Widgets
+subscribe to a key or to a key prefix and are called back only when a value
+changes by more than the tolerance for its prefix, so a refresh which brings
+no new values causes no repaints.
+"""
+import logging
+import numbers
+
+module_logger = logging.getLogger(__name__)
+
+class StateStore(object):
+  """
+  Flat dictionary of values with change notification
+
+  Public attributes::
+    logger     - logger for this instance
+    tolerance  - default smallest change of a number which is reported
+    tolerances - tolerance indexed by the first part of the key
+  """
+  def __init__(self, tolerance=0.0, tolerances={}):
+    """
+    @param tolerance : default smallest reported change of a number
+    @type  tolerance : float
+
+    @param tolerances : tolerances for keys starting with specific names
+    @type  tolerances : dict of float
+    """
+    self.logger = logging.getLogger(__name__+".StateStore")
+    self.tolerance = tolerance
+    self.tolerances = dict(tolerances)
+    self._values = {}
+    self._subscribers = {}  # key prefix -> list of callbacks
+
+  def get(self, key, default=None):
+    return self._values.get(key, default)
+
+  def __getitem__(self, key):
+    return self._values[key]
+
+  def __contains__(self, key):
+    return key in self._values
+
+  def changed(self, key, old, new):
+    """
+    True if the change from 'old' to 'new' should be reported
+
+    NaN (e.g. no reading yet) to or from a number is a change; NaN to NaN
+    is not.
+    """
+    if isinstance(old, numbers.Number) and isinstance(new, numbers.Number) \
+       and not isinstance(new, bool):
+      # only NaN is not equal to itself
+      if old != old or new != new:
+        return (old != old) != (new != new)
+      return abs(new - old) > self.tolerances.get(key[0], self.tolerance)
+    return old != new
+
+  def set(self, key, value):
+    """
+    Store a value and notify the subscribers if it changed
+
+    @param key : tuple key
+    @type  key : tuple
+
+    @param value : new value
+
+    @return: True if the subscribers were notified
+    """
+    if key in self._values:
+      old = self._values[key]
+      if not self.changed(key, old, value):
+        return False
+    else:
+      old = None
+    self._values[key] = value
+    for depth in range(len(key)+1):
+      for callback in self._subscribers.get(key[:depth], []):
+        try:
+          callback(key, old, value)
+        except Exception:
+          self.logger.error("set: callback for %s failed", key,
+                            exc_info=True)
+    return True
+
+  def update(self, prefix, values):
+    """
+    Store a possibly nested dict of values under a key prefix
+
+    @param prefix : first part of the keys
+    @type  prefix : tuple
+
+    @param values : values, nested dicts being flattened into the key
+    @type  values : dict
+
+    @return: number of changed values
+    """
+    count = 0
+    for key, value in flatten(prefix, values):
+      if self.set(key, value):
+        count += 1
+    return count
+
+  def subscribe(self, prefix, callback):
+    """
+    Call 'callback(key, old, new)' when a value under 'prefix' changes
+
+    @param prefix : a key or the first part of keys
+    @type  prefix : tuple
+
+    @param callback : function of key, old value and new value
+    @type  callback : callable
+    """
+    self._subscribers.setdefault(tuple(prefix), []).append(callback)
+
+  def unsubscribe(self, prefix, callback):
+    try:
+      self._subscribers[tuple(prefix)].remove(callback)
+    except (KeyError, ValueError):
+      pass
+
+def flatten(prefix, values):
+  """
+  Generator of (key, value) with nested dict keys appended to the prefix
+  """
+  if isinstance(values, dict):
+    for key, value in values.items():
+      for item in flatten(prefix+(key,), value):
+        yield item
+  else:
+    yield prefix, values
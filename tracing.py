@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+tracing - opt-in timing spans exported as Chrome trace-event JSON
+
+Tracing is turned on by naming the output file in the environment::
+  MCCLIENT_TRACE=/tmp/client_trace.json python managerClientUI.py
+and the file is written when the program exits.  Open it in Perfetto
+(ui.perfetto.dev) or chrome://tracing to see, thread by thread, how the time
+of a GUI refresh is divided between the server calls, the data handling,
+matplotlib and Qt.
+
+Spans are made with a decorator or a context manager::
+  @traced("rpc")
+  def get_accums(self, roach, adc, rf): ...
+
+  with span("plot", "gui", roach=roachname):
+    ...
+
+When tracing is off, traced() returns the function itself and span()
+returns one shared do-nothing context manager, so the cost is nothing for
+decorated functions and a function call for 'with' blocks.  Because of this,
+tracing must be enabled (by the variable or by enable()) before the traced
+modules are imported.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+module_logger = logging.getLogger(__name__)
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+MAX_EVENTS = 1000000
+
+_events = None         # deque of trace events when enabled
+_filename = None
+_pid = os.getpid()
+_thread_names = {}
+
+def enable(filename, max_events=MAX_EVENTS):
+  """
+  Start collecting spans, to be written to a file at exit
+
+  @param filename : trace-event JSON file
+  @type  filename : str
+
+  @param max_events : the oldest events are dropped after this many
+  @type  max_events : int
+  """
+  global _events, _filename
+  if _events is None:
+    atexit.register(dump)
+  _events = deque(maxlen=max_events)
+  _filename = filename
+  module_logger.info("enable: tracing to %s", filename)
+
+def enabled():
+  return _events is not None
+
+def _now():
+  return _clock()*1e6
+
+def _thread_id():
+  thread = threading.current_thread()
+  tid = thread.ident
+  if tid not in _thread_names:
+    _thread_names[tid] = thread.name
+  return tid
+
+class _Span(object):
+  """
+  Context manager which records one complete ('X') event
+  """
+  __slots__ = ('name', 'cat', 'args', 'start')
+
+  def __init__(self, name, cat, args):
+    self.name = name
+    self.cat = cat
+    self.args = args
+
+  def __enter__(self):
+    self.start = _now()
+    return self
+
+  def __exit__(self, *exc):
+    end = _now()
+    event = {'name': self.name, 'cat': self.cat, 'ph': 'X',
+             'ts': self.start, 'dur': end - self.start,
+             'pid': _pid, 'tid': _thread_id()}
+    if self.args:
+      event['args'] = self.args
+    if exc[0] is not None:
+      event.setdefault('args', {})['exception'] = exc[0].__name__
+    _events.append(event)
+    return False
+
+class _NullSpan(object):
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name, cat="client", **args):
+  """
+  Context manager timing a block of code
+
+  @param name : name shown for the span
+  @type  name : str
+
+  @param cat : category, e.g. 'rpc', 'gui', 'plot'
+  @type  cat : str
+
+  Keyword arguments are shown with the span.
+  """
+  if _events is None:
+    return _NULL_SPAN
+  return _Span(name, cat, args)
+
+def traced(cat="client", name=None):
+  """
+  Decorator which makes every call of a function a span
+
+  @param cat : category of the spans
+  @type  cat : str
+
+  @param name : span name; default is the function's qualified name
+  @type  name : str
+  """
+  def decorate(function):
+    if _events is None:
+      return function
+    span_name = name or getattr(function, '__qualname__', function.__name__)
+    def wrapper(*args, **kwargs):
+      with _Span(span_name, cat, None):
+        return function(*args, **kwargs)
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    wrapper.__wrapped__ = function
+    return wrapper
+  return decorate
+
+def instant(name, cat="client", **args):
+  """
+  Mark a moment, e.g. a timer tick or a firmware change
+  """
+  if _events is None:
+    return
+  event = {'name': name, 'cat': cat, 'ph': 'i', 's': 't', 'ts': _now(),
+           'pid': _pid, 'tid': _thread_id()}
+  if args:
+    event['args'] = args
+  _events.append(event)
+
+def dump(filename=None):
+  """
+  Write the events collected so far
+
+  @param filename : output file; default is the one given to enable()
+  @type  filename : str
+  """
+  if _events is None:
+    return
+  filename = filename or _filename
+  events = list(_events)
+  for tid, thread_name in list(_thread_names.items()):
+    events.append({'name': 'thread_name', 'ph': 'M', 'pid': _pid, 'tid': tid,
+                   'args': {'name': thread_name}})
+  with open(filename, 'w') as trace_file:
+    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+  module_logger.info("dump: %d events written to %s", len(events), filename)
+
+if os.environ.get('MCCLIENT_TRACE'):
+  enable(os.environ['MCCLIENT_TRACE'])